@@ -1 +1,7 @@
-from pyemission.pyemission import GV, Car
+from pyemission.pyemission import GV, Car, rate_tables, warm_up
+from pyemission.fleet import Fleet
+from pyemission.sensitivity import Sensitivity
+from pyemission.chunked import ChunkedGV
+from pyemission.stream import StreamEstimator
+from pyemission.trips import Trips
+from pyemission.export import Exporter
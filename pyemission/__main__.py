@@ -0,0 +1,29 @@
+import argparse
+import sys
+
+from pyemission.batch import run_batch
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m pyemission',
+                                     description='Estimate the emissions and fuel consumption of many driving cycles.')
+    parser.add_argument('manifest', help="csv file with one row per trip: excel_file_name, sheet_name and "
+                                         "optional vehicle parameters (mass, frontal_area, mu_rr, air_density, c_d, "
+                                         "well_to_tank_CO2_emission_factor)")
+    parser.add_argument('-o', '--output', help='csv file for the per-trip results (default: standard output)')
+    parser.add_argument('-p', '--processes', type=int, default=None, help='number of worker processes (default: number of CPUs)')
+    parser.add_argument('--chunksize', type=int, default=1, help='number of trips sent to a worker at once')
+    args = parser.parse_args(argv)
+
+    try:
+        results = run_batch(args.manifest, processes=args.processes, chunksize=args.chunksize)
+    except (OSError, ValueError) as e:
+        parser.error(str(e))
+    results.to_csv(args.output if args.output else sys.stdout, index=False)
+
+    # exit code 1 when some of the trips failed
+    return int(results.error.notna().any())
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,83 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+from pyemission.pyemission import GV, warm_up
+
+
+# manifest columns passed on to GV, besides excel_file_name and sheet_name
+VEHICLE_PARAMETERS = ['mass', 'frontal_area', 'mu_rr', 'air_density', 'c_d', 'well_to_tank_CO2_emission_factor']
+
+# keys of GV.summary(), the result columns of a trip besides its manifest columns and 'error'
+SUMMARY_COLUMNS = ['distance', 'average_speed', 'speed_std', 'no_of_stops_per_km', 'acc_avg', 'dec_avg', 'acc_mode',
+                   'dec_mode', 'idling_mode', 'pump_to_wheel_CO2', 'pump_to_wheel_CO', 'pump_to_wheel_NOx',
+                   'pump_to_wheel_HC', 'pump_to_wheel_CO2_per_km', 'pump_to_wheel_CO_per_km', 'pump_to_wheel_NOx_per_km',
+                   'pump_to_wheel_HC_per_km', 'fuel_burnt', 'mpg', 'well_to_pump_CO2', 'well_to_wheel_CO2',
+                   'well_to_wheel_CO2_per_km']
+
+
+def read_manifest(manifest):
+    """
+    manifest : a DataFrame, a list of dictionaries, or the path of a csv file with one row per trip.
+               Required columns are 'excel_file_name' and 'sheet_name'; the optional columns
+               'mass', 'frontal_area', 'mu_rr', 'air_density', 'c_d' and 'well_to_tank_CO2_emission_factor'
+               override the GV defaults where they are not empty. A manifest without rows is valid.
+    """
+    if isinstance(manifest, (str, os.PathLike)):
+        try:
+            manifest = pd.read_csv(manifest)
+        except pd.errors.EmptyDataError:  # not even a header
+            manifest = pd.DataFrame()
+    manifest = pd.DataFrame(manifest).reset_index(drop=True)
+
+    missing = [c for c in ['excel_file_name', 'sheet_name'] if c not in manifest.columns]
+    if missing:
+        raise ValueError('the manifest is missing the column(s): ' + ', '.join(missing))
+    return manifest
+
+
+def run_task(task):
+    """
+    Run GV for one manifest row (a dictionary) and return its summary.
+    Any error is caught and reported in the 'error' field so one bad sheet does not stop the batch.
+    """
+    params = {k: task[k] for k in VEHICLE_PARAMETERS if k in task and pd.notna(task[k])}
+    result = {'excel_file_name': task['excel_file_name'], 'sheet_name': task['sheet_name']}
+    try:
+        g = GV(task['excel_file_name'], task['sheet_name'], totals_only=True, **params)
+        result.update(g.summary())
+        result['error'] = None
+    except Exception as e:
+        result['error'] = '{}: {}'.format(type(e).__name__, e)
+    return result
+
+
+def run_batch(manifest, processes=None, chunksize=1):
+    """
+    Evaluate every trip of a manifest (see read_manifest) with a pool of worker processes and
+    return one row of GV metrics per trip, in the order of the manifest.
+
+    processes : number of worker processes, defaults to the number of CPUs. With 1, the trips
+                are run in the current process.
+    chunksize : number of trips sent to a worker at once
+    """
+    manifest = read_manifest(manifest)
+    tasks = manifest.to_dict('records')
+    if processes is None:
+        processes = os.cpu_count() or 1
+    processes = max(1, min(processes, len(tasks)))
+
+    if processes == 1:
+        results = [run_task(task) for task in tasks]
+    else:
+        # load the rate tables once here, so forked workers inherit them
+        warm_up()
+        with ProcessPoolExecutor(max_workers=processes) as executor:
+            results = list(executor.map(run_task, tasks, chunksize=chunksize))
+
+    # the same columns whichever trips failed, and with no trip at all
+    results = pd.DataFrame(results, index=manifest.index, columns=['excel_file_name', 'sheet_name'] + SUMMARY_COLUMNS + ['error'])
+    params = [c for c in VEHICLE_PARAMETERS if c in manifest.columns]
+    return pd.concat([results[['excel_file_name', 'sheet_name']], manifest[params],
+                      results.drop(columns=['excel_file_name', 'sheet_name'])], axis=1)
@@ -0,0 +1,236 @@
+"""
+Benchmarks of PyEmission, run from the command line:
+
+    python -m pyemission.benchmark import [--max-seconds 0.25] [--repeat 5]
+    python -m pyemission.benchmark pipeline [--sizes 1000 10000 ...] [--repeat 3] [--totals-only] [--compact] [--output FILE]
+    python -m pyemission.benchmark parity [--seconds 5000]
+
+Results are printed (or written) as JSON; the exit code is 1 when a check fails.
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+import tracemalloc
+
+import numpy as np
+
+
+# timed in a fresh interpreter: numpy and pandas first, then the package on its own
+IMPORT_SCRIPT = '''
+import sys, time
+t = time.perf_counter()
+import numpy, pandas
+t_deps = time.perf_counter() - t
+t = time.perf_counter()
+import pyemission
+t_package = time.perf_counter() - t
+print(t_deps, t_package, int('matplotlib' in sys.modules))
+'''
+
+
+def import_time(repeat = 5):
+    """
+    Return the median time (s) to import numpy/pandas and then pyemission in a new interpreter,
+    and whether matplotlib got imported along with the package.
+    """
+    deps, package, matplotlib_loaded = [], [], False
+    for _ in range(repeat):
+        out = subprocess.run([sys.executable, '-c', IMPORT_SCRIPT], check=True,
+                             stdout=subprocess.PIPE, universal_newlines=True).stdout.split()
+        deps.append(float(out[0]))
+        package.append(float(out[1]))
+        matplotlib_loaded = matplotlib_loaded or out[2] == '1'
+    return {'numpy_pandas_seconds'  : statistics.median(deps),
+            'pyemission_seconds'    : statistics.median(package),
+            'matplotlib_imported'   : matplotlib_loaded}
+
+
+def check_import_time(max_seconds = 0.25, repeat = 5):
+    """
+    Return the import_time results with 'passed' set to False if importing pyemission (on top of
+    numpy and pandas) takes longer than max_seconds or pulls in matplotlib.
+    """
+    result = import_time(repeat)
+    result['max_seconds'] = max_seconds
+    result['passed'] = result['pyemission_seconds'] <= max_seconds and not result['matplotlib_imported']
+    return result
+
+
+# synthetic driving cycles -------------------------
+
+# (speed in m/s, accelerations in m/s2) of the coverage prelude: at each speed, one second at every
+# acceleration followed by one second back, which puts a 1500 kg passenger car in every VSP bin
+PRELUDE = [(5.0,  [-0.3, 0.3, 0.8, 1.4, 2.0, 2.6]),
+           (16.0, [-0.4, -0.1, 0.1, 0.25, 0.45, 0.7, 1.1, 1.45, 2.0]),
+           (28.0, [-0.4, -0.2, 0.0, 0.2, 0.35, 0.6])]
+
+
+def synthetic_cycle(n_seconds, seed = 0):
+    """
+    Return a reproducible 1 Hz speed trace (m/s) of n_seconds, made of trips with idling, accelerations
+    to cruise speeds in the three op_mod speed bands (below 25 mph, 25-50 mph, above 50 mph), cruising,
+    gentle and hard decelerations and stops. It starts with a short prelude that visits every op_mod.
+    """
+    rng = np.random.default_rng(seed)
+    durations, rates = [], []
+
+    def drive(duration, rate):
+        durations.append(duration)
+        rates.append(rate)
+
+    v = 0.0
+    for speed, accelerations in PRELUDE:
+        drive(int(np.ceil(speed - v)), (speed - v)/np.ceil(speed - v))
+        v = speed
+        for a in accelerations:
+            drive(1, a)
+            drive(1, -a)
+        drive(5, 0.0)
+    drive(int(np.ceil(v/2)), -v/np.ceil(v/2))
+    v = 0.0
+
+    total = sum(durations)
+    while total < n_seconds:
+        start = len(durations)
+        drive(int(rng.integers(5, 60)), 0.0)  # idling
+
+        for _ in range(int(rng.integers(1, 4))):
+            # accelerate (or slow down) to a cruise speed
+            target = rng.choice([rng.uniform(3, 11), rng.uniform(12.5, 22), rng.uniform(23.5, 34)])
+            a = rng.choice([rng.uniform(0.2, 0.8), rng.uniform(0.8, 2.5)])
+            if target < v:
+                a = -rng.choice([rng.uniform(0.1, 0.4), rng.uniform(0.4, 2.0)])
+            duration = max(1, int(np.ceil((target - v)/a)))
+            drive(duration, (target - v)/duration)
+            v = target
+
+            # cruise with small speed changes
+            for _ in range(int(rng.integers(1, 5))):
+                duration = int(rng.integers(3, 40))
+                a = max(rng.normal(0, 0.05), -v/duration)
+                drive(duration, a)
+                v += a*duration
+
+        # stop, gently or braking hard
+        a = rng.choice([rng.uniform(0.3, 0.9), rng.uniform(0.9, 3.0)])
+        duration = max(1, int(np.ceil(v/a)))
+        drive(duration, -v/duration)
+        v = 0.0
+        total += sum(durations[start:])
+
+    acc = np.repeat(rates, durations)[:n_seconds]
+    speed = np.zeros(n_seconds)
+    np.cumsum(acc[1:], out=speed[1:])
+    return np.clip(speed, 0, None, out=speed)
+
+
+# pipeline benchmark -------------------------
+
+def benchmark_pipeline(n_seconds, repeat = 3, totals_only = False, seed = 0, compact = False):
+    """
+    Run GV on a synthetic cycle of n_seconds and return the stage times of the fastest of repeat runs,
+    the throughput in samples per second, the peak memory traced during one run and the size of the df.
+    """
+    from pyemission.pyemission import GV, warm_up
+
+    warm_up()
+    speed = synthetic_cycle(n_seconds, seed)
+
+    best = None
+    for _ in range(repeat):
+        g = GV.from_arrays(speed, totals_only=totals_only, compact=compact)
+        g.summary()
+        if best is None or g.profile.total() < best.profile.total():
+            best = g
+
+    tracemalloc.start()
+    GV.from_arrays(speed, totals_only=totals_only, compact=compact).summary()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    total = best.profile.total()
+    return {'n_seconds'             : int(n_seconds),
+            'totals_only'           : totals_only,
+            'compact'               : compact,
+            'stages'                : best.profile.to_dict(),
+            'total_seconds'         : total,
+            'samples_per_second'    : n_seconds/total if total > 0 else float('inf'),
+            'peak_memory_mb'        : peak/2**20,
+            'df_memory_mb'          : best.df.memory_usage(deep=True).sum()/2**20,
+            'op_mod_codes_covered'  : int(np.count_nonzero(best.op_mod_counts))}
+
+
+# parity of the vectorized pipeline with the row-by-row reference -------------------------
+
+def check_parity(n_seconds = 5000, seed = 0):
+    """
+    Run GV on a synthetic cycle and compare it with the row-by-row reference functions:
+    Util.reference_kinematics, the scalar Util.vsp_to_op_mod and Util.op_mod_to_emission_rate.
+    """
+    from pyemission.pyemission import GV, Util
+
+    g = GV.from_arrays(synthetic_cycle(n_seconds, seed))
+    df = g.df
+    acc, p_tract = Util.reference_kinematics(df, g.m, g.frontal_area, g.mu_rr, g.air_density, g.c_d)
+
+    acc_t = df.acc.tolist()
+    vsp = [Util.calculate_vsp(v, a, g.M, g.A, g.B, g.C, g.f) for v, a in zip(df.speed.tolist(), acc_t)]
+    op_mod = [Util.vsp_to_op_mod(vsp[i], v, acc_t[i],
+                                 acc_t[i - 1] if i >= 1 else 0,
+                                 acc_t[i - 2] if i >= 2 else 0) for i, v in enumerate(df.speed.tolist())]
+    CO2 = [Util.op_mod_to_emission_rate(g.df_emission_rate, m, 'CO2') for m in op_mod]
+
+    result = {'n_seconds'       : n_seconds,
+              'acceleration'    : bool(np.array_equal(acc, df.acc.to_numpy())),
+              'tractive_power'  : bool(np.allclose(p_tract, df.p_tract.to_numpy(), rtol=1e-12, atol=1e-9)),
+              'vsp'             : bool(np.allclose(vsp, df.vsp.to_numpy(), rtol=1e-12, atol=1e-12)),
+              'op_mod'          : bool(np.array_equal(op_mod, df.op_mod.to_numpy())),
+              'emission'        : bool(np.array_equal(CO2, df.CO2.to_numpy()))}
+    result['passed'] = all(v for k, v in result.items() if k != 'n_seconds')
+    return result
+
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(prog='python -m pyemission.benchmark', description='PyEmission benchmarks')
+    commands = parser.add_subparsers(dest='command')
+    command = commands.add_parser('import', help='time `import pyemission` and fail if it regresses')
+    command.add_argument('--max-seconds', type=float, default=0.25,
+                         help='largest accepted import time of the package on top of numpy and pandas')
+    command.add_argument('--repeat', type=int, default=5)
+
+    command = commands.add_parser('pipeline', help='time the GV stages on synthetic cycles')
+    command.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000, 1000000],
+                         help='cycle lengths in seconds (up to 10 million)')
+    command.add_argument('--repeat', type=int, default=3)
+    command.add_argument('--totals-only', action='store_true', help='benchmark GV(totals_only=True)')
+    command.add_argument('--compact', action='store_true', help='benchmark GV(compact=True)')
+    command.add_argument('--seed', type=int, default=0)
+    command.add_argument('--output', help='write the JSON results to this file')
+
+    command = commands.add_parser('parity', help='compare the vectorized pipeline with the row-by-row reference')
+    command.add_argument('--seconds', type=int, default=5000)
+    args = parser.parse_args(argv)
+
+    if args.command == 'import':
+        result = check_import_time(args.max_seconds, args.repeat)
+    elif args.command == 'pipeline':
+        result = [benchmark_pipeline(n, args.repeat, args.totals_only, args.seed, args.compact) for n in args.sizes]
+    elif args.command == 'parity':
+        result = check_parity(args.seconds)
+    else:
+        parser.print_help()
+        return 2
+
+    text = json.dumps(result, indent=1)
+    if getattr(args, 'output', None):
+        with open(args.output, 'w') as file:
+            file.write(text)
+    else:
+        print(text)
+    return 0 if not isinstance(result, dict) or result['passed'] else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
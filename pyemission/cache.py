@@ -0,0 +1,153 @@
+import hashlib
+import json
+import os
+import struct
+import time
+import zipfile
+from pathlib import Path
+
+import numpy as np
+
+from pyemission.pyemission import Util
+
+
+# on-disk cache of computed results, shared by the processes using the same directory
+class ResultCache:
+
+    def __init__(self, directory, max_bytes = 2**30):
+        """
+        directory : folder of the cache, created if needed. Every entry is one uncompressed .npz file
+                    named after its key.
+        max_bytes : size cap of the folder; the least recently used entries are removed beyond it
+
+        Entries are written to a temporary file and renamed into place, so a reader never sees a partial
+        entry and processes can share the folder without locks. A hit refreshes the time of the entry.
+        """
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def wrap(cache):
+        """
+        Return cache as a ResultCache: None stays None, a path becomes the cache of that folder.
+        """
+        if cache is None or isinstance(cache, ResultCache):
+            return cache
+        return ResultCache(cache)
+
+    @staticmethod
+    def key(speed, inputs):
+        """
+        Return the key of a run: a hash of the speed trace (float64) and of a dictionary of the other inputs
+        (parameters, units, vehicle type, rate table version...), which must be JSON serializable.
+        """
+        digest = hashlib.sha256()
+        digest.update(np.ascontiguousarray(speed, dtype=np.float64).tobytes())
+        digest.update(json.dumps(inputs, sort_keys=True, default=str).encode())
+        return digest.hexdigest()
+
+    def path(self, key):
+        return self.directory / (key + '.npz')
+
+
+    def get(self, key, mmap_mode = None):
+        """
+        Return the arrays stored under key, as a dictionary, or None.
+
+        mmap_mode : None, or 'r' or 'c' (copy-on-write) to memory map the arrays of one or more dimensions from
+                    the entry, as np.load does for a .npy file: their pages are only read from disk when used,
+                    so a hit does not pay for the arrays it never touches. A mapped entry stays readable if it
+                    is evicted or replaced meanwhile (on POSIX).
+        """
+        path = self.path(key)
+        try:
+            arrays = _load(path, mmap_mode)
+        except (OSError, ValueError, zipfile.BadZipFile):
+            # missing, evicted by another process, or unreadable
+            self.misses += 1
+            return None
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        self.hits += 1
+        return arrays
+
+    def put(self, key, arrays):
+        """
+        Store a dictionary of arrays under key, then evict old entries beyond max_bytes
+        """
+        Util.write_atomic(self.path(key), lambda file: np.savez(file, **arrays))
+        self.evict()
+
+    def evict(self, max_bytes = None):
+        """
+        Remove the least recently used entries until the folder is at most max_bytes (default: self.max_bytes),
+        and the temporary files left over by writers that died more than an hour ago
+        """
+        max_bytes = self.max_bytes if max_bytes is None else max_bytes
+        entries = []
+        now = time.time()
+        for path in self.directory.iterdir():
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            if path.suffix == '.tmp':
+                if now - stat.st_mtime > 3600:
+                    self._remove(path)
+            elif path.suffix == '.npz':
+                entries.append((stat.st_mtime, stat.st_size, path))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= max_bytes:
+                break
+            self._remove(path)
+            total -= size
+
+    def clear(self):
+        self.evict(0)
+
+    def size(self):
+        """
+        Return the number of entries and their total size in bytes
+        """
+        sizes = [path.stat().st_size for path in self.directory.glob('*.npz')]
+        return len(sizes), sum(sizes)
+
+    @staticmethod
+    def _remove(path):
+        try:
+            path.unlink()
+        except OSError:  # already removed by another process, or still open on Windows
+            pass
+
+
+# the arrays of an .npz file, the uncompressed ones of one or more dimensions memory mapped with mmap_mode
+def _load(path, mmap_mode):
+    with np.load(path, allow_pickle=False) as data:
+        if mmap_mode is None:
+            return {name: data[name] for name in data.files}
+
+        arrays = {}
+        with zipfile.ZipFile(str(path)) as archive, open(path, 'rb') as file:
+            for info in archive.infolist():
+                name = info.filename[:-len('.npy')]
+                if info.compress_type == zipfile.ZIP_STORED:
+                    # the member data follows its local header (30 bytes, the name and the extra field)
+                    file.seek(info.header_offset + 26)
+                    name_length, extra_length = struct.unpack('<HH', file.read(4))
+                    file.seek(info.header_offset + 30 + name_length + extra_length)
+                    version = np.lib.format.read_magic(file)
+                    read_header = np.lib.format.read_array_header_1_0 if version == (1, 0) else np.lib.format.read_array_header_2_0
+                    shape, fortran_order, dtype = read_header(file)
+                    if shape and not dtype.hasobject:
+                        arrays[name] = np.memmap(file, dtype=dtype, mode=mmap_mode, offset=file.tell(), shape=shape,
+                                                 order='F' if fortran_order else 'C')
+                        continue
+                arrays[name] = data[name]
+        return arrays
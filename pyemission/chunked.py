@@ -0,0 +1,374 @@
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from pyemission.progress import Profile, Progress
+from pyemission.pyemission import Util, rate_tables
+
+
+# GV pipeline over a speed trace read from disk in fixed-size chunks
+class ChunkedGV:
+
+    def __init__(self,
+                 source,
+                 mass = 1500,
+                 frontal_area = 2.27,
+                 mu_rr = 0.0127,
+                 air_density = 1.18,
+                 c_d = 0.28,
+                 well_to_tank_CO2_emission_factor = 16.79,
+                 vehicle_type = None,
+                 speed_unit = None,
+                 chunk_size = 2**20,
+                 progress = None,
+                 model_year_group = None,
+                 fuel = None,
+                 ambient = None
+                 ):
+
+        """
+        Runs the GV pipeline on cycles too long to be held in memory. Only one chunk of the speed trace
+        is read at a time; the previous speed and the two previous accelerations are carried from one
+        chunk to the next, so every second gets the same op_mod as in a run on the whole cycle.
+
+        source                           : a .npy file (memory mapped; a plain speed array or a structured array
+                                           with a 'speed' field), a .parquet or .feather/.arrow file with a 'speed'
+                                           column (read batch by batch, needs pyarrow), or an array (e.g. a np.memmap)
+        vehicle_type                     (string)  : defaults to the 'vehicle_type' column of a parquet/feather file,
+                                                     'Passenger car' otherwise
+        speed_unit                       (string)  : defaults to the 'speed_unit' column of a parquet/feather file,
+                                                     'meter per second' otherwise
+        chunk_size                       (integer) : number of seconds processed at once, which bounds the memory used
+        progress                                   : function called as progress('chunks', fraction), throttled in time
+        model_year_group,
+        fuel, ambient                    (string)  : select the emission rate table among those of the vehicle type in a rate store
+                                                     (see RateTables.get); the defaults of the store when None
+
+        The other vehicle parameters are the same as for GV.
+        """
+
+        self.source = source
+        self.mass = mass
+        self.frontal_area = frontal_area
+        self.mu_rr = mu_rr
+        self.air_density = air_density
+        self.c_d = c_d
+        self.well_to_tank_CO2_emission_factor = well_to_tank_CO2_emission_factor
+        self.chunk_size = int(chunk_size)
+        self.progress = Progress.wrap(progress)
+        self.profile = Profile()
+
+        self.t, metadata = self._inspect()
+        self.vehicle_type = vehicle_type or metadata.get('vehicle_type') or 'Passenger car'
+        self.speed_unit = speed_unit or metadata.get('speed_unit') or 'meter per second'
+        Util.check_speed_units([self.speed_unit])
+
+        self.model_year_group = model_year_group
+        self.fuel = fuel
+        self.ambient = ambient
+        table = rate_tables.get(self.vehicle_type, model_year_group, fuel, ambient)
+        self.pollutants, self.emission_rate = table.pollutants, table.emission_rate
+        self.A, self.B, self.C, self.f = table.vsp_coeff
+        self.M = mass/1000  # unit: ton
+        self._summary = None
+
+
+    # number of seconds of the source and the metadata columns found in it
+    def _inspect(self):
+        source = self.source
+        if not isinstance(source, (str, Path)):
+            return len(source), {}
+
+        extension = Path(source).suffix.lower()
+        if extension == '.npy':
+            return len(np.load(source, mmap_mode='r')), {}
+        if extension in ('.parquet', '.pq'):
+            import pyarrow.parquet as pq
+            file = pq.ParquetFile(source)
+            columns = [c for c in Util.metadata_columns if c in file.schema_arrow.names]
+            metadata = {}
+            if columns and file.metadata.num_rows:
+                first = file.read_row_group(0, columns=columns).slice(0, 1).to_pydict()
+                metadata = {c: first[c][0] for c in columns}
+            return file.metadata.num_rows, metadata
+        if extension in ('.feather', '.arrow'):
+            import pyarrow.dataset as ds
+            import pyarrow.fs as fs
+            # memory mapped, the row count comes from the batch headers without reading or
+            # decompressing the data, and only the first row of the metadata columns is read
+            dataset = ds.dataset(str(source), format='ipc', filesystem=fs.LocalFileSystem(use_mmap=True))
+            columns = [c for c in Util.metadata_columns if c in dataset.schema.names]
+            n = dataset.count_rows()
+            metadata = {}
+            if columns and n:
+                first = dataset.head(1, columns=columns).to_pydict()
+                metadata = {c: first[c][0] for c in columns}
+            return n, metadata
+        raise ValueError('Unsupported source {!r} for chunked processing: use a .npy, .parquet or .feather file, '
+                         'or an array'.format(extension))
+
+    # raw speed values of the source, in pieces of any length
+    def _pieces(self):
+        source = self.source
+        extension = Path(source).suffix.lower() if isinstance(source, (str, Path)) else None
+
+        if extension is None or extension == '.npy':
+            data = source if extension is None else np.load(source, mmap_mode='r')
+            if data.dtype.names is not None:
+                data = data['speed']
+            for start in range(0, len(data), self.chunk_size):
+                yield data[start:start + self.chunk_size]
+
+        elif extension in ('.parquet', '.pq'):
+            import pyarrow.parquet as pq
+            for batch in pq.ParquetFile(source).iter_batches(batch_size=self.chunk_size, columns=['speed']):
+                yield batch.column(0).to_numpy(zero_copy_only=False)
+
+        else:
+            import pyarrow as pa
+            with pa.memory_map(str(source)) as file:
+                reader = pa.ipc.open_file(file)
+                for i in range(reader.num_record_batches):
+                    yield reader.get_batch(i).column('speed').to_numpy(zero_copy_only=False)
+
+    def chunks(self):
+        """
+        Yield the speed trace in meter per second, in float64 chunks of chunk_size seconds
+        (the last one can be shorter)
+        """
+        conversion_factor = Util.speed_conversion_factor[self.speed_unit]
+        buffer, size = [], 0
+        for piece in self._pieces():
+            while len(piece):
+                take = min(len(piece), self.chunk_size - size)
+                buffer.append(piece[:take])
+                size += take
+                piece = piece[take:]
+                if size == self.chunk_size:
+                    yield np.concatenate(buffer).astype(float)*conversion_factor
+                    buffer, size = [], 0
+        if size:
+            yield np.concatenate(buffer).astype(float)*conversion_factor
+
+
+    def run(self, output = None, columns = None, dtype = np.float64):
+        """
+        Process the cycle chunk by chunk and return the summary (the same dictionary as GV.summary()).
+        The op_mod histogram and the pollutant totals are kept in self.op_mod_counts and self.emission_totals.
+
+        output  : optional .npy, .parquet or .csv file where the per-second results are written one chunk
+                  at a time (time, speed and the columns below, op_mod as int8)
+        columns : per-second columns to write, among 'acc', 'p_tract', 'vsp', 'op_mod' and the pollutants
+                  (default: all)
+        dtype   : float type of the written columns
+        """
+        result_columns = ['acc', 'p_tract', 'vsp', 'op_mod'] + self.pollutants
+        columns = result_columns if columns is None else list(columns)
+        unknown = [c for c in columns if c not in result_columns]
+        if unknown:
+            raise ValueError('Unknown result column(s) {}. Use some of: {}'.format(
+                ', '.join(map(repr, unknown)), ', '.join(result_columns)))
+        writer = _ChunkWriter.open(output, self.t, ['time', 'speed'] + columns, dtype) if output is not None else None
+
+        stats = _CycleStatistics()
+        self.op_mod_counts = np.zeros(len(self.emission_rate), dtype=np.int64)
+        distance = 0.
+        previous = (None, 0., 0.)  # speed and the last two accelerations at the end of the previous chunk
+        start = 0
+        try:
+            for speed in self.chunks():
+                with self.profile.stage('kinematics'):
+                    acc = Util.calculate_acceleration(speed)
+                    if previous[0] is not None:
+                        acc[0] = speed[0] - previous[0]
+                    acc_t_2 = Util.lag(acc, 2)
+                    acc_t_2[0] = previous[2]
+                    if len(acc) > 1:
+                        acc_t_2[1] = previous[1]
+                    previous = (speed[-1], acc[-1], acc[-2] if len(acc) > 1 else previous[1])
+
+                with self.profile.stage('vsp_op_mod'):
+                    vsp = Util.calculate_vsp(speed, acc, self.M, self.A, self.B, self.C, self.f)
+                    op_mod = Util.vsp_to_op_mod_array(vsp, speed, acc, acc_t_2)
+
+                with self.profile.stage('totals'):
+                    self.op_mod_counts += Util.op_mod_histogram(op_mod, len(self.emission_rate))
+                    distance += speed.sum()
+                    stats.update(speed, acc)
+
+                if writer is not None:
+                    with self.profile.stage('write'):
+                        values = {'time': np.arange(start, start + len(speed)), 'speed': speed, 'acc': acc,
+                                  'vsp': vsp, 'op_mod': op_mod.astype(np.int8)}
+                        if 'p_tract' in columns:
+                            values['p_tract'] = Util.calculate_tractive_power(speed, acc, self.mass, self.frontal_area,
+                                                                              self.mu_rr, self.air_density, self.c_d)
+                        selected = [i for i, pollutant in enumerate(self.pollutants) if pollutant in columns]
+                        emission = self.emission_rate[:, selected][op_mod]
+                        for j, i in enumerate(selected):
+                            values[self.pollutants[i]] = emission[:, j]
+                        writer.write(start, values)
+
+                start += len(speed)
+                if self.progress is not None:
+                    self.progress('chunks', start/max(self.t, 1))
+        finally:
+            if writer is not None:
+                writer.close()
+
+        self.t = start
+        self.d = distance/1000
+        self.emission_totals = dict(zip(self.pollutants, Util.emission_totals(self.op_mod_counts, self.emission_rate)))
+        self._summary = self._compute_summary(stats)
+        return self._summary
+
+    def summary(self):
+        """
+        Return the summary of the cycle, running it first if needed
+        """
+        if self._summary is None:
+            self.run()
+        return self._summary
+
+    def _compute_summary(self, stats):
+        summary = Util.cycle_metrics(stats.statistics(), self.d, self.t)
+        summary.update(Util.emission_metrics(self.emission_totals['CO2'],
+                                             self.emission_totals['CO'],
+                                             self.emission_totals['NOx'],
+                                             self.emission_totals['HC'],
+                                             self.d,
+                                             self.well_to_tank_CO2_emission_factor))
+        return summary
+
+
+# driving cycle statistics of Util.cycle_statistics, accumulated over consecutive chunks
+class _CycleStatistics:
+
+    def __init__(self):
+        self.no_of_stops = 0
+        self.idle_time = 0
+        self.acc_time = 0
+        self.dec_time = 0
+        self.acc_sum = 0.
+        self.dec_sum = 0.
+        self.count = 0
+        self.mean = 0.      # mean speed (kmph)
+        self.m2 = 0.        # sum of squared deviations from the mean
+        self.event = 0      # last speed threshold crossing: +1 high, -1 low, 0 none yet
+
+    def update(self, speed, acc):
+        # stops: a low (< 10 fps) directly following a high (>= 15 fps), see Util.segment_cycle_statistics
+        speed_fps = speed*3.28084
+        event = np.where(speed_fps >= 15, 1, 0) - np.where(speed_fps < 10, 1, 0)
+        event = np.concatenate([[self.event], event[event != 0]])
+        self.no_of_stops += int(np.count_nonzero((event[1:] == -1) & (event[:-1] == 1)))
+        self.event = int(event[-1])
+
+        self.idle_time += int(np.count_nonzero(speed <= 0.1))
+        acc_pos = acc > 0
+        acc_neg = acc < 0
+        self.acc_time += int(np.count_nonzero(acc_pos))
+        self.dec_time += int(np.count_nonzero(acc_neg))
+        self.acc_sum += acc[acc_pos].sum()
+        self.dec_sum += acc[acc_neg].sum()
+
+        # speed variance, merging the two-pass moments of the chunk with the running ones
+        speed_kmph = speed*3.6
+        n = speed_kmph.size
+        mean = speed_kmph.mean()
+        m2 = np.square(speed_kmph - mean).sum()
+        total = self.count + n
+        delta = mean - self.mean
+        self.m2 += m2 + delta*delta*self.count*n/total
+        self.mean += delta*n/total
+        self.count = total
+
+    def speed_std(self):
+        return np.sqrt(self.m2/(self.count - 1)) if self.count > 1 else np.nan
+
+    # the statistics in the form of Util.segment_cycle_statistics, for Util.cycle_metrics
+    def statistics(self):
+        return {
+            'no_of_stops'   : self.no_of_stops,
+            'idle_time'     : self.idle_time,
+            'acc_time'      : self.acc_time,
+            'dec_time'      : self.dec_time,
+            'acc_avg'       : self.acc_sum/self.acc_time if self.acc_time else np.nan,
+            'dec_avg'       : self.dec_sum/self.dec_time if self.dec_time else np.nan,
+            'speed_std'     : self.speed_std(),
+            }
+
+
+# per-second results written to a .npy, .parquet or .csv file one chunk at a time
+class _ChunkWriter:
+
+    def __init__(self, path, columns, dtypes):
+        self.path = path
+        self.columns = columns
+        self.dtypes = dtypes
+
+    @staticmethod
+    def open(path, n, columns, dtype):
+        dtypes = {c: np.int64 if c == 'time' else np.int8 if c == 'op_mod' else np.float64 if c == 'speed' else dtype
+                  for c in columns}
+        extension = Path(path).suffix.lower()
+        if extension == '.npy':
+            return _NpyWriter(path, n, columns, dtypes)
+        if extension in ('.parquet', '.pq'):
+            return _ParquetWriter(path, columns, dtypes)
+        if extension == '.csv':
+            return _CsvWriter(path, columns, dtypes)
+        raise ValueError('Unsupported output file type {!r}: use .npy, .parquet or .csv'.format(extension))
+
+    def close(self):
+        pass
+
+
+class _NpyWriter(_ChunkWriter):
+
+    def __init__(self, path, n, columns, dtypes):
+        super().__init__(path, columns, dtypes)
+        self.array = np.lib.format.open_memmap(path, mode='w+', dtype=[(c, dtypes[c]) for c in columns], shape=(n,))
+
+    def write(self, start, values):
+        rows = self.array[start:start + len(values['time'])]
+        for c in self.columns:
+            rows[c] = values[c]
+
+    def close(self):
+        self.array.flush()
+        del self.array
+
+
+class _ParquetWriter(_ChunkWriter):
+
+    def __init__(self, path, columns, dtypes):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        super().__init__(path, columns, dtypes)
+        self.pa = pa
+        self.schema = pa.schema([(c, pa.from_numpy_dtype(np.dtype(dtypes[c]))) for c in columns])
+        self.writer = pq.ParquetWriter(path, self.schema)
+
+    def write(self, start, values):
+        arrays = [self.pa.array(np.asarray(values[c], dtype=self.dtypes[c])) for c in self.columns]
+        self.writer.write_table(self.pa.Table.from_arrays(arrays, schema=self.schema))
+
+    def close(self):
+        self.writer.close()
+
+
+class _CsvWriter(_ChunkWriter):
+
+    def __init__(self, path, columns, dtypes):
+        super().__init__(path, columns, dtypes)
+        self.file = open(path, 'w', newline='')
+        self.file.write(','.join(columns) + '\n')
+
+    def write(self, start, values):
+        pd.DataFrame({c: np.asarray(values[c], dtype=self.dtypes[c]) for c in self.columns}).to_csv(
+            self.file, header=False, index=False)
+
+    def close(self):
+        self.file.close()
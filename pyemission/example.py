@@ -1,7 +1,7 @@
 from pyemission import GV
    
 # Create a Gasoline vehicle and read data
-g = GV("Data.xlsx", "Driving cycle", mass=1600)
+g = GV("Data.xlsx", "Driving cycle", mass=1600, verbose=True)
 
 print('\n\nGeneral statistics of the driving cycle\n-------------------------------------------------')
 print(f'Distance traveled                       : {g.distance()} km')
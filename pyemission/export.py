@@ -0,0 +1,152 @@
+import re
+import uuid
+from pathlib import Path
+
+import numpy as np
+
+from pyemission.pyemission import Util
+
+
+# input and computed per-second columns written for every trip, when the df has them
+PER_SECOND_COLUMNS = ['time', 'speed', 'acc', 'p_tract', 'vsp', 'op_mod']
+
+
+# columnar dataset of many trips: per-second arrays and trip summaries in full precision
+class Exporter:
+
+    def __init__(self, directory, format = 'parquet', partition_by = ('vehicle_type',), compression = None):
+        """
+        directory    : root folder of the dataset, created if needed. It can be appended to by
+                       several exporters, one after the other or at the same time.
+        format       : 'parquet' (needs pyarrow) or 'npz'
+        partition_by : keys whose values split the dataset into key=value sub-folders
+        compression  : parquet compression codec (default: the pyarrow default); ignored for npz
+
+        Layout:
+            directory/per_second/<key>=<value>/.../<trip_id>.<format>   one file per trip
+            directory/summary/<key>=<value>/.../<random>.<format>       the summaries of the trips written
+                                                                        by one exporter, on close()
+
+        The parquet files can be read as one dataset with the partition keys as columns, e.g. with
+        pyarrow.dataset.dataset(directory + '/summary', partitioning='hive'), and column subsets are read
+        alone. np.load of an .npz file also only reads the arrays that are accessed.
+        """
+        if format not in ('parquet', 'npz'):
+            raise ValueError("Unknown format {!r}. Use 'parquet' or 'npz'".format(format))
+        self.directory = Path(directory)
+        self.format = format
+        self.partition_by = [partition_by] if isinstance(partition_by, str) else list(partition_by)
+        self.compression = compression
+        self._summaries = {}  # partition folder -> list of summary rows
+
+
+    def write(self, car, trip_id, **keys):
+        """
+        Write the per-second arrays of a Car or GV and keep its summary for close().
+
+        trip_id : identifier of the trip, unique in the dataset. It names the file and is stored, as a
+                  string, in a trip_id column of the per-second file and of the summaries.
+        keys    : other values stored with the per-second arrays and the summary, e.g. vehicle_id. The
+                  partition keys are taken from here, or else from the metadata of the car (vehicle_type...).
+                  Give a key the same type in every trip (integer, float or string), so that the
+                  files of the dataset share one schema.
+
+        Returns the path of the per-second file.
+        """
+        values = dict(car.metadata)
+        values.update(keys)
+        missing = [k for k in self.partition_by if k not in values]
+        if missing:
+            raise ValueError('no value for the partition key(s): ' + ', '.join(missing))
+        partition = Path(*['{}={}'.format(k, _clean(values[k])) for k in self.partition_by])
+
+        # trip_id and the other keys as constant columns, to tell the trips apart and join them to the
+        # summaries, then the columns of the df without copies (float32/int8 columns of a compact run stay so)
+        other_keys = {k: v for k, v in keys.items() if k not in self.partition_by}
+        n = len(car.df)
+        arrays = {'trip_id': np.full(n, str(trip_id))}
+        arrays.update({k: np.full(n, _column([v])[0]) for k, v in other_keys.items()})
+        columns = [c for c in PER_SECOND_COLUMNS + list(getattr(car, 'pollutants', [])) if c in car.df.columns]
+        arrays.update({c: car.df[c].to_numpy() for c in columns})
+        path = self.directory / 'per_second' / partition / '{}.{}'.format(_clean(trip_id), self.format)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._write(path, arrays)
+
+        summary = {'trip_id': str(trip_id)}
+        summary.update(other_keys)
+        summary['travel_time'] = car.t
+        summary.update(car.full_summary())
+        self._summaries.setdefault(partition, []).append(summary)
+        return path
+
+    def close(self):
+        """
+        Write the summaries of the trips written since the last close(), one file per partition
+        """
+        for partition, rows in self._summaries.items():
+            names = list(dict.fromkeys(name for row in rows for name in row))
+            arrays = {name: _column([row.get(name) for row in rows]) for name in names}
+            path = self.directory / 'summary' / partition / '{}.{}'.format(uuid.uuid4().hex, self.format)
+            path.parent.mkdir(parents=True, exist_ok=True)
+            self._write(path, arrays)
+        self._summaries = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+    # write the arrays with Util.write_atomic, so readers never see a partial file
+    def _write(self, path, arrays):
+        if self.format == 'parquet':
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+            table = pa.Table.from_arrays([pa.array(a) for a in arrays.values()], names=list(arrays))
+            kwargs = {} if self.compression is None else {'compression': self.compression}
+            Util.write_atomic(path, lambda file: pq.write_table(table, file, **kwargs))
+        else:
+            Util.write_atomic(path, lambda file: np.savez(file, **arrays))
+
+
+# value usable in a file or folder name (spaces are kept, so 'Passenger car' reads back unchanged)
+def _clean(value):
+    return re.sub(r'[\\/:*?"<>|=]+', '_', str(value))
+
+
+# one column of the summary rows as an array: integers as int64, other numbers as float64 (missing as
+# NaN), anything else as str
+def _column(values):
+    if all(isinstance(v, (int, np.integer)) and not isinstance(v, (bool, np.bool_)) for v in values):
+        return np.array(values, dtype=np.int64)
+    if all(v is None or isinstance(v, (int, float, np.integer, np.floating)) for v in values):
+        return np.array([np.nan if v is None else v for v in values], dtype=float)
+    return np.array(['' if v is None else str(v) for v in values])
+
+
+def read_summaries(directory, columns = None):
+    """
+    Return the summaries of every trip of a dataset written by Exporter, with the partition keys as
+    columns. columns limits the columns read.
+    """
+    import pandas as pd
+
+    frames = []
+    for path in sorted(Path(directory, 'summary').rglob('*')):
+        if path.suffix not in ('.parquet', '.npz'):
+            continue
+        if path.suffix == '.parquet':
+            import pyarrow.parquet as pq
+            file = pq.ParquetFile(str(path))
+            names = [name for name in file.schema_arrow.names if columns is None or name in columns]
+            frame = file.read(columns=names).to_pandas()
+        else:
+            with np.load(path, allow_pickle=False) as data:
+                frame = pd.DataFrame({name: data[name] for name in data.files if columns is None or name in columns})
+        for part in path.parent.relative_to(Path(directory, 'summary')).parts:
+            key, _, value = part.partition('=')
+            if columns is None or key in columns:
+                frame[key] = value
+        frames.append(frame)
+    return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
@@ -0,0 +1,154 @@
+import numpy as np
+import pandas as pd
+
+from pyemission.pyemission import Util, rate_tables
+
+
+# many vehicle configurations evaluated against one driving cycle
+class Fleet:
+
+    def __init__(self,
+                 speed,
+                 mass = 1500,
+                 frontal_area = 2.27,
+                 mu_rr = 0.0127,
+                 air_density = 1.18,
+                 c_d = 0.28,
+                 vehicle_type = 'Passenger car',
+                 well_to_tank_CO2_emission_factor = 16.79,
+                 chunk_size = 2**22,
+                 model_year_group = None,
+                 fuel = None,
+                 ambient = None
+                 ):
+
+        """
+        speed                            (array)   : second-by-second speed of the driving cycle in meter per second
+
+        The vehicle parameters are the same as for GV. Each one is either a single value shared by all
+        configurations or an array with one value per configuration; they are broadcast together.
+
+        mass                             (numeric) : vehicle mass with cargo in kg
+        frontal_area                     (numeric) : vehicle frontal area in square meter
+        mu_rr                            (numeric) : rolling resistance coefficient between tire and road surface
+        air_density                      (numeric) : ambient air density in kg/m3
+        c_d                              (numeric) : aerodynamic drag coefficient
+        vehicle_type                     (string)  : 'Passenger car', 'SUV', 'Passenger truck' or 'Light commercial truck'
+        well_to_tank_CO2_emission_factor (numeric) : typical value is 16.79 gm/MJ
+        chunk_size                       (integer) : maximum number of (configuration, second) values held in memory
+                                                     at once by totals() and op_mod_counts()
+        model_year_group,
+        fuel, ambient                    (string)  : select the emission rate table among those of the vehicle type in a rate store,
+                                                     shared by every configuration (see RateTables.get); the defaults of the store when None
+        """
+
+        # kinematics shared by every configuration
+        self.speed = np.asarray(speed, dtype=float)
+        self.acc = Util.calculate_acceleration(self.speed)
+        self.acc_t_2 = Util.lag(self.acc, 2)
+        self.t = self.speed.size
+        self.d = self.speed.sum()/1000
+        self.chunk_size = chunk_size
+
+        params = np.broadcast_arrays(*[np.atleast_1d(p) for p in (mass, frontal_area, mu_rr, air_density, c_d,
+                                                                 vehicle_type, well_to_tank_CO2_emission_factor)])
+        self.configs = pd.DataFrame({
+            'mass'                              : params[0].ravel().astype(float),
+            'frontal_area'                      : params[1].ravel().astype(float),
+            'mu_rr'                             : params[2].ravel().astype(float),
+            'air_density'                       : params[3].ravel().astype(float),
+            'c_d'                               : params[4].ravel().astype(float),
+            'vehicle_type'                      : params[5].ravel().astype(str),
+            'well_to_tank_CO2_emission_factor'  : params[6].ravel().astype(float),
+            })
+
+        # VSP coefficients and emission rate matrix of every configuration, loaded once per vehicle type
+        types, self.type_index = np.unique(self.configs.vehicle_type.to_numpy(), return_inverse=True)
+        tables = [rate_tables.get(vehicle, model_year_group, fuel, ambient) for vehicle in types]
+        coeff = np.array([table.vsp_coeff for table in tables])[self.type_index]
+        self.A, self.B, self.C, self.f = coeff.T
+        self.M = self.configs.mass.to_numpy()/1000  # unit: ton
+        self.pollutants = list(Util.pollutants)
+        self.emission_rate = Util.stack_emission_rates(tables, self.pollutants)
+
+
+    @classmethod
+    def from_excel(cls, excel_file_name = 'Data.xlsx', sheet_name = 'Driving cycle', **params):
+        """
+        Build a Fleet from the driving cycle of an excel sheet in the GV format.
+        The vehicle type of the sheet is used unless vehicle_type is given.
+        """
+        df = Util.read_data(excel_file_name, sheet_name)
+        params.setdefault('vehicle_type', df.vehicle_type[0])
+        return cls(df.speed.to_numpy(dtype=float), **params)
+
+
+    def __len__(self):
+        return len(self.configs)
+
+
+    # (configurations x seconds) arrays --------------------------
+    def tractive_power(self, configs = slice(None)):
+        """
+        Return the tractive power in watt, one row per configuration
+        """
+        c = self.configs.iloc[configs]
+        return Util.calculate_tractive_power(self.speed, self.acc,
+                                             c.mass.to_numpy()[:, None],
+                                             c.frontal_area.to_numpy()[:, None],
+                                             c.mu_rr.to_numpy()[:, None],
+                                             c.air_density.to_numpy()[:, None],
+                                             c.c_d.to_numpy()[:, None])
+
+    def vsp(self, configs = slice(None)):
+        """
+        Return the vehicle specific power in kW/ton, one row per configuration
+        """
+        return Util.calculate_vsp(self.speed, self.acc,
+                                  self.M[configs, None],
+                                  self.A[configs, None],
+                                  self.B[configs, None],
+                                  self.C[configs, None],
+                                  self.f[configs, None])
+
+    def op_mod(self, configs = slice(None)):
+        """
+        Return the operating mode of every second, one row per configuration
+        """
+        return Util.vsp_to_op_mod_array(self.vsp(configs), self.speed, self.acc, self.acc_t_2)
+
+
+    # per configuration results --------------------------
+    def op_mod_counts(self):
+        """
+        Return the number of seconds spent in each op_mod code, one row per configuration
+        """
+        n_codes = self.emission_rate.shape[1]
+        counts = np.zeros((len(self), n_codes), dtype=np.int64)
+        step = max(1, self.chunk_size//max(self.t, 1))
+        for start in range(0, len(self), step):
+            configs = slice(start, min(start + step, len(self)))
+            counts[configs] = Util.op_mod_histograms(self.op_mod(configs), n_codes)
+        return counts
+
+    def emission_totals(self):
+        """
+        Return the total emission of every pollutant in grams, one row per configuration
+        """
+        totals = Util.emission_totals_batch(self.op_mod_counts(), self.emission_rate[self.type_index])
+        return pd.DataFrame(totals, columns=self.pollutants, index=self.configs.index)
+
+    def totals(self, decimals = 3):
+        """
+        Return the configurations with their GV metrics (pump to wheel emissions, fuel burnt, mpg,
+        well to wheel CO2). With decimals set, the values are rounded the same way as the GV methods.
+        """
+        emission = self.emission_totals()
+        metrics = Util.emission_metrics(emission.CO2.to_numpy(),
+                                        emission.CO.to_numpy(),
+                                        emission.NOx.to_numpy(),
+                                        emission.HC.to_numpy(),
+                                        self.d,
+                                        self.configs.well_to_tank_CO2_emission_factor.to_numpy(),
+                                        decimals)
+        return pd.concat([self.configs, pd.DataFrame(metrics, index=self.configs.index)], axis=1)
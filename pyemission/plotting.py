@@ -0,0 +1,255 @@
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+from matplotlib import style
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+from matplotlib.gridspec import GridSpec
+
+# plot style: 'seaborn' was renamed 'seaborn-v0_8' in matplotlib 3.6
+STYLE = next((s for s in ['seaborn-v0_8', 'seaborn'] if s in style.available), 'default')
+
+# standard figures of a trip, see render_trip
+FIGURES = ['driving_cycle', 'tractive_power', 'speed_histogram']
+
+
+#%% downsampling of long series to the resolution of the figure
+
+# indices of the smallest and largest value of y in each of max_points//2 equal bins, with the first
+# and last points: a line through them looks the same as through all the points, peaks included
+def minmax_indices(y, max_points):
+    y = np.asarray(y, dtype=float)
+    n = y.size
+    if max_points is None or n <= max_points:
+        return np.arange(n)
+
+    size = int(np.ceil(n/max(1, max_points//2)))
+    n_bins = int(np.ceil(n/size))
+    offset = np.arange(n_bins)*size
+    low = np.full(n_bins*size, np.inf)
+    low[:n] = np.where(np.isnan(y), np.inf, y)
+    high = np.full(n_bins*size, -np.inf)
+    high[:n] = np.where(np.isnan(y), -np.inf, y)
+    indices = np.concatenate([[0, n - 1],
+                              offset + low.reshape(n_bins, size).argmin(axis=1),
+                              offset + high.reshape(n_bins, size).argmax(axis=1)])
+    return np.unique(np.minimum(indices, n - 1))
+
+
+# Largest-Triangle-Three-Buckets: max_points indices chosen so that each point makes the largest
+# triangle with the previous chosen point and the average of the next bucket
+def lttb_indices(x, y, max_points):
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    n = y.size
+    if max_points is None or n <= max_points or max_points < 3:
+        return np.arange(n)
+
+    edges = np.linspace(1, n - 1, max_points - 1).astype(int)
+    indices = np.zeros(max_points, dtype=np.intp)
+    indices[-1] = n - 1
+    a = 0
+    for i in range(max_points - 2):
+        start, end = edges[i], edges[i + 1]
+        next_end = edges[i + 2] if i + 2 < len(edges) else n
+        next_x = x[end:next_end].mean() if next_end > end else x[-1]
+        next_y = y[end:next_end].mean() if next_end > end else y[-1]
+        area = np.abs((x[a] - next_x)*(y[start:end] - y[a]) - (x[a] - x[start:end])*(next_y - y[a]))
+        a = start + int(np.argmax(area))
+        indices[i + 1] = a
+    return indices
+
+
+# indices of the points of a series to draw
+def downsample(x, y, max_points, method = 'minmax'):
+    if method is None:
+        return np.arange(len(y))
+    if method == 'minmax':
+        return minmax_indices(y, max_points)
+    if method == 'lttb':
+        return lttb_indices(x, y, max_points)
+    raise ValueError("Unknown downsampling method {!r}. Use 'minmax', 'lttb' or None".format(method))
+
+
+#%% figures
+
+# a new figure: on pyplot to be shown, or on its own Agg canvas to be written to a file without a display
+def new_figure(output, **kwargs):
+    if output is None:
+        import matplotlib.pyplot as plt
+        return plt.figure(**kwargs)
+    fig = Figure(**kwargs)
+    FigureCanvasAgg(fig)
+    return fig
+
+# show the figure, or write it to output (the format follows the file extension)
+def finish(fig, output, dpi = None):
+    if output is None:
+        import matplotlib.pyplot as plt
+        plt.show()
+    else:
+        fig.savefig(output, dpi=dpi if dpi is not None else 'figure')
+
+
+def plot_driving_cycle(car, output = None, method = 'minmax', max_points = None, dpi = None):
+    """
+    output     : file to write the figure to, instead of showing it
+    method     : 'minmax', 'lttb' or None, the downsampling of long cycles
+    max_points : number of points drawn, by default twice the width of the figure in pixels
+    dpi        : resolution of the file, by default the one of the figure (300)
+    """
+    with style.context(STYLE):
+        fig = new_figure(output, dpi = 300, constrained_layout=True, figsize=(7,3))
+        gs = GridSpec(1, 1, figure=fig)
+        ax = fig.add_subplot(gs[0, 0])
+
+        font_size=12 #font size
+        line_weight=1.5
+
+        x = car.df['time'].to_numpy()
+        y = car.df['speed'].to_numpy()*3.6
+        i = downsample(x, y, max_points or 2*int(7*(dpi or 300)), method)
+
+        ax.set_xlabel('Time (s)', fontweight='bold')
+        ax.set_ylabel('Speed (KMPH)', color='k', fontweight='bold')
+        ax.plot(x[i], y[i], color='r', linewidth=line_weight)
+        ax.tick_params(axis='y', labelcolor='k')
+        ax.set_title('Driving Cycle Plot', color='b', fontsize=font_size, fontweight='bold')
+        finish(fig, output, dpi)
+
+
+def plot_tractive_power(car, output = None, method = 'minmax', max_points = None, dpi = None):
+    """
+    output     : file to write the figure to, instead of showing it
+    method     : 'minmax', 'lttb' or None, the downsampling of long cycles
+    max_points : number of points drawn, by default twice the width of the figure in pixels
+    dpi        : resolution of the file, by default the one of the figure (300)
+    """
+    with style.context(STYLE):
+        fig = new_figure(output, dpi = 300, constrained_layout=True, figsize=(9,2))
+        gs = GridSpec(1, 1, figure=fig)
+        ax = fig.add_subplot(gs[0, 0])
+
+        font_size=12 #font size
+        alpha = 0.7
+        x = car.df['time'].to_numpy()
+        y = car._tractive_power()/1000 # convert to kilowatt, recomputed if the df has no p_tract
+        i = downsample(x, y, max_points or 2*int(9*(dpi or 300)), method)
+        x, y = x[i], y[i]
+        y1 = y*0
+
+        ax.set_xlabel('Time (s)', fontweight='bold')
+        ax.set_ylabel('Tractive power\n(kilowatt)', color='k', fontweight='bold')
+        #ax.plot(x, y, color='k', linewidth=.5)
+        ax.axhline(color='k', linewidth=.5)
+        ax.fill_between(x, y, y1, where=y > y1, facecolor = 'm', interpolate=True, label='Positive tractive power', alpha=alpha)
+        ax.fill_between(x, y, y1, where=y < y1, facecolor = 'b',  interpolate=True, label='Negative tractive power', alpha=alpha)
+        ax.tick_params(axis='y', labelcolor='k')
+        ax.set_title('Tractive power Plot', color='b', fontsize=font_size, fontweight='bold')
+        ax.legend(bbox_to_anchor=(1.01, 1.5), loc='upper right', ncol=1)
+        finish(fig, output, dpi)
+
+
+def plot_speed_histogram(car, bins=30, output = None, dpi = None):
+    """
+    bins   : number of bins. The default value is set as 30
+    output : file to write the figure to, instead of showing it
+    dpi    : resolution of the file, by default the one of the figure (300)
+    """
+    with style.context(STYLE):
+        fig = new_figure(output, dpi = 300, constrained_layout=True, figsize=(5,3))
+        gs = GridSpec(1, 1, figure=fig)
+        ax = fig.add_subplot(gs[0, 0])
+
+        # the histogram is computed once and drawn as bins bars, whatever the length of the cycle
+        x = car.df.speed.to_numpy()*3.6 # converted to kmph from mps
+        density, edges = np.histogram(x, bins=bins, density=True)
+        ax.hist(edges[:-1], bins=edges, weights=density, edgecolor='w', alpha=1)
+        ax.set_xlabel('Speed (kmph)', fontweight='bold')
+        ax.set_ylabel('Probability density', color='k', fontweight='bold')
+        ax.set_title('Distribution of speed', color='b', fontsize=12, fontweight='bold')
+        finish(fig, output, dpi)
+
+
+#%% rendering of many trips to files
+
+# file name prefix of the figures of a manifest row: its 'name', or the file and sheet names followed by
+# the row label when given (rows of the same sheet with other vehicle parameters get their own files)
+def trip_name(task, row = None):
+    import pandas as pd
+
+    name = task.get('name')
+    if name is None or pd.isna(name):
+        name = '{}_{}'.format(Path(str(task['excel_file_name'])).stem, task['sheet_name'])
+        if row is not None:
+            name = '{}_{}'.format(name, row)
+    return re.sub(r'[^\w.-]+', '_', str(name))
+
+
+def render_trip(task, directory, format = 'png', dpi = None):
+    """
+    Write the three standard figures of one trip to directory, as <name>_<figure>.<format>.
+    task is a manifest row (see pyemission.batch.read_manifest), with an optional 'name' column
+    (default: the file and sheet names). Returns the paths, or the error in the 'error' field.
+    """
+    import pandas as pd
+    from pyemission.batch import VEHICLE_PARAMETERS
+    from pyemission.pyemission import GV
+
+    name = trip_name(task)
+    result = {'excel_file_name': task['excel_file_name'], 'sheet_name': task['sheet_name']}
+    try:
+        params = {k: task[k] for k in VEHICLE_PARAMETERS if k in task and pd.notna(task[k])}
+        car = GV(task['excel_file_name'], task['sheet_name'], totals_only=True, columns=[], **params)
+        plot_driving_cycle(car, output=os.path.join(directory, '{}_driving_cycle.{}'.format(name, format)), dpi=dpi)
+        plot_tractive_power(car, output=os.path.join(directory, '{}_tractive_power.{}'.format(name, format)), dpi=dpi)
+        plot_speed_histogram(car, output=os.path.join(directory, '{}_speed_histogram.{}'.format(name, format)), dpi=dpi)
+        for figure in FIGURES:
+            result[figure] = os.path.join(directory, '{}_{}.{}'.format(name, figure, format))
+        result['error'] = None
+    except Exception as e:
+        result['error'] = '{}: {}'.format(type(e).__name__, e)
+    return result
+
+
+def render_batch(manifest, directory, processes = None, chunksize = 1, format = 'png', dpi = None):
+    """
+    Render the standard figures of every trip of a manifest (see pyemission.batch.read_manifest)
+    into directory with a pool of worker processes, and return one row per trip with the paths of
+    its figures (or its error), in the order of the manifest. The figures of a row are named after
+    its 'name' column, or else after its file name, sheet name and row label.
+
+    processes : number of worker processes, defaults to the number of CPUs. With 1, the trips are
+                rendered in the current process.
+    format    : file format, e.g. 'png', 'svg' or 'pdf'
+    dpi       : resolution of the files, by default the one of the figures (300)
+    """
+    import pandas as pd
+    from functools import partial
+    from pyemission.batch import read_manifest
+    from pyemission.pyemission import warm_up
+
+    manifest = read_manifest(manifest)
+    tasks = manifest.to_dict('records')
+    for row, task in zip(manifest.index, tasks):
+        task['name'] = trip_name(task, row)
+    names = pd.Series([task['name'] for task in tasks])
+    if names.duplicated().any():
+        raise ValueError('Several manifest rows would write the figures named: {}. Give them distinct names '
+                         "in the 'name' column".format(', '.join(names[names.duplicated()].unique())))
+    os.makedirs(directory, exist_ok=True)
+    render = partial(render_trip, directory=str(directory), format=format, dpi=dpi)
+    if processes is None:
+        processes = os.cpu_count() or 1
+    processes = max(1, min(processes, len(tasks)))
+
+    if processes == 1:
+        results = [render(task) for task in tasks]
+    else:
+        warm_up()
+        with ProcessPoolExecutor(max_workers=processes) as executor:
+            results = list(executor.map(render, tasks, chunksize=chunksize))
+    return pd.DataFrame(results, index=manifest.index)
@@ -0,0 +1,105 @@
+import logging
+import sys
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+logger = logging.getLogger('pyemission')
+
+
+# observer of the progress of a run -------------------------
+class Progress:
+
+    def __init__(self, callback = None, min_interval = 0.5):
+        """
+        callback     : function called as callback(stage, fraction), with fraction between 0 and 1.
+                       Subclasses can override update() instead.
+        min_interval : smallest time in seconds between two calls for the same stage. The start
+                       and the end of every stage are always reported.
+        """
+        self.callback = callback
+        self.min_interval = min_interval
+        self._stage = None
+        self._last = 0.0
+
+    def __call__(self, stage, fraction):
+        now = time.monotonic()
+        if stage != self._stage or fraction >= 1 or now - self._last >= self.min_interval:
+            self._stage = stage
+            self._last = now
+            self.update(stage, fraction)
+
+    def update(self, stage, fraction):
+        if self.callback is not None:
+            self.callback(stage, fraction)
+
+    @staticmethod
+    def wrap(progress):
+        """
+        Return progress as a Progress: None stays None, a plain function gets throttled.
+        """
+        if progress is None or isinstance(progress, Progress):
+            return progress
+        return Progress(progress)
+
+
+# text progress bar on the standard output, one per stage
+class ProgressBar(Progress):
+
+    def __init__(self, min_interval = 0.5, stream = None):
+        super().__init__(min_interval=min_interval)
+        self.stream = stream
+        self._stages = []
+
+    def update(self, stage, fraction):
+        stream = self.stream if self.stream is not None else sys.stdout
+        if fraction <= 0:
+            return
+        if stage not in self._stages:
+            self._stages.append(stage)
+            stream.write('\n{}:\n'.format(stage))
+
+        bar_length = 50
+        fraction = min(max(fraction, 0.), 1.)
+        block = int(round(bar_length*fraction))
+        stream.write('\rProgress: [{}] {:.0f}% {}'.format('#'*block + '-'*(bar_length - block),
+                                                          round(fraction*100, 0),
+                                                          '\r\n' if fraction >= 1 else 'complete'))
+        stream.flush()
+
+
+# wall time of the stages of a run -------------------------
+class Profile:
+
+    def __init__(self, progress = None):
+        """
+        progress : optional Progress (or function) told about the start and the end of every stage
+        """
+        self.stages = OrderedDict()  # stage -> seconds
+        self.progress = Progress.wrap(progress)
+
+    @contextmanager
+    def stage(self, name):
+        """
+        Time the enclosed block as the given stage (times add up if a stage runs more than once)
+        """
+        if self.progress is not None:
+            self.progress(name, 0.)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            self.stages[name] = self.stages.get(name, 0.) + elapsed
+            logger.debug('%s: %.6f s', name, elapsed)
+        if self.progress is not None:
+            self.progress(name, 1.)
+
+    def total(self):
+        return sum(self.stages.values())
+
+    def to_dict(self):
+        return dict(self.stages)
+
+    def __repr__(self):
+        return 'Profile({})'.format(', '.join('{}={:.6f}s'.format(k, v) for k, v in self.stages.items()))
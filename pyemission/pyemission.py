@@ -1,21 +1,40 @@
+import hashlib
+import json
+import os
 import pickle
-import matplotlib.pyplot as plt
-plt.style.use('seaborn')
-from matplotlib.gridspec import GridSpec
 import sys
+import tempfile
+import threading
+from collections import namedtuple
+import numpy as np
 import pandas as pd
 from pathlib import Path
 
-import pyemission as pe
+try:
+    from .progress import Profile, ProgressBar
+except ImportError:
+    # run as a script, or imported as the top-level module 'pyemission' from inside the
+    # package folder (e.g. example.py next to Data.xlsx)
+    from progress import Profile, ProgressBar
+
+
+# a module of the package, imported on first use, in script mode as well
+def _submodule(name):
+    import importlib
+    return importlib.import_module('.' + name, __package__) if __package__ else importlib.import_module(name)
 
 
 # generic vehicle class
 class Car:
 
-    def __init__(self, excel_file_name, sheet_name, mass, frontal_area, mu_rr, air_density, c_d):
+    def __init__(self, excel_file_name, sheet_name, mass, frontal_area, mu_rr, air_density, c_d, verbose=False, progress=None,
+                 compact=False, dtype=None, columns=None, resample=False, max_gap=10, vehicle_type=None, speed_unit=None,
+                 model_year_group=None, fuel=None, ambient=None):
         
         """
-            excel_file_name (string)  : name of the excel file which contains the driving cycle data
+            excel_file_name (string)  : name of the excel file which contains the driving cycle data. A csv, parquet, feather,
+                                        npy or npz file with the same columns, or a DataFrame, can be used as well
+                                        (see from_dataframe and from_arrays).
             sheet_name      (string)  : name of the 'sheet' inside the excel file, which contains the driving cycle data.
                                         The provided excel file format is recommended to use. The 'sheet' should have the below 4 columns-
                                         time: in second
@@ -29,33 +48,61 @@ class Car:
             mu_rr           (numeric) : rolling resistance coefficient between tire and road surface
             air_density     (numeric) : ambient air density in kg/m3
             c_d             (numeric) : aerodynamic drag coefficient
+            verbose         (boolean) : print the loading messages and a progress bar for every stage
+            progress                  : function called as progress(stage, fraction) (or a pyemission.progress.Progress),
+                                        throttled in time
+            compact         (boolean) : keep the per-second results small: float32 columns, an int8 op_mod, and the
+                                        time_unit, speed_unit and vehicle_type columns dropped from the df (they are
+                                        always kept once in self.metadata)
+            dtype                     : float type of the computed per-second columns (default float64, float32 if compact).
+                                        The speed and the metrics stay in float64.
+            columns         (list)    : computed per-second columns to add to the df, see result_columns() (default: all)
+            resample        (boolean) : resample the cycle to 1 Hz from its time and time_unit columns (see Util.resample_1hz),
+                                        for loggers with other or irregular rates. The counts of dropped and filled samples
+                                        are kept in self.resample_report.
+            max_gap         (numeric) : when resampling, gaps longer than this (seconds) split the cycle into trips: the
+                                        outage is left out and the acceleration restarts at zero after it
+            vehicle_type    (string)  : overrides the vehicle_type column of the data, e.g. for a plain .npy speed array
+            speed_unit      (string)  : overrides the speed_unit column of the data
+            model_year_group,
+            fuel, ambient   (string)  : select the emission rate table among those of the vehicle type in a rate store
+                                        (see RateTables.get); the defaults of the store when None
             
+        The wall time of every stage is kept in self.profile.
         """
-        print('Loading Data...\n')
-        df = Util.read_data(excel_file_name, sheet_name)
-        vehicle = df.vehicle_type[0]
-
-        my_file = Path('db.pkl')
-        if my_file.is_file(): # check if the file exists in the current directory
-            db_path = 'db.pkl'
-        else: # find the path of the 'db.pkl' to load it
-            try:
-                path = pe.__file__
-                length = len('__init__.py')
-                path = path[:-length]
-                db_path = path + 'db.pkl'
-            except:
-                print('Could not load the file: db.pkl\nMake sure the current working directory contains this file.')
-                
-        if vehicle == 'Light commercial truck' :
-            df_emission_rate = pickle.load(open(db_path,'rb'))[0]
-
-        else:
-            df_emission_rate = pickle.load(open(db_path,'rb'))[1]
+        self.verbose = verbose
+        self.profile = Profile(progress if progress is not None else ProgressBar() if verbose else None)
+        self.compact = compact
+        self.dtype = np.dtype(dtype if dtype is not None else np.float32 if compact else np.float64)
+        
+        with self.profile.stage('load'):
+            if verbose:
+                print('Loading Data...\n')
+            df = Util.read_data(excel_file_name, sheet_name, vehicle_type, speed_unit, verbose=verbose)
+            # the unit and vehicle type columns hold one value for the whole cycle
+            self.metadata = {c: df[c][0] for c in Util.metadata_columns if c in df.columns}
         
-        # VSP coefficients
-        A, B, C, f = Util.vsp_coeff(vehicle)
-        self.df_emission_rate = df_emission_rate
+        # first second of every trip but the first
+        self.trip_start = np.zeros(0, dtype=np.intp)
+        self.resample_report = None
+        if resample:
+            with self.profile.stage('resample'):
+                df, self.resample_report = Util.resample_1hz(df, max_gap)
+                self.trip_start = np.flatnonzero(np.diff(df.trip_id.to_numpy())) + 1
+        
+        if compact:
+            df = df.drop(columns=list(self.metadata))
+        vehicle = self.metadata['vehicle_type']
+        self.model_year_group = model_year_group
+        self.fuel = fuel
+        self.ambient = ambient
+
+        # emission rate table and VSP coefficients, shared by every vehicle of the process
+        with self.profile.stage('rate_table'):
+            rate_table = rate_tables.get(vehicle, model_year_group, fuel, ambient)
+        A, B, C, f = rate_table.vsp_coeff
+        self.df_emission_rate = rate_table.df_emission_rate
+        self.pollutants, self.emission_rate = rate_table.pollutants, rate_table.emission_rate
         self.A = A
         self.B = B
         self.C = C
@@ -72,157 +119,193 @@ class Car:
         self.mu_rr = mu_rr
         self.air_density = air_density
         self.c_d = c_d
-
-
-        print('Application Running...')        
-        # add acceleration column to the main df
-        print("\nPart [1/3]:")
-        v_0 = df.speed[0]     
-        for row in df.itertuples():
-            idx = row.Index
-            v = row.speed
-            
-            if idx == 0:
-                a = 0
-            else:
-                a = v - v_0
-                v_0 = v
-            df.loc[idx, "acc"] = a
-            
-            ##put a progress bar
-            total_iteration = self.t
-            Util.progress_bar(total_iteration, idx + 1)
         
+        self.columns = self.result_columns() if columns is None else list(columns)
+        unknown = [c for c in self.columns if c not in self.result_columns()]
+        if unknown:
+            raise ValueError('Unknown result column(s) {}. Use some of: {}'.format(
+                ', '.join(map(repr, unknown)), ', '.join(self.result_columns())))
+        self.df = df
+        
+        # results of an earlier run with the same inputs
+        if self._restore_cached():
+            return
 
-           
 
-        # add tractive_power columns to the main df
-        print("\nPart [2/3]:")     
-        for row in df.itertuples():
-            idx = row.Index
-            v = row.speed
-            a = row.acc
+        if verbose:
+            print('Application Running...')        
+        # add acceleration and tractive_power columns to the main df
+        speed = df.speed.to_numpy(dtype=float)
 
-            p_tract = Util.calculate_tractive_power (v, a, mass, frontal_area, mu_rr, air_density, c_d)
-            df.loc[idx, "p_tract"]                  = p_tract
-            
-            ##put a progress bar
-            total_iteration = self.t
-            Util.progress_bar(total_iteration, idx + 1)
-            
-   
-        self.df = df
+        with self.profile.stage('acceleration'):
+            acc = Util.calculate_acceleration(speed)
+            acc[self.trip_start] = 0
+            self._add_column("acc", acc)
+
+        with self.profile.stage('tractive_power'):
+            if 'p_tract' in self.columns:
+                self._add_column("p_tract", Util.calculate_tractive_power(speed, acc, mass, frontal_area, mu_rr, air_density, c_d))
 
            
             
+    @classmethod
+    def from_dataframe(cls, df, **params):
+        """
+        Build the vehicle from a DataFrame in the format of the excel file (the DataFrame is not modified).
+        params are the other constructor arguments (mass, frontal_area, ...).
+        """
+        return cls(df, None, **params)
+    
+    @classmethod
+    def from_arrays(cls, speed, vehicle_type = 'Passenger car', speed_unit = 'meter per second', time = None, **params):
+        """
+        Build the vehicle from a second-by-second speed array, without reading a file.
+        params are the other constructor arguments (mass, frontal_area, ...).
+        """
+        speed = np.asarray(speed, dtype=float)
+        df = pd.DataFrame({'time'           : np.arange(speed.size) if time is None else np.asarray(time),
+                           'speed'          : speed,
+                           'time_unit'      : 'second',
+                           'speed_unit'     : speed_unit,
+                           'vehicle_type'   : vehicle_type})
+        return cls(df, None, **params)
+    
+    
+    # computed per-second columns that can be added to the df
+    def result_columns(self):
+        return ['acc', 'p_tract']
+    
+    # add a computed per-second column to the df in self.dtype, if it was selected
+    def _add_column(self, name, values):
+        if name in self.columns:
+            self.df[name] = values.astype(self.dtype, copy=False)
+    
+    # restore the results of an earlier run from a result cache and return True,
+    # or return False to compute them; see GV
+    def _restore_cached(self):
+        return False
+    
+    # float64 acceleration, recomputed from the speed when the df has none or a float32 one
+    def _acceleration(self):
+        if 'acc' in self.df.columns and self.df.acc.dtype == np.float64:
+            return self.df.acc.to_numpy()
+        acc = Util.calculate_acceleration(self.df.speed.to_numpy(dtype=float))
+        acc[self.trip_start] = 0
+        return acc
+    
+    # float64 tractive power (watt), recomputed from the speed when the df has none or a float32 one
+    def _tractive_power(self):
+        if 'p_tract' in self.df.columns and self.df.p_tract.dtype == np.float64:
+            return self.df.p_tract.to_numpy()
+        return Util.calculate_tractive_power(self.df.speed.to_numpy(dtype=float), self._acceleration(),
+                                             self.m, self.frontal_area, self.mu_rr, self.air_density, self.c_d)
+    
+    # acceleration two seconds earlier, zero on the first two seconds of every trip
+    def _lagged_acceleration(self, acc):
+        acc_t_2 = Util.lag(acc, 2)
+        acc_t_2[self.trip_start] = 0
+        acc_t_2[self.trip_start[self.trip_start + 1 < len(acc)] + 1] = 0
+        return acc_t_2
+    
+    
+    # summary of the driving cycle -------------------------
+    def summary(self):
+        """
+        Return a dictionary with every statistic of the driving cycle, rounded the same
+        way as the individual methods. It is computed in one pass over the arrays, cached,
+        and recomputed only when the df, the travelled distance, or the travel time change.
+        Call clear_summary() after editing the df in place.
+        """
+        key = self._summary_key()
+        if getattr(self, '_summary', None) is None or self._summary[0] != key:
+            with self.profile.stage('summary'):
+                self._summary = (key, self._compute_summary())
+        return self._summary[1]
+    
+    def clear_summary(self):
+        self._summary = None
+    
+    def _summary_key(self):
+        return (id(self.df), self.df.shape, self.d, self.t)
+    
+    # with decimals set to None, nothing is rounded (see full_summary)
+    def _compute_summary(self, decimals=3):
+        stats = Util.cycle_statistics(self.df.speed.to_numpy(dtype=float), self._acceleration())
+        return Util.cycle_metrics(stats, self.d, self.t, decimals)
+    
+    def full_summary(self):
+        """
+        Return the statistics of summary() in full precision, not rounded (not cached)
+        """
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return self._compute_summary(None)
+    
     #travelled distance------------------------
     def distance(self):
         """
         Return travelled distance in kilometer
         """
-        return round(self.d, 3)
+        return self.summary()['distance']
     
     # average speed----------------------------
     def average_speed(self):
-        return round( self.d/(self.t/3600), 3)
+        return self.summary()['average_speed']
     
     # stops per kilometer----------------------------
     def no_of_stops_per_km(self):
-        no_of_stops = 0
-        flag = False
-        for v in self.df.speed:
-            v_fps = v*3.28084
-            if v_fps >= 15:
-                flag = True
-            if v_fps <10 and flag == True:
-                no_of_stops += 1
-                flag = False
-        return round(no_of_stops/self.d, 3)
+        return self.summary()['no_of_stops_per_km']
     
     # idle time percentage-----------------------------
     def idling_mode(self): 
-        idle_time = 0
-        for v in self.df.speed:
-            if v <= 0.1:
-                idle_time += 1
-        return round( idle_time*100/self.t, 3 )    
+        return self.summary()['idling_mode']
 
     # average acceleration --------------------------
     def acc_avg(self):
-        return round( self.df.acc[ self.df.acc > 0].mean(), 3 )
+        return self.summary()['acc_avg']
     
     # average decceleration --------------------------
     def dec_avg(self):
-        return round( self.df.acc[ self.df.acc < 0].mean(), 3 )
+        return self.summary()['dec_avg']
     
     # acceleration mode percentage --------------------------
     def acc_mode(self):
-        return round( self.df.acc[ self.df.acc > 0].count()*100/self.t, 3 )
+        return self.summary()['acc_mode']
     
     # deceleration mode percentage --------------------------
     def dec_mode(self):
-        return round( self.df.acc[ self.df.acc < 0].count()*100/self.t, 3 )
+        return self.summary()['dec_mode']
 
     # speed standard deviation --------------------------
     def speed_std(self):
-        speed_kmph = self.df.speed*3.6
-        return round( speed_kmph.std(), 3)
+        return self.summary()['speed_std']
     
     
-    def plot_driving_cycle(self):
-        
-        fig = plt.figure(dpi = 300, constrained_layout=True, figsize=(7,3))
-        gs = GridSpec(1, 1, figure=fig)
-        ax = fig.add_subplot(gs[0, 0])
-        
-        font_size=12 #font size
-        line_weight=1.5
-        
-        ax.set_xlabel('Time (s)', fontweight='bold')
-        ax.set_ylabel('Speed (KMPH)', color='k', fontweight='bold')
-        ax.plot(self.df['time'], self.df['speed']*3.6, color='r', linewidth=line_weight)
-        ax.tick_params(axis='y', labelcolor='k')
-        ax.set_title('Driving Cycle Plot', color='b', fontsize=font_size, fontweight='bold')
-        plt.show()
-        
-        
-    def plot_tractive_power(self):
-        fig = plt.figure(dpi = 300, constrained_layout=True, figsize=(9,2))
-        gs = GridSpec(1, 1, figure=fig)
-        ax = fig.add_subplot(gs[0, 0])
+    def plot_driving_cycle(self, output=None, method='minmax', max_points=None, dpi=None):
+        """
+        output     : file to write the figure to (no display needed), instead of showing it
+        method     : 'minmax', 'lttb' or None, the downsampling of long cycles to the width of the figure
+        max_points : number of points drawn, by default twice the width of the figure in pixels
+        dpi        : resolution of the file, by default the one of the figure (300)
+        """
+        plotting = _submodule('plotting')
+        plotting.plot_driving_cycle(self, output, method, max_points, dpi)
         
-        font_size=12 #font size
-        alpha = 0.7
-        x=self.df['time']
-        y=self.df['p_tract']/1000 # convert to kilowatt
-        y1 = self.df.speed*0
         
-        ax.set_xlabel('Time (s)', fontweight='bold')
-        ax.set_ylabel('Tractive power\n(kilowatt)', color='k', fontweight='bold')
-        #ax.plot(x, y, color='k', linewidth=.5)
-        ax.axhline(color='k', linewidth=.5)
-        ax.fill_between(x, y, y1, where=y > y1, facecolor = 'm', interpolate=True, label='Positive tractive power', alpha=alpha)
-        ax.fill_between(x, y, y1, where=y < y1, facecolor = 'b',  interpolate=True, label='Negative tractive power', alpha=alpha)
-        ax.tick_params(axis='y', labelcolor='k')
-        ax.set_title('Tractive power Plot', color='b', fontsize=font_size, fontweight='bold')
-        ax.legend(bbox_to_anchor=(1.01, 1.5), loc='upper right', ncol=1)
-        plt.show()
+    def plot_tractive_power(self, output=None, method='minmax', max_points=None, dpi=None):
+        """
+        same arguments as plot_driving_cycle
+        """
+        plotting = _submodule('plotting')
+        plotting.plot_tractive_power(self, output, method, max_points, dpi)
 
 
-    def plot_speed_histogram(self, bins=30):
+    def plot_speed_histogram(self, bins=30, output=None, dpi=None):
         """
         bins : number of bins. The default value is set as 30
+        output, dpi : see plot_driving_cycle
         """
-        fig = plt.figure(dpi = 300, constrained_layout=True, figsize=(5,3))
-        gs = GridSpec(1, 1, figure=fig)
-        ax = fig.add_subplot(gs[0, 0])
-        
-        x = self.df.speed*3.6 # converted to kmph from mps
-        ax.hist(x, edgecolor='w', bins=bins, density=True, alpha=1)
-        ax.set_xlabel('Speed (kmph)', fontweight='bold')
-        ax.set_ylabel('Probability density', color='k', fontweight='bold')
-        ax.set_title('Distribution of speed', color='b', fontsize=12, fontweight='bold')
-        plt.show()
+        plotting = _submodule('plotting')
+        plotting.plot_speed_histogram(self, bins, output, dpi)
     
 #------------------------------------------------------------------------------
 # gasoline vehicle class
@@ -236,11 +319,27 @@ class GV(Car):
                  mu_rr =0.0127,
                  air_density =1.18,
                  c_d =0.28,
-                 well_to_tank_CO2_emission_factor = 16.79                 
+                 well_to_tank_CO2_emission_factor = 16.79,
+                 totals_only = False,
+                 verbose = False,
+                 progress = None,
+                 compact = False,
+                 dtype = None,
+                 columns = None,
+                 cache = None,
+                 resample = False,
+                 max_gap = 10,
+                 vehicle_type = None,
+                 speed_unit = None,
+                 model_year_group = None,
+                 fuel = None,
+                 ambient = None
                  ):
         
         """
-        excel_file_name (string)  : name of the excel file which contains the driving cycle data
+        excel_file_name (string)  : name of the excel file which contains the driving cycle data. A csv, parquet, feather,
+                                    npy or npz file with the same columns, or a DataFrame, can be used as well
+                                    (see from_dataframe and from_arrays).
         sheet_name      (string)  : name of the 'sheet' inside the excel file, which contains the driving cycle data.
                                     The provided excel file format is recommended to use. The 'sheet' should have the below 4 columns-
                                     time: in second
@@ -255,149 +354,495 @@ class GV(Car):
         air_density                     (numeric) : ambient air density in kg/m3
         c_d                             (numeric) : aerodynamic drag coefficient
         well_to_tank_CO2_emission_factor (numeric): typical value is 16.79 gm/MJ
+        totals_only                     (boolean) : if True, only the trip totals are computed from the op_mod histogram, built
+                                                    block by block; no per-second column is added to the df unless given in columns
+        verbose                         (boolean) : print the loading messages and a progress bar for every stage
+        progress                                  : function called as progress(stage, fraction) (or a pyemission.progress.Progress),
+                                                    throttled in time
+        compact                         (boolean) : keep the per-second results small: float32 columns, an int8 op_mod, and the
+                                                    time_unit, speed_unit and vehicle_type columns dropped from the df (they are
+                                                    always kept once in self.metadata)
+        dtype                                     : float type of the computed per-second columns (default float64, float32 if compact).
+                                                    The speed and the metrics stay in float64.
+        columns                         (list)    : computed per-second columns to add to the df, see result_columns() (default: all)
+        cache                                     : a pyemission.cache.ResultCache, or the folder of one. The results are
+                                                    stored there and a later run with the same speed trace, vehicle type,
+                                                    parameters and rate table reads them back instead of computing them.
+        resample                        (boolean) : resample the cycle to 1 Hz from its time and time_unit columns (see Util.resample_1hz),
+                                                    for loggers with other or irregular rates. The counts of dropped and filled
+                                                    samples are kept in self.resample_report.
+        max_gap                         (numeric) : when resampling, gaps longer than this (seconds) split the cycle into trips: the
+                                                    outage is left out and the acceleration restarts at zero after it
+        vehicle_type                    (string)  : overrides the vehicle_type column of the data, e.g. for a plain .npy speed array
+        speed_unit                      (string)  : overrides the speed_unit column of the data
+        model_year_group,
+        fuel, ambient                   (string)  : select the emission rate table among those of the vehicle type in a rate store
+                                                    (see RateTables.get); the defaults of the store when None
             
+        The wall time of every stage is kept in self.profile.
         """
         
-        super().__init__(excel_file_name, sheet_name, mass, frontal_area, mu_rr, air_density, c_d)
         self.well_to_tank_CO2_emission_factor = well_to_tank_CO2_emission_factor
+        self.totals_only = totals_only
+        self.cache = None
+        if cache is not None:
+            from pyemission.cache import ResultCache
+            self.cache = ResultCache.wrap(cache)
+        self.cache_hit = False
+        if totals_only and columns is None:
+            columns = []
+        
+        super().__init__(excel_file_name, sheet_name, mass, frontal_area, mu_rr, air_density, c_d, verbose, progress,
+                         compact, dtype, columns, resample, max_gap, vehicle_type, speed_unit, model_year_group, fuel, ambient)
+        if self.cache_hit:
+            return
         
         # add vsp, emission, and energy_kj columns to the main df
-        print('\nPart [3/3]')
-        for row in self.df.itertuples():
-            idx = row.Index
-            v = row.speed
-            a = row.acc
-
-            vsp = Util.calculate_vsp (v, a, self.M, self.A, self.B, self.C, self.f)
-            
-            # calculate op_mod
-            speed_t = v
-            acc_t = a
-            try:
-                acc_t_1 = self.df.acc[idx - 1]
-            except:
-                acc_t_1 = 0
-            try:
-                acc_t_2 = self.df.acc[idx - 2]
-            except:
-                acc_t_2 = 0
-            op_mod = Util.vsp_to_op_mod (vsp, speed_t, acc_t, acc_t_1, acc_t_2)
+        speed = self.df.speed.to_numpy(dtype=float)
+        acc = self._acceleration()
+        if totals_only:
+            self._totals_only(speed, acc)
+            if self.cache is not None:
+                self._store_cached()
+            return
+        
+        with self.profile.stage('vsp_op_mod'):
+            vsp = Util.calculate_vsp (speed, acc, self.M, self.A, self.B, self.C, self.f)
+            op_mod = Util.vsp_to_op_mod_array (vsp, speed, acc, self._lagged_acceleration(acc))
+        
+        with self.profile.stage('emissions'):
+            # seconds spent in each op_mod, a compact signature of the trip
+            self.op_mod_counts = Util.op_mod_histogram(op_mod, len(self.emission_rate))
+            self.emission_totals = dict(zip(self.pollutants, Util.emission_totals(self.op_mod_counts, self.emission_rate)))
             
-            CO2                     = Util.op_mod_to_emission_rate (self.df_emission_rate, op_mod, 'CO2')
-            CO                      = Util.op_mod_to_emission_rate (self.df_emission_rate, op_mod, 'CO')
-            NOx                     = Util.op_mod_to_emission_rate (self.df_emission_rate, op_mod, 'NOx')
-            HC                      = Util.op_mod_to_emission_rate (self.df_emission_rate, op_mod, 'HC')
-            PM2_5_elemental_carbon  = Util.op_mod_to_emission_rate (self.df_emission_rate, op_mod, 'PM2.5_elemental_carbon')
-            PM2_5_organic_carbon    = Util.op_mod_to_emission_rate (self.df_emission_rate, op_mod, 'PM2.5_organic_carbon')
-           
+            self._add_column("vsp", vsp)
+            if 'op_mod' in self.columns:
+                self.df["op_mod"] = op_mod.astype(np.int8 if compact else float)
             
-            self.df.loc[idx, "vsp"]                      = vsp
-            self.df.loc[idx, "op_mod"]                   = op_mod
-            self.df.loc[idx, "CO2"]                      = CO2
-            self.df.loc[idx, "CO"]                       = CO
-            self.df.loc[idx, "NOx"]                      = NOx
-            self.df.loc[idx, "HC"]                       = HC
-            self.df.loc[idx, "PM2.5_elemental_carbon"]   = PM2_5_elemental_carbon
-            self.df.loc[idx, "PM2.5_organic_carbon"]     = PM2_5_organic_carbon
-
+            # emission rates of the selected pollutants for the whole cycle in one gather
+            selected = [i for i, pollutant in enumerate(self.pollutants) if pollutant in self.columns]
+            emission = self.emission_rate[:, selected].astype(self.dtype)[op_mod]
+            for j, i in enumerate(selected):
+                self._add_column(self.pollutants[i], emission[:, j])
+        
+        if self.cache is not None:
+            self._store_cached()
+    
+    # seconds per block of a totals_only run
+    totals_block = 2**16
+    
+    # op_mod histogram and emission totals of a totals_only run, from the vsp and op_mod of one
+    # block of seconds at a time: no per-second array but the speed and accelerations is kept
+    def _totals_only(self, speed, acc):
+        acc_t_2 = self._lagged_acceleration(acc)
+        self.op_mod_counts = np.zeros(len(self.emission_rate), dtype=np.int64)
+        with self.profile.stage('vsp_op_mod'):
+            for start in range(0, len(speed), self.totals_block):
+                block = slice(start, start + self.totals_block)
+                vsp = Util.calculate_vsp(speed[block], acc[block], self.M, self.A, self.B, self.C, self.f)
+                op_mod = Util.vsp_to_op_mod_array(vsp, speed[block], acc[block], acc_t_2[block])
+                self.op_mod_counts += Util.op_mod_histogram(op_mod, len(self.emission_rate))
+        
+        with self.profile.stage('emissions'):
+            self.emission_totals = dict(zip(self.pollutants, Util.emission_totals(self.op_mod_counts, self.emission_rate)))
+        
+    
+    def result_columns(self):
+        return super().result_columns() + ['vsp', 'op_mod'] + self.pollutants
+    
+    # inputs of the run, besides the speed trace, that the cached results depend on
+    def _cache_inputs(self):
+        return {
+            'vehicle_type'                      : self.metadata['vehicle_type'],
+            'speed_unit'                        : self.metadata['speed_unit'],
+            'conditions'                        : [self.model_year_group, self.fuel, self.ambient],
+            'mass'                              : float(self.m),
+            'frontal_area'                      : float(self.frontal_area),
+            'mu_rr'                             : float(self.mu_rr),
+            'air_density'                       : float(self.air_density),
+            'c_d'                               : float(self.c_d),
+            'well_to_tank_CO2_emission_factor'  : float(self.well_to_tank_CO2_emission_factor),
+            'totals_only'                       : bool(self.totals_only),
+            'compact'                           : bool(self.compact),
+            'dtype'                             : self.dtype.str,
+            'columns'                           : self.columns,
+            'rate_table'                        : rate_tables.version(),
+            'trip_start'                        : self.trip_start.tolist(),
+            }
+    
+    def _restore_cached(self):
+        if self.cache is None:
+            return False
+        with self.profile.stage('cache'):
+            self._cache_key = self.cache.key(self.df.speed.to_numpy(dtype=float), self._cache_inputs())
+            # the per-second columns are mapped, not read: their pages are read from disk when used
+            cached = self.cache.get(self._cache_key, mmap_mode='c')
+            if cached is None:
+                return False
             
-            ##put a progress bar
-            total_iteration = self.t
-            Util.progress_bar(total_iteration, idx + 1)
+            for name in self.columns:
+                if 'column_' + name in cached:
+                    self.df[name] = cached['column_' + name]
+            self.op_mod_counts = np.array(cached['op_mod_counts'])
+            self.emission_totals = dict(zip(self.pollutants, cached['emission_totals'].tolist()))
+            self._summary = (self._summary_key(), json.loads(str(cached['summary'])))
+        self.cache_hit = True
+        return True
+    
+    def _store_cached(self):
+        summary = self.summary()
+        with self.profile.stage('cache'):
+            arrays = {'column_' + name: self.df[name].to_numpy() for name in self.columns if name in self.df.columns}
+            arrays['op_mod_counts'] = self.op_mod_counts
+            arrays['emission_totals'] = np.array([self.emission_totals[p] for p in self.pollutants])
+            arrays['summary'] = np.array(json.dumps(summary))
+            self.cache.put(self._cache_key, arrays)
+    
+    # total emission of a pollutant over the cycle in grams: the sum of the df column when it is
+    # there in float64, the op_mod histogram otherwise
+    def _emission_sum(self, pollutant):
+        column = None if self.totals_only else self.df.get(pollutant)
+        if column is None or column.dtype != np.float64:
+            return self.emission_totals[pollutant]
+        return column.sum()
+    
+    def op_mod_histogram(self):
+        """
+        Return the number of seconds spent in each op_mod of the emission rate table
+        """
+        codes = self.df_emission_rate.index.to_numpy(dtype=int)
+        return pd.Series(self.op_mod_counts[codes], index=self.df_emission_rate.index, name='seconds')
+    
+    
+    # per-second values and their rollups -------------------------
+    def per_second(self):
+        """
+        Return a DataFrame with the distance (km), the emission of every pollutant (grams) and the fuel
+        burnt (ml) of every second, in float64. The op_mod of every second comes from the whole cycle,
+        so the rollups below keep the accelerations and their lags across segment boundaries.
+        """
+        if 'op_mod' in self.df.columns:
+            op_mod = self.df.op_mod.to_numpy().astype(np.intp)
+        else:
+            speed = self.df.speed.to_numpy(dtype=float)
+            acc = self._acceleration()
+            vsp = Util.calculate_vsp(speed, acc, self.M, self.A, self.B, self.C, self.f)
+            op_mod = Util.vsp_to_op_mod_array(vsp, speed, acc, self._lagged_acceleration(acc))
+        
+        values = pd.DataFrame(self.emission_rate[op_mod], columns=self.pollutants)
+        values.insert(0, 'distance', self.df.speed.to_numpy(dtype=float)/1000)
+        values['fuel_burnt'] = Util.fuel_burnt(values.CO2.to_numpy(), values.CO.to_numpy(), values.NOx.to_numpy())
+        return values
+    
+    def segment_totals(self, segment_id = 'segment_id'):
+        """
+        Return the travel time (s), distance, pollutants and fuel burnt summed by segment, one row per segment
+        in order of first appearance. A segment does not need to be contiguous (e.g. a road link driven twice).
+        
+        segment_id : name of a column of the df, or an array with the segment of every second
+        """
+        ids = self.df[segment_id].to_numpy() if isinstance(segment_id, str) else np.asarray(segment_id)
+        if ids.shape != (self.t,):
+            raise ValueError('segment_id must give one segment per second ({} values)'.format(self.t))
+        codes, segments = pd.factorize(ids)
+        
+        values = self.per_second()
+        totals = pd.DataFrame(Util.segment_sums(values.to_numpy(), codes, len(segments)), columns=values.columns,
+                              index=pd.Index(segments, name=segment_id if isinstance(segment_id, str) else 'segment_id'))
+        totals.insert(0, 'travel_time', np.bincount(codes, minlength=len(segments)))
+        return totals
+    
+    def rolling_totals(self, window = 60):
+        """
+        Return, for every second, the distance, pollutants and fuel burnt summed over the window of the last
+        `window` seconds ending at that second (fewer at the start of the cycle). For fixed, non-overlapping
+        windows use segment_totals(np.arange(t)//window). A window below one second raises ValueError.
+        """
+        values = self.per_second()
+        return pd.DataFrame(Util.rolling_sums(values.to_numpy(), window), columns=values.columns, index=self.df.index)
         
+    def _summary_key(self):
+        return super()._summary_key() + (self.well_to_tank_CO2_emission_factor,)
     
+    def _compute_summary(self, decimals=3):
+        summary = super()._compute_summary(decimals)
         
+        summary.update(Util.emission_metrics(self._emission_sum('CO2'),
+                                             self._emission_sum('CO'),
+                                             self._emission_sum('NOx'),
+                                             self._emission_sum('HC'),
+                                             self.d,
+                                             self.well_to_tank_CO2_emission_factor,
+                                             decimals))
+        return summary
         
     def pump_to_wheel_CO2(self):
-        CO2_sum = self.df.CO2.sum()
-        return round(CO2_sum, 3)
+        return self.summary()['pump_to_wheel_CO2']
     
     def pump_to_wheel_CO(self):
-        CO_sum = self.df.CO.sum()
-        return round(CO_sum, 3)
+        return self.summary()['pump_to_wheel_CO']
     
     def pump_to_wheel_NOx(self):
-        NOx_sum = self.df.NOx.sum()
-        return round(NOx_sum, 3)
+        return self.summary()['pump_to_wheel_NOx']
     
     def pump_to_wheel_HC(self):
-        HC_sum = self.df.HC.sum()
-        return round(HC_sum, 3)
+        return self.summary()['pump_to_wheel_HC']
  
     def pump_to_wheel_CO2_per_km(self):
-        value = self.pump_to_wheel_CO2()/self.d
-        return round(value, 3)    
+        return self.summary()['pump_to_wheel_CO2_per_km']
  
     def pump_to_wheel_CO_per_km(self):
-        value = self.pump_to_wheel_CO()/self.d
-        return round(value, 3)    
+        return self.summary()['pump_to_wheel_CO_per_km']
  
     def pump_to_wheel_NOx_per_km(self):
-        value = self.pump_to_wheel_NOx()/self.d
-        return round(value, 3)   
+        return self.summary()['pump_to_wheel_NOx_per_km']
  
     def pump_to_wheel_HC_per_km(self):
-        value = self.pump_to_wheel_HC()/self.d
-        return round(value, 3)   
+        return self.summary()['pump_to_wheel_HC_per_km']
  
     
     def fuel_burnt(self):
-        HC = self.pump_to_wheel_NOx()
-        CO = self.pump_to_wheel_CO()
-        CO2 = self.pump_to_wheel_CO2()
-        density = 750
-        W_c = 0.866
-        fuel_sum = (0.866*HC + 0.429*CO + 0.273*CO2)*1000/(density*W_c)
-        return round(fuel_sum, 3)
+        return self.summary()['fuel_burnt']
     
     def mpg(self):
-        fuel = self.fuel_burnt()
-        value = (self.d/1.60934)/(fuel/3785.412)
-        return round(value, 3)
+        return self.summary()['mpg']
 
 
     def well_to_pump_CO2(self):
-        gasoline = self.fuel_burnt()
-        value = gasoline*34.2*self.well_to_tank_CO2_emission_factor/1000
-        return round(value, 3)
+        return self.summary()['well_to_pump_CO2']
         
     def well_to_wheel_CO2(self):
-        value = self.pump_to_wheel_CO2() + self.well_to_pump_CO2()
-        return round(value, 3)
+        return self.summary()['well_to_wheel_CO2']
     
     def well_to_wheel_CO2_per_km(self):
-        value = self.well_to_wheel_CO2()/self.d
-        return round(value, 3)
+        return self.summary()['well_to_wheel_CO2_per_km']
 
 
 #%%
 class Util:
     #%%
+    # input loaders: each one takes a file name and a sheet name (ignored by the
+    # non-excel formats) and returns a DataFrame in the format of the excel file
+    def load_excel (file_name, sheet_name):
+        return pd.read_excel(io = file_name, sheet_name = sheet_name, header = 0)
+    
+    def load_csv (file_name, sheet_name):
+        return pd.read_csv(file_name)
+    
+    def load_parquet (file_name, sheet_name):
+        return pd.read_parquet(file_name)
+    
+    def load_feather (file_name, sheet_name):
+        return pd.read_feather(file_name)
+    
+    # .npy: a plain speed array (give the vehicle_type and speed_unit to read_data or the
+    # constructor) or a structured array with one field per column.
+    # .npz: one array per column; 0-d or single-value arrays (e.g. vehicle_type,
+    # speed_unit) are repeated over the cycle.
+    def load_numpy (file_name, sheet_name):
+        data = np.load(file_name, allow_pickle=False)
+        if isinstance(data, np.ndarray):
+            if data.dtype.names is None:
+                return pd.DataFrame({'speed': data})
+            return pd.DataFrame(data)
+        
+        with data:
+            columns = {name: data[name] for name in data.files}
+        return pd.DataFrame({name: value.item() if value.size == 1 and name != 'speed' else value
+                             for name, value in columns.items()})
+    
+    # file extension -> loader, see register_loader
+    loaders = {
+        '.xlsx'     : load_excel,
+        '.xls'      : load_excel,
+        '.xlsm'     : load_excel,
+        '.csv'      : load_csv,
+        '.parquet'  : load_parquet,
+        '.pq'       : load_parquet,
+        '.feather'  : load_feather,
+        '.arrow'    : load_feather,
+        '.npy'      : load_numpy,
+        '.npz'      : load_numpy,
+        }
+    
+    def register_loader (extension, loader):
+        """
+        Use loader(file_name, sheet_name) -> DataFrame to read the files with the given extension
+        """
+        Util.loaders[extension.lower()] = loader
+    
+    # input columns that hold one value for the whole cycle
+    metadata_columns = ['time_unit', 'speed_unit', 'vehicle_type']
+    
+    # convert time to second
+    time_conversion_factor = {
+      "second": 1,
+      "millisecond": 0.001,
+      "minute": 60,
+      "hour": 3600
+    }
+    
+    #convert speed to 'meter per second' if it is in another unit
+    speed_conversion_factor = {
+      "meter per second": 1,
+      "kilometer per hour": 0.277778,
+      "mile per hour": 0.44704
+    }
+    
+    # raise ValueError unless every value of units is a known speed unit
+    def check_speed_units (units):
+        
+        unknown = sorted(set(units) - set(Util.speed_conversion_factor), key=str)
+        if unknown:
+            raise ValueError('Unknown speed unit(s) {}. Use one of: {}'.format(
+                ', '.join(map(repr, unknown)), ', '.join(Util.speed_conversion_factor)))
+    
+    
     # Read data with columns 'time' and 'speed'
-    def read_data(excel_file_name, sheet_name):
-        try:
-            df = pd.read_excel(io = excel_file_name,
-                               sheet_name= sheet_name,
-                               header=0)
-        
-            #convert speed to 'meter per second' if it is in another unit
-            conversion_factor_dict = {
-              "meter per second": 1,
-              "kilometer per hour": 0.277778,
-              "mile per hour": 0.44704
-            }
-            
-            conversion_factor = conversion_factor_dict[df.speed_unit[0]]  
-            df.speed = df.speed*conversion_factor
-            
+    def read_data(excel_file_name, sheet_name=None, vehicle_type=None, speed_unit=None, verbose=False):
+        """
+        excel_file_name : name of the input file (excel, csv, parquet, feather/arrow, npy or npz, see Util.loaders),
+                          or a DataFrame with the same columns. A DataFrame is not modified.
+        sheet_name      : name of the sheet, for excel files
+        vehicle_type    : overrides the 'vehicle_type' column
+        speed_unit      : overrides the 'speed_unit' column
+        verbose         : print a message once the data is loaded
+        
+        The speed is converted to meter per second. Raises ValueError if the data cannot be used.
+        """
+        if isinstance(excel_file_name, pd.DataFrame):
+            # shallow copy, so the columns added later do not end up in the caller's DataFrame
+            df = excel_file_name.copy(deep=False)
+            if not df.index.equals(pd.RangeIndex(df.shape[0])):
+                df = df.reset_index(drop=True)
+            owned = False
+        else:
+            extension = Path(str(excel_file_name)).suffix.lower()
+            loader = Util.loaders.get(extension, Util.load_excel if not isinstance(excel_file_name, (str, Path)) else None)
+            if loader is None:
+                raise ValueError('Unsupported input file type {!r}. Supported types are: {}'.format(
+                    extension, ', '.join(sorted(Util.loaders))))
+            df = loader(excel_file_name, sheet_name)
+            owned = True
+        
+        if vehicle_type is not None:
+            df['vehicle_type'] = vehicle_type
+        if speed_unit is not None:
+            df['speed_unit'] = speed_unit
+        
+        missing = [c for c in ['speed', 'speed_unit', 'vehicle_type'] if c not in df.columns]
+        if missing:
+            raise ValueError('UNABLE TO READ THE INPUT DATA: missing column(s) ' + ', '.join(missing) +
+                             '. PLEASE USE THE PROVIDED EXCEL FILE FORMAT.')
+        if df.shape[0] == 0:
+            raise ValueError('UNABLE TO READ THE INPUT DATA: the driving cycle is empty.')
+        Util.check_speed_units([df.speed_unit[0]])
+        
+        # the conversion works in place on a file that was just read
+        conversion_factor = Util.speed_conversion_factor[df.speed_unit[0]]
+        speed = df.speed.to_numpy(dtype=float, copy=not owned)
+        if conversion_factor != 1:
+            if speed.flags.writeable:
+                speed *= conversion_factor
+            else:
+                speed = speed*conversion_factor
+        df['speed'] = speed
+        
+        if verbose:
             print('Loading data was successful\n')
-            return df
+        return df
+    
+    
+    # Resample a driving cycle (as returned by read_data) to the 1 Hz grid of the op_mod rates.
+    # The time is converted to seconds with the time_unit column (or argument). Samples with a
+    # missing time or speed and repeated times are dropped, the rest sorted by time. Gaps longer
+    # than max_gap seconds split the cycle into trips (numbered in a 'trip_id' column); every trip
+    # is then sampled at its whole seconds by linear interpolation of the speed, which decimates
+    # faster loggers and fills the shorter gaps. Other columns take the value of the last sample
+    # at or before each second. Returns the new DataFrame and a report of the sample counts.
+    def resample_1hz (df, max_gap=10, time_unit=None):
+        
+        if 'time' not in df.columns:
+            raise ValueError('UNABLE TO RESAMPLE THE INPUT DATA: missing column time.')
+        if time_unit is None:
+            time_unit = df.time_unit[0] if 'time_unit' in df.columns and pd.notna(df.time_unit[0]) else 'second'
+        if time_unit not in Util.time_conversion_factor:
+            raise ValueError('Unknown time unit {!r}. Use one of: {}'.format(
+                time_unit, ', '.join(Util.time_conversion_factor)))
+        
+        t = pd.to_numeric(df.time, errors='coerce').to_numpy(dtype=float)*Util.time_conversion_factor[time_unit]
+        v = df.speed.to_numpy(dtype=float)
+        valid = np.isfinite(t) & np.isfinite(v)
+        rows = np.flatnonzero(valid)[np.argsort(t[valid], kind='stable')]
+        t, v = t[rows], v[rows]
+        unique = np.ones(t.size, dtype=bool)
+        unique[1:] = t[1:] != t[:-1]
+        rows, t, v = rows[unique], t[unique], v[unique]
+        
+        # trips, and their whole seconds from the first to the last sample
+        split = np.flatnonzero(np.diff(t) > max_gap) + 1
+        starts = np.concatenate([[0], split])
+        ends = np.concatenate([split, [t.size]])
+        first = np.ceil(t[starts]) if t.size else np.zeros(0)
+        n = np.maximum(np.floor(t[ends - 1]) - first + 1, 0).astype(np.intp) if t.size else np.zeros(0, dtype=np.intp)
+        kept = n > 0  # a trip shorter than a second has no whole second
+        first, n = first[kept], n[kept]
+        if n.sum() == 0:
+            raise ValueError('UNABLE TO RESAMPLE THE INPUT DATA: no valid samples spanning a whole second.')
+        
+        trip_id = np.repeat(np.arange(n.size), n)
+        offset = np.concatenate([[0], np.cumsum(n)[:-1]])
+        grid = np.arange(n.sum()) - np.repeat(offset, n) + np.repeat(first, n)
+        
+        # the grid seconds of a trip lie between its own samples, so one interpolation serves all trips
+        speed = np.interp(grid, t, v)
+        last = np.searchsorted(t, grid, side='right') - 1
+        on_sample = t[last] == grid
+        gap = np.diff(t, append=np.inf)[last] > 1
+        
+        out = df.iloc[rows[last]].reset_index(drop=True)
+        out['time'] = grid.astype(np.int64) if np.all(grid == np.round(grid)) else grid
+        out['speed'] = speed
+        out['trip_id'] = trip_id
+        for c in Util.metadata_columns:
+            if c in df.columns:
+                out[c] = df[c][0]
+        if 'time_unit' in out.columns:
+            out['time_unit'] = 'second'
+        
+        used = np.zeros(t.size, dtype=bool)
+        used[last[on_sample]] = True
+        report = {
+            'input_samples'         : int(df.shape[0]),
+            'invalid_dropped'       : int((~valid).sum()),
+            'duplicates_dropped'    : int((~unique).sum()),
+            'off_grid_samples'      : int(t.size - used.sum()),  # only used through the interpolation, or not at all
+            'output_seconds'        : int(grid.size),
+            'filled_seconds'        : int((~on_sample & gap).sum()),  # interpolated across a gap longer than a second
+            'trips'                 : int(n.size),
+            'gaps_split'            : int(split.size),
+            'short_trips_dropped'   : int((~kept).sum()),
+            }
+        return out, report
+    
+    
+    # write a file through a temporary file of its folder renamed into place, so that a reader sees
+    # the old file or the whole new one, never a partial one. write(file) writes to a binary file;
+    # the temporary file (*.tmp) is removed if it fails.
+    def write_atomic (path, write):
         
-        except:
-            print('''** WARNING:
-                  UNABLE TO READ THE INPUT DATA FILE.
-                  PLEASE USE THE PROVIDED EXCEL FILE FORMAT AND
-                  CLOSE THE EXCEL FILE BEFORE RUNNING THE PROGRAM.\n\n\n\n\n''')
+        path = Path(path)
+        fd, temp = tempfile.mkstemp(dir=str(path.parent), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as file:
+                write(file)
+            os.replace(temp, str(path))
+        except BaseException:
+            try:
+                os.remove(temp)
+            except OSError:
+                pass
+            raise
     
     
     #%%
@@ -415,6 +860,40 @@ class Util:
         value = 3785.41/131760
         return value
         
+    #%%
+    # second-by-second acceleration (m/s2) of a 1 Hz speed trace, works on whole arrays
+    def calculate_acceleration (speed):
+        
+        speed = np.asarray(speed, dtype=float)
+        acc = np.zeros_like(speed)
+        acc[1:] = speed[1:] - speed[:-1]
+        
+        return acc
+    
+    
+    #%%
+    # row-by-row reference for calculate_acceleration and calculate_tractive_power,
+    # kept to check the vectorized engine against
+    def reference_kinematics (df, mass, frontal_area, mu_rr, air_density, c_d):
+        
+        acc = []
+        p_tract = []
+        v_0 = df.speed[0]
+        for row in df.itertuples():
+            idx = row.Index
+            v = row.speed
+            
+            if idx == 0:
+                a = 0
+            else:
+                a = v - v_0
+                v_0 = v
+            acc.append(a)
+            p_tract.append(Util.calculate_tractive_power (v, a, mass, frontal_area, mu_rr, air_density, c_d))
+        
+        return np.array(acc, dtype=float), np.array(p_tract, dtype=float)
+    
+    
     #%%
     def calculate_tractive_power (v, a, mass, frontal_area, mu_rr, air_density, c_d):
         
@@ -492,6 +971,289 @@ class Util:
                     
         return op_mod
     
+    #%%
+    # statistics of a 1 Hz driving cycle (speed in m/s, acceleration in m/s2)
+    def cycle_statistics (speed, acc):
+        
+        speed = np.asarray(speed, dtype=float)
+        stats = Util.segment_cycle_statistics(speed, acc, np.zeros(speed.size, dtype=np.intp), 1)
+        
+        return {key: value[0] for key, value in stats.items()}
+    
+    
+    # statistics of many 1 Hz driving cycles at once. speeds is a list of speed
+    # arrays in m/s; returns one row per cycle with the same statistics as Car.
+    def cycle_statistics_batch (speeds):
+        
+        lengths = np.array([len(v) for v in speeds], dtype=np.intp)
+        speed = np.concatenate([np.asarray(v, dtype=float) for v in speeds]) if len(speeds) else np.zeros(0)
+        segment_ids = np.repeat(np.arange(len(speeds)), lengths)
+        
+        # acceleration restarts at zero on the first second of every cycle
+        acc = Util.calculate_acceleration(speed)
+        acc[np.cumsum(lengths)[:-1][lengths[1:] > 0]] = 0
+        
+        stats = Util.segment_cycle_statistics(speed, acc, segment_ids, len(speeds))
+        distance = np.bincount(segment_ids, weights=speed, minlength=len(speeds))/1000
+        
+        with np.errstate(divide='ignore', invalid='ignore'):
+            df = pd.DataFrame(Util.cycle_metrics(stats, distance, lengths, None))
+        df.insert(0, 'travel_time', lengths)
+        
+        return df
+    
+    
+    # vectorized kernel behind cycle_statistics and cycle_statistics_batch.
+    # segment_ids gives the (sorted) cycle number of every second.
+    def segment_cycle_statistics (speed, acc, segment_ids, n_segments):
+        
+        speed = np.asarray(speed, dtype=float)
+        acc = np.asarray(acc, dtype=float)
+        speed_fps = speed*3.28084
+        
+        # A stop is counted when the speed drops below 10 fps after having reached 15 fps.
+        # Keep only the threshold crossings (+1 high, -1 low); a stop is a low that directly
+        # follows a high of the same cycle.
+        event = np.where(speed_fps >= 15, 1, 0) - np.where(speed_fps < 10, 1, 0)
+        crossing = np.flatnonzero(event)
+        event, event_ids = event[crossing], segment_ids[crossing]
+        stop = (event[1:] == -1) & (event[:-1] == 1) & (event_ids[1:] == event_ids[:-1])
+        no_of_stops = np.bincount(event_ids[1:][stop], minlength=n_segments)
+        
+        count = np.bincount(segment_ids, minlength=n_segments)
+        idle_time = np.bincount(segment_ids, weights=speed <= 0.1, minlength=n_segments).astype(int)
+        acc_pos = acc > 0
+        acc_neg = acc < 0
+        acc_time = np.bincount(segment_ids[acc_pos], minlength=n_segments)
+        dec_time = np.bincount(segment_ids[acc_neg], minlength=n_segments)
+        
+        speed_kmph = speed*3.6
+        with np.errstate(divide='ignore', invalid='ignore'):
+            acc_avg = np.bincount(segment_ids[acc_pos], weights=acc[acc_pos], minlength=n_segments)/acc_time
+            dec_avg = np.bincount(segment_ids[acc_neg], weights=acc[acc_neg], minlength=n_segments)/dec_time
+            speed_mean = np.bincount(segment_ids, weights=speed_kmph, minlength=n_segments)/count
+            deviation = speed_kmph - speed_mean[segment_ids]
+            speed_std = np.sqrt(np.bincount(segment_ids, weights=deviation*deviation, minlength=n_segments)/(count - 1))
+        speed_std[count < 2] = np.nan
+        
+        return {
+            'no_of_stops'   : no_of_stops,
+            'idle_time'     : idle_time,
+            'acc_time'      : acc_time,
+            'dec_time'      : dec_time,
+            'acc_avg'       : acc_avg,
+            'dec_avg'       : dec_avg,
+            'speed_std'     : speed_std,
+            }
+    
+    
+    #%%
+    # speed bins (mph, right closed) and VSP bins (kW/ton, left closed) of the
+    # op_mod lookup table used by vsp_to_op_mod_array
+    op_mod_speed_edges = np.array([25, 50])
+    op_mod_vsp_edges   = np.array([0, 3, 6, 9, 12, 18, 24, 30])
+    op_mod_table       = np.array([[11, 12, 13, 14, 15, 16, 16, 16, 16],   # speed <= 25 mph
+                                   [21, 22, 23, 24, 25, 27, 28, 29, 30],   # 25 < speed <= 50 mph
+                                   [33, 33, 33, 35, 35, 37, 38, 39, 40]])  # speed > 50 mph
+    
+    # shift an array by n seconds, filling the first n values with zero
+    def lag (array, n):
+        
+        array = np.asarray(array, dtype=float)
+        lagged = np.zeros_like(array)
+        if n < len(array):
+            lagged[n:] = array[:len(array) - n]
+        
+        return lagged
+    
+    
+    # batch version of vsp_to_op_mod for whole arrays of one driving cycle. It takes no acc_t_1:
+    # the rule of vsp_to_op_mod only reads acc_t and acc_t_2 (see op_mod_classes). When acc_t_2
+    # is not given it is taken from acc_t.
+    def vsp_to_op_mod_array (vsp, speed_t, acc_t, acc_t_2=None):
+        
+        vsp = np.asarray(vsp, dtype=float)
+        if acc_t_2 is None:
+            acc_t_2 = Util.lag(acc_t, 2)
+        
+        fixed_op_mod, speed_bin = Util.op_mod_classes(speed_t, acc_t, acc_t_2)
+        vsp_bin = np.searchsorted(Util.op_mod_vsp_edges, vsp, side='right')
+        op_mod = Util.op_mod_table[speed_bin, vsp_bin]
+        
+        return np.where(fixed_op_mod >= 0, fixed_op_mod, op_mod)
+    
+    
+    # the part of the op_mod that does not depend on the VSP (speed in m/s, accelerations
+    # in m/s2): the op_mod of the braking (0) and idling (1) seconds, -1 elsewhere, and the
+    # speed bin (row of op_mod_table) of every second
+    def op_mod_classes (speed_t, acc_t, acc_t_2):
+        
+        speed_t = Util.mps_to_mph(np.asarray(speed_t, dtype=float))
+        acc_t = Util.mps2_to_mph_per_sec(np.asarray(acc_t, dtype=float))
+        acc_t_2 = np.asarray(acc_t_2, dtype=float)
+        
+        # same comparisons as vsp_to_op_mod, which tests the converted acc_t_2
+        # in place of acc_t_1
+        braking = (acc_t <= -2) | ((acc_t <= -1) & (Util.mps2_to_mph_per_sec(acc_t_2) <= -1) & (acc_t_2 <= -1))
+        idling = speed_t < 1
+        fixed_op_mod = np.where(braking, 0, np.where(idling, 1, -1))
+        
+        speed_bin = np.searchsorted(Util.op_mod_speed_edges, speed_t, side='left')
+        
+        return fixed_op_mod, speed_bin
+    
+    
+    #%%
+    # fixed column order of the pollutants in the emission rate matrix
+    pollutants = ['CO2', 'CO', 'NOx', 'HC', 'PM2.5_elemental_carbon', 'PM2.5_organic_carbon']
+    
+    # compile an emission rate table (op_mod x pollutant DataFrame) into a dense
+    # float array whose row i holds the rates of op_mod code i (NaN for unused codes).
+    # Pollutants come in the order of Util.pollutants, followed by any other
+    # columns of the table.
+    def emission_rate_matrix (df_emission_rate, pollutants=None):
+        
+        if pollutants is None:
+            pollutants = [p for p in Util.pollutants if p in df_emission_rate.columns]
+            pollutants += [p for p in df_emission_rate.columns if p not in pollutants]
+        
+        op_mod = df_emission_rate.index.to_numpy(dtype=int)
+        matrix = np.full((max(op_mod.max() + 1, 41), len(pollutants)), np.nan)
+        matrix[op_mod] = df_emission_rate[pollutants].to_numpy(dtype=float)
+        
+        return list(pollutants), np.ascontiguousarray(matrix)
+    
+    
+    #%%
+    # driving cycle metrics of Car.summary() from the statistics of segment_cycle_statistics, the
+    # distance (km) and the travel time (s). Works on scalars or arrays, rounded like emission_metrics.
+    def cycle_metrics (stats, distance, travel_time, decimals=3):
+        
+        rnd = (lambda x: np.round(x, decimals)) if decimals is not None else (lambda x: x)
+        
+        return {
+            'distance'          : rnd(distance),
+            'average_speed'     : rnd(distance/(travel_time/3600)),
+            'speed_std'         : rnd(stats['speed_std']),
+            'no_of_stops_per_km': rnd(stats['no_of_stops']/distance),
+            'acc_avg'           : rnd(stats['acc_avg']),
+            'dec_avg'           : rnd(stats['dec_avg']),
+            'acc_mode'          : rnd(stats['acc_time']*100/travel_time),
+            'dec_mode'          : rnd(stats['dec_time']*100/travel_time),
+            'idling_mode'       : rnd(stats['idle_time']*100/travel_time),
+            }
+    
+    
+    # gasoline vehicle metrics from the total tailpipe emissions (grams) and the distance (km).
+    # Works on scalars or arrays; with decimals set, every step is rounded like the GV methods.
+    def emission_metrics (CO2, CO, NOx, HC, distance, well_to_tank_CO2_emission_factor, decimals=3):
+        
+        rnd = (lambda x: np.round(x, decimals)) if decimals is not None else (lambda x: x)
+        CO2 = rnd(CO2)
+        CO  = rnd(CO)
+        NOx = rnd(NOx)
+        HC  = rnd(HC)
+        
+        fuel = rnd(Util.fuel_burnt(CO2, CO, NOx))
+        well_to_pump_CO2 = rnd(fuel*34.2*well_to_tank_CO2_emission_factor/1000)
+        well_to_wheel_CO2 = rnd(CO2 + well_to_pump_CO2)
+        
+        return {
+            'pump_to_wheel_CO2'         : CO2,
+            'pump_to_wheel_CO'          : CO,
+            'pump_to_wheel_NOx'         : NOx,
+            'pump_to_wheel_HC'          : HC,
+            'pump_to_wheel_CO2_per_km'  : rnd(CO2/distance),
+            'pump_to_wheel_CO_per_km'   : rnd(CO/distance),
+            'pump_to_wheel_NOx_per_km'  : rnd(NOx/distance),
+            'pump_to_wheel_HC_per_km'   : rnd(HC/distance),
+            'fuel_burnt'                : fuel,
+            'mpg'                       : rnd((distance/1.60934)/(fuel/3785.412)),
+            'well_to_pump_CO2'          : well_to_pump_CO2,
+            'well_to_wheel_CO2'         : well_to_wheel_CO2,
+            'well_to_wheel_CO2_per_km'  : rnd(well_to_wheel_CO2/distance),
+            }
+    
+    
+    # fuel burnt in ml, from the carbon balance of the tailpipe emissions (grams)
+    def fuel_burnt (CO2, CO, NOx):
+        
+        density = 750
+        W_c = 0.866
+        
+        return (0.866*NOx + 0.429*CO + 0.273*CO2)*1000/(density*W_c)
+    
+    
+    #%%
+    # sums of the rows of values (1-d or 2-d) by segment, segment_ids being integers below n_segments
+    def segment_sums (values, segment_ids, n_segments):
+        
+        values = np.asarray(values, dtype=float)
+        if values.ndim == 1:
+            return np.bincount(segment_ids, weights=values, minlength=n_segments)
+        
+        return np.stack([np.bincount(segment_ids, weights=values[:, j], minlength=n_segments)
+                         for j in range(values.shape[1])], axis=1).reshape(n_segments, values.shape[1])
+    
+    # sums of the rows of values over the window of the last `window` rows, from a cumulative sum
+    def rolling_sums (values, window):
+        
+        if int(window) < 1:
+            raise ValueError('window must be a positive number of rows, not {!r}'.format(window))
+        values = np.asarray(values, dtype=float)
+        cumsum = np.zeros((values.shape[0] + 1,) + values.shape[1:])
+        np.cumsum(values, axis=0, out=cumsum[1:])
+        start = np.maximum(np.arange(1, values.shape[0] + 1) - int(window), 0)
+        
+        return cumsum[1:] - cumsum[start]
+    
+    
+    #%%
+    # number of seconds spent in each op_mod code
+    def op_mod_histogram (op_mod, minlength=41):
+        
+        return np.bincount(np.asarray(op_mod, dtype=np.intp), minlength=minlength)
+    
+    # total emission of every pollutant from an op_mod histogram and an emission rate matrix
+    def emission_totals (op_mod_counts, emission_rate):
+        
+        used = op_mod_counts > 0
+        
+        return op_mod_counts[used] @ emission_rate[:len(op_mod_counts)][used]
+    
+    # op_mod histograms of many rows at once, from one bincount over offset codes: op_mod is 2-d
+    # (the seconds of one histogram per row), or 1-d with the row of every second in rows
+    def op_mod_histograms (op_mod, minlength=41, rows=None, n_rows=None):
+        
+        op_mod = np.asarray(op_mod, dtype=np.intp)
+        if rows is None:
+            n_rows = op_mod.shape[0]
+            rows = np.arange(n_rows)[:, None]
+        codes = (np.asarray(rows, dtype=np.intp)*minlength + op_mod).ravel()
+        
+        return np.bincount(codes, minlength=n_rows*minlength).reshape(n_rows, minlength)
+    
+    # total emission of every pollutant of many op_mod histograms (rows x codes), each with its own
+    # emission rate matrix (rows x codes x pollutants); the NaN rates of unused codes count as zero
+    def emission_totals_batch (op_mod_counts, emission_rate):
+        
+        return np.einsum('rk,rkp->rp', op_mod_counts, np.nan_to_num(emission_rate[:, :op_mod_counts.shape[1]]))
+    
+    # emission rate matrices of rate tables, with the pollutants in the given order, stacked into
+    # one (table x op_mod x pollutant) array; op_mod codes are below 41
+    def stack_emission_rates (tables, pollutants):
+        
+        return np.stack([table.emission_rate[:41, [table.pollutants.index(p) for p in pollutants]] for table in tables]
+                        ) if len(tables) else np.zeros((0, 41, len(pollutants)))
+    
+    
+    #%%
+    # emission rate table (op_mod x pollutant) of a vehicle type, from the process-wide rate_tables
+    def load_emission_rate (vehicle_type):
+        
+        return rate_tables.get(vehicle_type).df_emission_rate
+    
+    
     #%%
     def op_mod_to_emission_rate (df_emission_rate, op_mod, pollutant_name):
         
@@ -552,10 +1314,147 @@ class Util:
         sys.stdout.write(text)
         sys.stdout.flush()
      
+#------------------------------------------------------------------------------
+# emission rate table of a vehicle type: the DataFrame read from 'db.pkl', its
+# compiled (read-only) op_mod x pollutant matrix and the VSP coefficients A, B, C, f
+RateTable = namedtuple('RateTable', ['df_emission_rate', 'pollutants', 'emission_rate', 'vsp_coeff'])
+
+
+# process-wide, lazily loaded cache of the rate tables
+class RateTables:
+
+    vehicle_types = ['Passenger car', 'SUV', 'Passenger truck', 'Light commercial truck']
+    
+    # dimensions of a rate store that select among the tables of a vehicle type, see get()
+    conditions = ['model_year_group', 'fuel', 'ambient']
+
+    def __init__(self, db_path = None):
+        """
+        db_path : path of the rate database. By default a 'db.pkl' in the current working directory
+                  is used if there is one, otherwise the 'db.pkl' installed with the package.
+                  The path is resolved once, on first use.
+                  It can also be the folder of a memory-mapped rate store (see pyemission.ratestore),
+                  with tables by vehicle type, model year group, fuel and ambient conditions.
+        """
+        self._db_path = db_path
+        self._db = None
+        self._store = None
+        self._version = None
+        self._tables = {}
+        self._lock = threading.RLock()
+
+    def db_path(self):
+        with self._lock:
+            if self._db_path is None:
+                if Path('db.pkl').is_file(): # check if the file exists in the current directory
+                    self._db_path = Path('db.pkl').resolve()
+                else:
+                    self._db_path = Path(__file__).resolve().parent / 'db.pkl'
+            return self._db_path
+
+    def use(self, db_path):
+        """
+        Switch to another rate database or rate store; the tables are loaded again on next use
+        """
+        with self._lock:
+            self.clear()
+            self._db_path = db_path
+
+    # the RateStore when db_path is the folder of a rate store, otherwise None
+    def store(self):
+        with self._lock:
+            if self._store is None and Path(self.db_path()).is_dir():
+                from pyemission.ratestore import RateStore
+                self._store = RateStore(self.db_path())
+            return self._store
+
+    def version(self):
+        """
+        Return a short hash of the rate database, which changes with its content
+        """
+        with self._lock:
+            if self._version is None and self.store() is not None:
+                self._version = self.store().version
+            if self._version is None:
+                self._version = hashlib.sha256(Path(self.db_path()).read_bytes()).hexdigest()[:16]
+            return self._version
+
+    # position of the table of a vehicle type in 'db.pkl'
+    def db_index(self, vehicle_type):
+        return 0 if vehicle_type == 'Light commercial truck' else 1
+
+    def get(self, vehicle_type, model_year_group = None, fuel = None, ambient = None):
+        """
+        Return the RateTable of a vehicle type, loading 'db.pkl' the first time it is needed.
+        model_year_group, fuel and ambient select among the tables of a rate store (their default
+        values when left to None); 'db.pkl' has one table per vehicle type only.
+        """
+        conditions = (model_year_group, fuel, ambient)
+        key = vehicle_type if conditions == (None, None, None) else (vehicle_type,) + conditions
+        table = self._tables.get(key)
+        if table is not None:
+            return table
+        
+        with self._lock:
+            store = self.store()
+            if key not in self._tables and store is not None:
+                # views of the mapped store: only the pages of the tables used are read
+                self._tables[key] = RateTable(store.df_emission_rate(vehicle_type, *conditions), list(store.pollutants),
+                                              store.emission_rate(vehicle_type, *conditions), Util.vsp_coeff(vehicle_type))
+            elif key not in self._tables:
+                if key != vehicle_type:
+                    raise ValueError("{} has one table per vehicle type; model_year_group, fuel and ambient "
+                                     "need a rate store (see pyemission.ratestore)".format(self.db_path()))
+                if self._db is None:
+                    with open(self.db_path(), 'rb') as file:
+                        self._db = pickle.load(file)
+                
+                # vehicle types sharing a table also share its compiled matrix
+                index = self.db_index(vehicle_type)
+                shared = [t for v, t in self._tables.items() if self.db_index(v) == index]
+                if shared:
+                    df_emission_rate, pollutants, emission_rate = shared[0][:3]
+                else:
+                    df_emission_rate = self._db[index]
+                    pollutants, emission_rate = Util.emission_rate_matrix(df_emission_rate)
+                    emission_rate.setflags(write=False)
+                self._tables[vehicle_type] = RateTable(df_emission_rate, pollutants, emission_rate,
+                                                       Util.vsp_coeff(vehicle_type))
+            return self._tables[key]
+
+    def warm_up(self, vehicle_types = None):
+        """
+        Load the tables of the given vehicle types (all of them by default), e.g. in a parent process
+        before it starts its workers, so they do not each pay for loading them.
+        """
+        for vehicle_type in (self.vehicle_types if vehicle_types is None else vehicle_types):
+            self.get(vehicle_type)
+
+    def clear(self):
+        """
+        Drop the loaded tables; they are loaded again on next use
+        """
+        with self._lock:
+            self._db = None
+            self._store = None
+            self._version = None
+            self._tables = {}
+
+
+rate_tables = RateTables()
+
+
+def warm_up(vehicle_types = None):
+    """
+    Load the emission rate tables of the process, see RateTables.warm_up
+    """
+    rate_tables.warm_up(vehicle_types)
+
+     
 #------------------------------------------------------------------------------
 if __name__ == '__main__':    
     
-    g = GV("Data.xlsx", "Driving cycle", mass=2850)
+    g = GV("Data.xlsx", "Driving cycle", mass=2850, verbose=True)
     
     g.plot_driving_cycle()
     g.plot_tractive_power()
@@ -0,0 +1,168 @@
+import argparse
+import hashlib
+import json
+import pickle
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from pyemission.pyemission import Util
+
+
+# layout of the store files; a store of another format is refused
+FORMAT = 1
+
+# dimensions of the index, in the order of the keys
+DIMENSIONS = ['source_type', 'model_year_group', 'fuel', 'ambient']
+
+# values of the dimensions left out of a lookup, and of the tables converted from 'db.pkl'
+DEFAULTS = {'model_year_group': 'all', 'fuel': 'gasoline', 'ambient': 'standard'}
+
+
+# read-only, memory-mapped store of many emission rate tables
+class RateStore:
+
+    def __init__(self, directory):
+        """
+        directory : folder of the store, written by RateStore.build or RateStore.convert. It holds
+                    rates-<version>.npy, every (op_mod x pollutant) table stacked in one float64 array,
+                    and index.json, the position of each table by (source_type, model_year_group, fuel,
+                    ambient) and the name of the rates file.
+
+        The rates file is memory mapped read-only: opening the store reads the index only, a table is a view
+        whose pages are read from disk when first used, and the processes using the store share these
+        pages through the page cache instead of each holding a copy.
+        """
+        self.directory = Path(directory)
+        with open(self.directory / 'index.json') as file:
+            index = json.load(file)
+        if index.get('format') != FORMAT:
+            raise ValueError('{} is a rate store of format {}, this version of pyemission reads format {}'
+                             .format(self.directory, index.get('format'), FORMAT))
+
+        self.version = index['version']
+        self.pollutants = index['pollutants']
+        self.op_mod = index['op_mod']
+        self.defaults = index['defaults']
+        self._positions = {tuple(entry[:-1]): entry[-1] for entry in index['tables']}
+        self._rates = np.load(self.directory / index['rates'], mmap_mode='r')
+
+    def key(self, source_type, model_year_group = None, fuel = None, ambient = None):
+        """
+        Return the index key of a table, with the default value of the dimensions left to None
+        """
+        values = {'model_year_group': model_year_group, 'fuel': fuel, 'ambient': ambient}
+        return (source_type,) + tuple(self.defaults[d] if values[d] is None else values[d] for d in DIMENSIONS[1:])
+
+    def keys(self):
+        return list(self._positions)
+
+    def __len__(self):
+        return len(self._positions)
+
+    def __contains__(self, key):
+        return tuple(key) in self._positions
+
+    def emission_rate(self, source_type, model_year_group = None, fuel = None, ambient = None):
+        """
+        Return the (op_mod x pollutant) emission rate matrix of a table as a read-only view of the store,
+        in the layout of Util.emission_rate_matrix (row i is op_mod i, NaN where the op_mod has no rate)
+        """
+        key = self.key(source_type, model_year_group, fuel, ambient)
+        position = self._positions.get(key)
+        if position is None:
+            raise ValueError('No emission rate table for {} in {}'.format(dict(zip(DIMENSIONS, key)), self.directory))
+        return np.asarray(self._rates[position])
+
+    def df_emission_rate(self, source_type, model_year_group = None, fuel = None, ambient = None):
+        """
+        Return a table as a DataFrame indexed by op_mode, like the tables of 'db.pkl'
+        """
+        rates = self.emission_rate(source_type, model_year_group, fuel, ambient)
+        df = pd.DataFrame(rates[self.op_mod], index=pd.Index(self.op_mod, name='op_mode'), columns=self.pollutants)
+        return df
+
+
+    @staticmethod
+    def build(directory, tables, defaults = None):
+        """
+        Write a store from a dictionary {(source_type, model_year_group, fuel, ambient): DataFrame}, the
+        DataFrames in the format of 'db.pkl' (op_mode index, one column per pollutant). Keys sharing the
+        same DataFrame object share one table in the store. Returns the RateStore.
+
+        An existing store in directory is replaced: the rates file is named after the version of its
+        content and the index is written last, so a reader opening the store while it is rewritten sees
+        either the old or the new one. The rates files of older versions are then removed (on POSIX,
+        the processes that have them mapped keep reading them).
+        """
+        directory = Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+        defaults = dict(DEFAULTS if defaults is None else defaults)
+        frames = list({id(df): df for df in tables.values()}.values())
+        if not frames:
+            raise ValueError('No emission rate tables to write')
+        if any(len(key) != len(DIMENSIONS) for key in tables):
+            raise ValueError('The keys of the tables must be ({})'.format(', '.join(DIMENSIONS)))
+
+        # one pollutant order and one set of op_mod rows for every table
+        pollutants = [p for p in Util.pollutants if any(p in df.columns for df in frames)]
+        pollutants += list(dict.fromkeys(p for df in frames for p in df.columns if p not in pollutants))
+        op_mod = sorted(set(int(i) for df in frames for i in df.index))
+        matrices = [Util.emission_rate_matrix(df.reindex(columns=pollutants), pollutants)[1] for df in frames]
+        size = max(len(matrix) for matrix in matrices)
+        rates = np.full((len(matrices), size, len(pollutants)), np.nan)
+        for i, matrix in enumerate(matrices):
+            rates[i, :len(matrix)] = matrix
+
+        position = {id(df): i for i, df in enumerate(frames)}
+        entries = [list(key) + [position[id(tables[key])]] for key in sorted(tables)]
+
+        digest = hashlib.sha256(rates.tobytes())
+        digest.update(json.dumps([pollutants, entries]).encode())
+        version = digest.hexdigest()[:16]
+        index = {'format': FORMAT, 'version': version, 'rates': 'rates-{}.npy'.format(version), 'dimensions': DIMENSIONS,
+                 'defaults': defaults, 'pollutants': pollutants, 'op_mod': op_mod, 'tables': entries}
+
+        Util.write_atomic(directory / index['rates'], lambda file: np.save(file, rates))
+        Util.write_atomic(directory / 'index.json', lambda file: file.write(json.dumps(index, indent=1).encode()))
+        for path in directory.glob('rates-*.npy'):
+            if path.name != index['rates']:
+                try:
+                    path.unlink()
+                except OSError:  # still open on Windows
+                    pass
+        return RateStore(directory)
+
+    @staticmethod
+    def convert(db_path, directory, vehicle_types = None):
+        """
+        Write a store from a 'db.pkl' rate database, one key per vehicle type (all of them by default)
+        with the default model year group, fuel and ambient conditions. The vehicle types reading the
+        same table of 'db.pkl' (see RateTables.db_index) share it in the store. Returns the RateStore.
+        """
+        from pyemission.pyemission import RateTables
+
+        with open(db_path, 'rb') as file:
+            db = pickle.load(file)
+        vehicle_types = RateTables.vehicle_types if vehicle_types is None else vehicle_types
+        db_index = RateTables().db_index
+        tables = {(vehicle_type, DEFAULTS['model_year_group'], DEFAULTS['fuel'], DEFAULTS['ambient']): db[db_index(vehicle_type)]
+                  for vehicle_type in vehicle_types}
+        return RateStore.build(directory, tables)
+
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(prog='python -m pyemission.ratestore',
+                                     description="Convert a 'db.pkl' rate database to a memory-mapped rate store.")
+    parser.add_argument('db', help="path of the 'db.pkl' file")
+    parser.add_argument('directory', help='folder of the store, created if needed')
+    args = parser.parse_args(argv)
+
+    store = RateStore.convert(args.db, args.directory)
+    print('{} tables, {} keys, version {}'.format(store._rates.shape[0], len(store), store.version))
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,163 @@
+import numpy as np
+import pandas as pd
+
+from pyemission.pyemission import Util, rate_tables
+
+
+# vehicle parameters that can be perturbed, with the GV defaults
+PARAMETERS = {'mass': 1500, 'frontal_area': 2.27, 'mu_rr': 0.0127, 'air_density': 1.18, 'c_d': 0.28}
+
+# metrics summarized by describe()
+METRICS = ['pump_to_wheel_CO2', 'fuel_burnt', 'mpg', 'well_to_wheel_CO2', 'tractive_energy']
+
+
+# many parameter draws of one vehicle evaluated against one driving cycle
+class Sensitivity:
+
+    def __init__(self,
+                 speed,
+                 vehicle_type = 'Passenger car',
+                 mass = 1500,
+                 frontal_area = 2.27,
+                 mu_rr = 0.0127,
+                 air_density = 1.18,
+                 c_d = 0.28,
+                 well_to_tank_CO2_emission_factor = 16.79,
+                 chunk_size = 2**22,
+                 model_year_group = None,
+                 fuel = None,
+                 ambient = None
+                 ):
+
+        """
+        Everything that does not depend on the vehicle parameters is computed once here: the acceleration,
+        the speed bin and the idling/braking flags of every second, the road load part of the VSP and the
+        sums behind the tractive energy. A draw then only costs its own VSP and op_mod lookup.
+
+        speed                            (array)   : second-by-second speed of the driving cycle in meter per second
+        vehicle_type                     (string)  : 'Passenger car', 'SUV', 'Passenger truck' or 'Light commercial truck'
+        mass, frontal_area, mu_rr,
+        air_density, c_d                 (numeric) : nominal vehicle parameters, the same as for GV
+        well_to_tank_CO2_emission_factor (numeric) : typical value is 16.79 gm/MJ
+        chunk_size                       (integer) : maximum number of (draw, second) values held in memory at once
+        model_year_group,
+        fuel, ambient                    (string)  : select the emission rate table among those of the vehicle type in a rate store
+                                                     (see RateTables.get); the defaults of the store when None
+
+        Only the mass enters the VSP, so it alone moves the emissions; the other parameters change
+        the tractive energy.
+        """
+
+        self.vehicle_type = vehicle_type
+        self.nominal = {'mass': mass, 'frontal_area': frontal_area, 'mu_rr': mu_rr, 'air_density': air_density, 'c_d': c_d}
+        self.well_to_tank_CO2_emission_factor = well_to_tank_CO2_emission_factor
+        self.chunk_size = chunk_size
+
+        # kinematics
+        self.speed = np.asarray(speed, dtype=float)
+        self.acc = Util.calculate_acceleration(self.speed)
+        self.t = self.speed.size
+        self.d = self.speed.sum()/1000
+
+        # op_mod of the idling and braking seconds (-1 elsewhere) and speed bin of every second
+        self.fixed_op_mod, self.speed_bin = Util.op_mod_classes(self.speed, self.acc, Util.lag(self.acc, 2))
+
+        # VSP = (road load + mass*acc*speed)/f, with the road load of the vehicle type
+        table = rate_tables.get(vehicle_type, model_year_group, fuel, ambient)
+        A, B, C, self.f = table.vsp_coeff
+        v = self.speed
+        self.road_load = A*v + B*v**2 + C*v**3
+        self.pollutants = list(Util.pollutants)
+        self.emission_rate = np.nan_to_num(Util.stack_emission_rates([table], self.pollutants)[0])
+
+        # the tractive power is linear in mass, mass*mu_rr and air_density*c_d*frontal_area
+        self.sum_acc_speed = (self.acc*v).sum()
+        self.sum_speed = v.sum()
+        self.sum_speed_cubed = (v**3).sum()
+
+
+    @classmethod
+    def from_excel(cls, excel_file_name = 'Data.xlsx', sheet_name = 'Driving cycle', **params):
+        """
+        Build a Sensitivity from the driving cycle of an excel sheet in the GV format.
+        The vehicle type of the sheet is used unless vehicle_type is given.
+        """
+        df = Util.read_data(excel_file_name, sheet_name)
+        params.setdefault('vehicle_type', df.vehicle_type[0])
+        return cls(df.speed.to_numpy(dtype=float), **params)
+
+
+    def draws(self, n, relative_std = 0.05, seed = None):
+        """
+        Return n random draws of the vehicle parameters, normally distributed around the nominal values.
+
+        relative_std : standard deviation as a fraction of the nominal value, one value for every parameter
+                       or a dictionary by parameter (parameters left out are not perturbed)
+        seed         : seed of the random generator
+        """
+        rng = np.random.default_rng(seed)
+        if not isinstance(relative_std, dict):
+            relative_std = dict.fromkeys(PARAMETERS, relative_std)
+        unknown = [p for p in relative_std if p not in PARAMETERS]
+        if unknown:
+            raise ValueError('Unknown parameter(s) {}. Use some of: {}'.format(', '.join(map(repr, unknown)), ', '.join(PARAMETERS)))
+
+        return pd.DataFrame({p: value*(1 + relative_std.get(p, 0)*rng.standard_normal(n)) if relative_std.get(p, 0)
+                             else np.full(n, float(value)) for p, value in self.nominal.items()})
+
+
+    def op_mod_counts(self, mass):
+        """
+        Return the number of seconds spent in each op_mod code, one row per mass (kg)
+        """
+        mass = np.atleast_1d(np.asarray(mass, dtype=float))
+        n_codes = len(self.emission_rate)
+        counts = np.zeros((mass.size, n_codes), dtype=np.int64)
+        step = max(1, self.chunk_size//max(self.t, 1))
+        for start in range(0, mass.size, step):
+            draws = slice(start, min(start + step, mass.size))
+            M = mass[draws, None]/1000  # unit: ton
+            vsp = (self.road_load + M*self.acc*self.speed)/self.f
+            op_mod = Util.op_mod_table[self.speed_bin, np.searchsorted(Util.op_mod_vsp_edges, vsp, side='right')]
+            op_mod = np.where(self.fixed_op_mod >= 0, self.fixed_op_mod, op_mod)
+            counts[draws] = Util.op_mod_histograms(op_mod, n_codes)
+        return counts
+
+    def evaluate(self, draws, decimals = None):
+        """
+        Return the draws (a DataFrame or dictionary of parameter arrays, missing parameters take the nominal
+        value) with their GV metrics and the net tractive energy at the wheels in kWh. Unrounded by default.
+        """
+        draws = pd.DataFrame(draws).reset_index(drop=True)
+        for p, value in self.nominal.items():
+            if p not in draws.columns:
+                draws[p] = float(value)
+
+        emission = self.op_mod_counts(draws.mass.to_numpy(dtype=float)) @ self.emission_rate
+        emission = dict(zip(self.pollutants, emission.T))
+        metrics = Util.emission_metrics(emission['CO2'], emission['CO'], emission['NOx'], emission['HC'],
+                                        self.d, self.well_to_tank_CO2_emission_factor, decimals)
+
+        mass = draws.mass.to_numpy(dtype=float)
+        energy = (mass*self.sum_acc_speed + mass*draws.mu_rr.to_numpy(dtype=float)*9.81*self.sum_speed
+                  + 0.5*draws.air_density.to_numpy(dtype=float)*draws.c_d.to_numpy(dtype=float)
+                  *draws.frontal_area.to_numpy(dtype=float)*self.sum_speed_cubed)
+        metrics['tractive_energy'] = Util.joule_to_kwh(energy)
+        return pd.concat([draws, pd.DataFrame(metrics)], axis=1)
+
+    def run(self, n = 10000, relative_std = 0.05, seed = None, quantiles = (0.05, 0.25, 0.5, 0.75, 0.95)):
+        """
+        Monte Carlo analysis: evaluate n random draws (see draws) and return their distribution (see describe)
+        """
+        return Sensitivity.describe(self.evaluate(self.draws(n, relative_std, seed)), quantiles)
+
+    @staticmethod
+    def describe(results, quantiles = (0.05, 0.25, 0.5, 0.75, 0.95), metrics = METRICS):
+        """
+        Return the mean, standard deviation and quantiles of the metrics of evaluated draws, one row per metric
+        """
+        values = results[list(metrics)]
+        summary = pd.DataFrame({'mean': values.mean(), 'std': values.std()})
+        for q in quantiles:
+            summary['q{:g}'.format(100*q)] = values.quantile(q)
+        return summary
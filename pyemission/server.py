@@ -0,0 +1,382 @@
+"""
+Scoring service: an asyncio server that takes speed traces with their vehicle parameters, one JSON
+object per line, collects concurrent requests into micro-batches evaluated together by the Trips
+engine, and answers with the GV summary of every trip.
+
+    python -m pyemission.server [--host 127.0.0.1] [--port 8765 | --path SOCKET] [--processes N]
+
+Request : {"id": 1, "speed": [...], "speed_unit": "meter per second", "vehicle_type": "Passenger car",
+           "mass": 1500, "frontal_area": 2.27, "mu_rr": 0.0127, "air_density": 1.18, "c_d": 0.28,
+           "well_to_tank_CO2_emission_factor": 16.79}      (everything but speed is optional)
+          {"id": 2, "op": "stats"}                          (counters of the server)
+Response: {"id": 1, "result": {...}} or {"id": 1, "error": "..."}; responses can come out of order.
+"""
+import argparse
+import asyncio
+import json
+import math
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from pyemission.pyemission import RateTables, Util, warm_up
+from pyemission.trips import TRIP_PARAMETERS, Trips
+
+
+# defaults of the optional request fields, the same as GV
+DEFAULTS = {'vehicle_type': 'Passenger car', 'speed_unit': 'meter per second', 'mass': 1500, 'frontal_area': 2.27,
+            'mu_rr': 0.0127, 'air_density': 1.18, 'c_d': 0.28, 'well_to_tank_CO2_emission_factor': 16.79}
+
+
+# evaluate a micro-batch of requests (dictionaries) and return one response body per request
+def score_batch(requests):
+    responses = [None]*len(requests)
+    valid = []
+    for i, request in enumerate(requests):
+        try:
+            valid.append((i, validate_request(request)))
+        except (ValueError, TypeError) as e:
+            responses[i] = {'error': str(e)}
+    if not valid:
+        return responses
+
+    # one long table for the whole batch, the position of the request being the trip id
+    lengths = [request['speed'].size for _, request in valid]
+    table = {'trip_id': np.repeat(np.arange(len(valid)), lengths),
+             'speed': np.concatenate([request['speed'] for _, request in valid])}
+    for name, default in DEFAULTS.items():
+        table[name] = np.repeat([request.get(name, default) for _, request in valid], lengths)
+    totals = Trips(pd.DataFrame(table), group_by='trip_id').totals()
+
+    for (i, _), row in zip(valid, totals.drop(columns='trip_id').to_dict('records')):
+        responses[i] = {'result': {k: to_json(v) for k, v in row.items()}}
+    return responses
+
+
+# check a request and return it with the speed as a float array
+def validate_request(request):
+    if not isinstance(request, dict):
+        raise TypeError('a request must be a JSON object')
+    speed = np.asarray(request.get('speed', []), dtype=float)
+    if speed.ndim != 1 or speed.size == 0:
+        raise ValueError("'speed' must be a non-empty list of numbers")
+    if not np.isfinite(speed).all():
+        raise ValueError("'speed' must only hold finite numbers")
+
+    request = dict(request, speed=speed)
+    if request.get('vehicle_type', 'Passenger car') not in RateTables.vehicle_types:
+        raise ValueError('Unknown vehicle type {!r}. Use one of: {}'.format(
+            request['vehicle_type'], ', '.join(RateTables.vehicle_types)))
+    Util.check_speed_units([request.get('speed_unit', 'meter per second')])
+    for name in TRIP_PARAMETERS:
+        if name in request:
+            request[name] = float(request[name])
+    return request
+
+
+# plain python value for json, NaN and infinities as null
+def to_json(value):
+    value = value.item() if isinstance(value, np.generic) else value
+    if isinstance(value, float) and not math.isfinite(value):
+        return None
+    return value
+
+
+# asyncio micro-batching server
+class ScoringServer:
+
+    def __init__(self,
+                 max_batch_size = 64,
+                 max_batch_delay = 0.005,
+                 max_pending = 1024,
+                 max_request_bytes = 2**24,
+                 processes = 0
+                 ):
+        """
+        max_batch_size    : largest number of requests evaluated together
+        max_batch_delay   : longest time (s) the first request of a batch waits for others to join it
+        max_pending       : number of requests waiting for a batch beyond which the server stops reading
+                            from its clients (backpressure)
+        max_request_bytes : size limit of a request line; a client sending a longer one gets an error
+                            and is disconnected
+        processes         : number of worker processes evaluating batches in parallel. With 0, the batches
+                            are evaluated one at a time in a thread of this process.
+        """
+        self.max_batch_size = max_batch_size
+        self.max_batch_delay = max_batch_delay
+        self.max_pending = max_pending
+        self.max_request_bytes = max_request_bytes
+        self.processes = processes
+
+        self.counters = {'connections': 0, 'requests': 0, 'errors': 0, 'rejected': 0, 'batches': 0, 'samples': 0}
+        self.latencies = deque(maxlen=10000)  # seconds, of the last requests
+        self.address = None
+        self._server = None
+        self._queue = None
+        self._workers = []
+        self._executor = None
+        self._started = None
+
+
+    async def start(self, host = '127.0.0.1', port = 0, path = None):
+        """
+        Listen on a TCP port (0 picks a free one, see self.address) or on a Unix socket path
+        """
+        warm_up()
+        self._queue = asyncio.Queue(maxsize=self.max_pending)
+        if self.processes:
+            self._executor = ProcessPoolExecutor(max_workers=self.processes)
+        self._workers = [asyncio.ensure_future(self._batcher()) for _ in range(max(1, self.processes))]
+
+        if path is not None:
+            self._server = await asyncio.start_unix_server(self._handle, path=path, limit=self.max_request_bytes)
+            self.address = path
+        else:
+            self._server = await asyncio.start_server(self._handle, host, port, limit=self.max_request_bytes)
+            self.address = self._server.sockets[0].getsockname()[:2]
+        self._started = time.monotonic()
+        return self
+
+    async def close(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+    async def serve_forever(self, host = '127.0.0.1', port = 8765, path = None):
+        await self.start(host, port, path)
+        try:
+            await self._server.serve_forever()
+        finally:
+            await self.close()
+
+    async def __aenter__(self):
+        return await self.start()
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+
+    def stats(self):
+        """
+        Return the counters of the server, the request latency (s) and the throughput (requests/s)
+        """
+        stats = dict(self.counters)
+        elapsed = time.monotonic() - self._started if self._started is not None else 0
+        latencies = np.array(self.latencies)
+        stats.update({
+            'pending'               : self._queue.qsize() if self._queue is not None else 0,
+            'mean_batch_size'       : stats['requests']/stats['batches'] if stats['batches'] else 0,
+            'requests_per_second'   : stats['requests']/elapsed if elapsed else 0,
+            'samples_per_second'    : stats['samples']/elapsed if elapsed else 0,
+            'latency_mean'          : float(latencies.mean()) if latencies.size else None,
+            'latency_p50'           : float(np.percentile(latencies, 50)) if latencies.size else None,
+            'latency_p99'           : float(np.percentile(latencies, 99)) if latencies.size else None,
+            'latency_max'           : float(latencies.max()) if latencies.size else None,
+            })
+        return stats
+
+
+    # collect requests into micro-batches and evaluate them
+    async def _batcher(self):
+        loop = asyncio.get_event_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.max_batch_delay
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            requests = [request for request, _, _ in batch]
+            try:
+                responses = await loop.run_in_executor(self._executor, score_batch, requests)
+            except Exception as e:
+                responses = [{'error': '{}: {}'.format(type(e).__name__, e)} for _ in batch]
+
+            self.counters['batches'] += 1
+            now = time.monotonic()
+            for (request, future, received), response in zip(batch, responses):
+                self.counters['requests'] += 1
+                if 'error' in response:
+                    self.counters['errors'] += 1
+                else:
+                    self.counters['samples'] += len(request.get('speed', ()))
+                self.latencies.append(now - received)
+                if not future.done():
+                    future.set_result(response)
+
+    # one client connection: read requests, queue them, write the responses as they are ready
+    async def _handle(self, reader, writer):
+        self.counters['connections'] += 1
+        lock = asyncio.Lock()
+        pending = set()
+
+        async def respond(request_id, body):
+            # a copy: the body may be shared with other requests
+            body = dict(body, id=request_id)
+            async with lock:
+                writer.write(json.dumps(body).encode() + b'\n')
+                await writer.drain()
+
+        async def answer(request_id, future):
+            try:
+                await respond(request_id, await future)
+            except (ConnectionError, asyncio.CancelledError):
+                pass
+
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except (ValueError, asyncio.LimitOverrunError):
+                    self.counters['rejected'] += 1
+                    await respond(None, {'error': 'request larger than {} bytes'.format(self.max_request_bytes)})
+                    break
+                if not line:
+                    break
+                if not line.strip():
+                    continue
+
+                try:
+                    request = json.loads(line)
+                except ValueError as e:
+                    self.counters['rejected'] += 1
+                    await respond(None, {'error': 'invalid JSON: {}'.format(e)})
+                    continue
+                request_id = request.get('id') if isinstance(request, dict) else None
+                if isinstance(request, dict) and request.get('op') == 'stats':
+                    await respond(request_id, {'result': self.stats()})
+                    continue
+
+                # waits while max_pending requests are queued, which stops reading from this client
+                future = asyncio.get_event_loop().create_future()
+                await self._queue.put((request, future, time.monotonic()))
+                task = asyncio.ensure_future(answer(request_id, future))
+                pending.add(task)
+                task.add_done_callback(pending.discard)
+
+            if pending:
+                await asyncio.gather(*pending)
+        except (ConnectionError, asyncio.CancelledError):
+            # client gone, or server closing
+            pass
+        finally:
+            writer.close()
+
+
+# client of a ScoringServer, for use in asyncio code (and tests)
+class Client:
+
+    def __init__(self, reader, writer):
+        self._reader = reader
+        self._writer = writer
+        self._futures = {}
+        self._next_id = 0
+        self._listener = asyncio.ensure_future(self._listen())
+
+    @classmethod
+    async def connect(cls, host = '127.0.0.1', port = 8765, path = None, limit = 2**24):
+        """
+        Connect to a server on a TCP port, or on a Unix socket path
+        """
+        if path is not None:
+            reader, writer = await asyncio.open_unix_connection(path, limit=limit)
+        else:
+            reader, writer = await asyncio.open_connection(host, port, limit=limit)
+        return cls(reader, writer)
+
+    async def request(self, body):
+        """
+        Send a request (a dictionary, its id is set here) and return the body of the response
+        """
+        self._next_id += 1
+        request_id = self._next_id
+        future = asyncio.get_event_loop().create_future()
+        self._futures[request_id] = future
+        self._writer.write(json.dumps(dict(body, id=request_id), default=to_json).encode() + b'\n')
+        await self._writer.drain()
+        return await future
+
+    async def score(self, speed, **params):
+        """
+        Return the summary of one trip: speed trace and the optional vehicle_type, speed_unit and vehicle parameters.
+        Raises ValueError with the message of the server if the request is rejected.
+        """
+        response = await self.request(dict(params, speed=np.asarray(speed, dtype=float).tolist()))
+        if 'error' in response:
+            raise ValueError(response['error'])
+        return response['result']
+
+    async def stats(self):
+        return (await self.request({'op': 'stats'}))['result']
+
+    async def close(self):
+        self._writer.close()
+        self._listener.cancel()
+        await asyncio.gather(self._listener, return_exceptions=True)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    # route the responses to the waiting requests
+    async def _listen(self):
+        error = ConnectionError('connection closed by the server')
+        try:
+            while True:
+                line = await self._reader.readline()
+                if not line:
+                    break
+                response = json.loads(line)
+                future = self._futures.pop(response.get('id'), None)
+                if future is not None and not future.done():
+                    future.set_result(response)
+                elif response.get('id') is None and 'error' in response:
+                    error = ConnectionError(response['error'])
+        finally:
+            for future in self._futures.values():
+                if not future.done():
+                    future.set_exception(error)
+            self._futures.clear()
+
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(prog='python -m pyemission.server', description='PyEmission scoring service')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--path', help='listen on this Unix socket instead of a TCP port')
+    parser.add_argument('--processes', type=int, default=0, help='worker processes evaluating the batches (default: none)')
+    parser.add_argument('--max-batch-size', type=int, default=64)
+    parser.add_argument('--max-batch-delay', type=float, default=0.005, help='seconds')
+    parser.add_argument('--max-pending', type=int, default=1024)
+    parser.add_argument('--max-request-bytes', type=int, default=2**24)
+    args = parser.parse_args(argv)
+
+    server = ScoringServer(args.max_batch_size, args.max_batch_delay, args.max_pending, args.max_request_bytes, args.processes)
+    try:
+        asyncio.run(server.serve_forever(args.host, args.port, args.path))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,182 @@
+import numpy as np
+import pandas as pd
+
+from pyemission.pyemission import Util, rate_tables
+
+
+# running emission estimate for many vehicles fed with 1 Hz speed samples
+class StreamEstimator:
+
+    def __init__(self, mass = 1500, vehicle_type = 'Passenger car', well_to_tank_CO2_emission_factor = 16.79,
+                 model_year_group = None, fuel = None, ambient = None):
+
+        """
+        Keeps, for every vehicle, only the state needed to classify its next second (previous speed and
+        the two previous accelerations) and the running totals. Memory grows with the number of vehicles,
+        not with the length of their trips.
+
+        mass                             (numeric) : default vehicle mass with cargo in kg, for vehicles not added with add_vehicle
+        vehicle_type                     (string)  : default vehicle type, for vehicles not added with add_vehicle
+        well_to_tank_CO2_emission_factor (numeric) : typical value is 16.79 gm/MJ
+        model_year_group,
+        fuel, ambient                    (string)  : default conditions selecting the emission rate table in a rate store
+                                                     (see RateTables.get), for vehicles not added with add_vehicle
+        """
+
+        self.mass = mass
+        self.vehicle_type = vehicle_type
+        self.conditions = (model_year_group, fuel, ambient)
+        self.well_to_tank_CO2_emission_factor = well_to_tank_CO2_emission_factor
+        self.pollutants = list(Util.pollutants)
+
+        self._slots = {}                # vehicle id -> row of the state arrays
+        self._ids = []
+        self._types = []                # (vehicle type, conditions) of the rate tables seen so far
+        self._emission_rate = np.zeros((0, 41, len(self.pollutants)))
+
+        n = 0
+        self._type = np.zeros(n, dtype=np.intp)
+        self._coeff = np.zeros((n, 5))  # M, A, B, C, f
+        self._active = np.zeros(n, dtype=bool)  # False until the first sample of a trip
+        self._speed = np.zeros(n)       # previous speed
+        self._acc_t_1 = np.zeros(n)
+        self._acc_t_2 = np.zeros(n)
+        self._t = np.zeros(n, dtype=np.int64)
+        self._distance = np.zeros(n)
+        self._emission = np.zeros((n, len(self.pollutants)))
+
+
+    def __len__(self):
+        return len(self._ids)
+
+    def __contains__(self, vehicle_id):
+        return vehicle_id in self._slots
+
+
+    def add_vehicle(self, vehicle_id, mass = None, vehicle_type = None, model_year_group = None, fuel = None, ambient = None):
+        """
+        Register a vehicle with its own mass (kg), vehicle type and rate table conditions (model_year_group,
+        fuel and ambient, each defaulting to that of the estimator). Return its slot.
+        """
+        if vehicle_id in self._slots:
+            raise ValueError('vehicle {!r} is already registered'.format(vehicle_id))
+        mass = self.mass if mass is None else mass
+        vehicle_type = self.vehicle_type if vehicle_type is None else vehicle_type
+        conditions = tuple(default if value is None else value
+                           for value, default in zip((model_year_group, fuel, ambient), self.conditions))
+        table = rate_tables.get(vehicle_type, *conditions)
+
+        key = (vehicle_type,) + conditions
+        if key not in self._types:
+            matrix = Util.stack_emission_rates([table], self.pollutants)
+            self._types.append(key)
+            self._emission_rate = np.concatenate([self._emission_rate, matrix])
+
+        slot = len(self._ids)
+        if slot == len(self._type):
+            self._grow(max(16, 2*slot))
+        self._slots[vehicle_id] = slot
+        self._ids.append(vehicle_id)
+        self._type[slot] = self._types.index(key)
+        self._coeff[slot] = (mass/1000,) + tuple(table.vsp_coeff)
+        return slot
+
+    def _grow(self, capacity):
+        for name in ['_type', '_coeff', '_active', '_speed', '_acc_t_1', '_acc_t_2', '_t', '_distance', '_emission']:
+            old = getattr(self, name)
+            new = np.zeros((capacity,) + old.shape[1:], dtype=old.dtype)
+            new[:len(old)] = old
+            setattr(self, name, new)
+
+
+    def end_trip(self, vehicle_id):
+        """
+        Forget the previous speed and accelerations of a vehicle, so that its next sample starts a
+        new trip with zero acceleration. The running totals are kept.
+        """
+        slot = self._slots[vehicle_id]
+        self._active[slot] = False
+        self._acc_t_1[slot] = 0
+        self._acc_t_2[slot] = 0
+
+
+    def update(self, vehicle_ids, speeds):
+        """
+        Add a micro-batch of 1 Hz samples.
+
+        vehicle_ids : id of the vehicle of every sample. Unknown vehicles are added with the default parameters.
+        speeds      : speed of every sample in meter per second. Samples of the same vehicle must be
+                      consecutive seconds in time order.
+        """
+        vehicle_ids = list(vehicle_ids)
+        speeds = np.asarray(speeds, dtype=float)
+        if len(vehicle_ids) != speeds.size:
+            raise ValueError('vehicle_ids and speeds must have the same length')
+        if speeds.size == 0:
+            return
+
+        for vehicle_id in vehicle_ids:
+            if vehicle_id not in self._slots:
+                self.add_vehicle(vehicle_id)
+        slot = np.array([self._slots[vehicle_id] for vehicle_id in vehicle_ids], dtype=np.intp)
+
+        # group the samples by vehicle, keeping their time order
+        order = np.argsort(slot, kind='stable')
+        slot, v = slot[order], speeds[order]
+        first = np.ones(slot.size, dtype=bool)
+        first[1:] = slot[1:] != slot[:-1]
+        start = np.flatnonzero(first)
+        position = np.arange(slot.size) - np.repeat(start, np.diff(np.append(start, slot.size)))
+
+        # acceleration, continuing from the previous speed; the first second of a trip has zero acceleration
+        v_prev = np.empty_like(v)
+        v_prev[1:] = v[:-1]
+        v_prev[first] = self._speed[slot[first]]
+        new_trip = first & ~self._active[slot]
+        v_prev[new_trip] = v[new_trip]
+        acc = v - v_prev
+
+        # acceleration two seconds earlier, taken from the state for the first two samples of every
+        # vehicle (the state of a new trip is zero)
+        second = position == 1
+        acc_t_2 = Util.lag(acc, 2)
+        acc_t_2[first] = self._acc_t_2[slot[first]]
+        acc_t_2[second] = self._acc_t_1[slot[second]]
+
+        M, A, B, C, f = self._coeff[slot].T
+        vsp = Util.calculate_vsp(v, acc, M, A, B, C, f)
+        op_mod = Util.vsp_to_op_mod_array(vsp, v, acc, acc_t_2)
+        emission = self._emission_rate[self._type[slot], op_mod]
+
+        # running totals
+        n_slots = len(self._ids)
+        self._t[:n_slots] += np.bincount(slot, minlength=n_slots)
+        self._distance[:n_slots] += np.bincount(slot, weights=v, minlength=n_slots)
+        for i in range(len(self.pollutants)):
+            self._emission[:n_slots, i] += np.bincount(slot, weights=emission[:, i], minlength=n_slots)
+
+        # state for the next batch
+        last = np.append(start[1:], slot.size) - 1
+        self._active[slot[last]] = True
+        self._speed[slot[last]] = v[last]
+        self._acc_t_2[slot[last]] = np.where(position[last] > 0, acc[last - 1], self._acc_t_1[slot[last]])
+        self._acc_t_1[slot[last]] = acc[last]
+
+
+    def totals(self, decimals = None):
+        """
+        Return the running totals of every vehicle: travel time (s), distance (km), pollutants (grams)
+        and the GV metrics (pump to wheel emissions, fuel burnt, mpg, well to wheel CO2).
+        """
+        n = len(self._ids)
+        distance = self._distance[:n]/1000
+        df = pd.DataFrame({'travel_time': self._t[:n], 'distance': distance},
+                          index=pd.Index(self._ids, name='vehicle_id'))
+        for i, pollutant in enumerate(self.pollutants):
+            df[pollutant] = self._emission[:n, i]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            metrics = Util.emission_metrics(df.CO2.to_numpy(), df.CO.to_numpy(), df.NOx.to_numpy(), df.HC.to_numpy(),
+                                            distance, self.well_to_tank_CO2_emission_factor, decimals)
+        for key, value in metrics.items():
+            df[key] = value
+        return df
@@ -0,0 +1,196 @@
+import numpy as np
+import pandas as pd
+
+from pyemission.pyemission import RateTables, Util, rate_tables
+
+
+# vehicle parameters that can be given per trip as columns of the table
+TRIP_PARAMETERS = ['mass', 'frontal_area', 'mu_rr', 'air_density', 'c_d', 'well_to_tank_CO2_emission_factor']
+
+
+# many trips stored in one long table, evaluated in one vectorized pass
+class Trips:
+
+    def __init__(self,
+                 df,
+                 mass = 1500,
+                 frontal_area = 2.27,
+                 mu_rr = 0.0127,
+                 air_density = 1.18,
+                 c_d = 0.28,
+                 well_to_tank_CO2_emission_factor = 16.79,
+                 vehicle_type = 'Passenger car',
+                 speed_unit = 'meter per second',
+                 group_by = ('vehicle_id', 'trip_id'),
+                 model_year_group = None,
+                 fuel = None,
+                 ambient = None
+                 ):
+
+        """
+        df                               (DataFrame) : one row per second of every trip, with the group_by columns
+                                                       and 'speed'. Optional columns: 'time' (the rows of a trip are
+                                                       sorted by it), 'vehicle_type', 'speed_unit', 'model_year_group',
+                                                       'fuel', 'ambient' and any vehicle parameter below, which then
+                                                       override the arguments per trip
+                                                       (the first row of a trip is used, the others may be empty).
+        group_by                         (list)      : columns identifying a trip
+
+        The other parameters are the defaults of the trips, the same as for GV:
+
+        mass                             (numeric)   : vehicle mass with cargo in kg
+        frontal_area                     (numeric)   : vehicle frontal area in square meter
+        mu_rr                            (numeric)   : rolling resistance coefficient between tire and road surface
+        air_density                      (numeric)   : ambient air density in kg/m3
+        c_d                              (numeric)   : aerodynamic drag coefficient
+        well_to_tank_CO2_emission_factor (numeric)   : typical value is 16.79 gm/MJ
+        vehicle_type                     (string)    : 'Passenger car', 'SUV', 'Passenger truck' or 'Light commercial truck'
+        speed_unit                       (string)    : unit of the speed column
+        model_year_group,
+        fuel, ambient                    (string)    : select the emission rate table among those of the vehicle type in a rate
+                                                       store (see RateTables.get); the defaults of the store when None (or empty)
+
+        Accelerations and their lags restart at zero on the first second of every trip, as in GV.
+        """
+
+        group_by = [group_by] if isinstance(group_by, str) else list(group_by)
+        missing = [c for c in group_by + ['speed'] if c not in df.columns]
+        if missing:
+            raise ValueError('the trip table is missing the column(s): ' + ', '.join(missing))
+        empty = [c for c in group_by if df[c].isna().any()]
+        if empty:
+            raise ValueError('the trip table has rows without a value in the column(s): {} (rows {})'.format(
+                ', '.join(empty), ', '.join(map(str, np.flatnonzero(df[empty].isna().any(axis=1).to_numpy())[:10]))))
+        self.group_by = group_by
+
+        # trip number of every row, in order of first appearance; rows sorted by trip (and time)
+        trip = df.groupby(group_by, sort=False).ngroup().to_numpy()
+        if 'time' in df.columns:
+            order = np.lexsort((df.time.to_numpy(), trip))
+        else:
+            order = np.argsort(trip, kind='stable')
+        self.trip = trip[order]
+        self.n_trips = int(self.trip[-1]) + 1 if self.trip.size else 0
+        self.lengths = np.bincount(self.trip, minlength=self.n_trips)
+        start = np.zeros(self.n_trips, dtype=np.intp)
+        np.cumsum(self.lengths[:-1], out=start[1:])
+        self.position = np.arange(self.trip.size) - start[self.trip]  # second of the row within its trip
+
+        # one row of keys and parameters per trip, taken from its first row
+        first = order[start]
+        self.configs = df[group_by].iloc[first].reset_index(drop=True)
+        defaults = dict(zip(TRIP_PARAMETERS, [mass, frontal_area, mu_rr, air_density, c_d, well_to_tank_CO2_emission_factor]))
+        for name in ['vehicle_type'] + TRIP_PARAMETERS:
+            default = vehicle_type if name == 'vehicle_type' else defaults[name]
+            if name in df.columns:
+                self.configs[name] = df[name].to_numpy()[first]
+            else:
+                self.configs[name] = default
+        # rate table conditions, kept in the configs only when given
+        conditions = dict(zip(RateTables.conditions, [model_year_group, fuel, ambient]))
+        for name in RateTables.conditions:
+            if name in df.columns:
+                self.configs[name] = df[name].to_numpy()[first]
+            elif conditions[name] is not None:
+                self.configs[name] = conditions[name]
+
+        # speed in meter per second; with a speed_unit column, the unit of a trip is that of its first
+        # row (like vehicle_type), so that a sheet with the unit only on its first row reads as one unit
+        speed = df.speed.to_numpy(dtype=float)[order]
+        if 'speed_unit' in df.columns:
+            units = df.speed_unit.to_numpy()[first]
+            Util.check_speed_units(pd.unique(units))
+            speed = speed*pd.Series(units).map(Util.speed_conversion_factor).to_numpy(dtype=float)[self.trip]
+        elif Util.speed_conversion_factor[speed_unit] != 1:
+            speed = speed*Util.speed_conversion_factor[speed_unit]
+        self.speed = speed
+
+        # kinematics within trip boundaries
+        self.acc = Util.calculate_acceleration(speed)
+        self.acc[self.position == 0] = 0
+        self.acc_t_2 = Util.lag(self.acc, 2)
+        self.acc_t_2[self.position < 2] = 0
+
+        # VSP coefficients and emission rate matrix of every trip, loaded once per vehicle type and conditions
+        columns = [self.configs.vehicle_type.to_numpy().astype(str)]
+        for name in RateTables.conditions:
+            values = self.configs[name] if name in self.configs.columns else pd.Series(None, index=self.configs.index, dtype=object)
+            columns.append(values.astype(object).where(values.notna(), None).to_numpy())
+        keys = list(zip(*columns))
+        position = {key: i for i, key in enumerate(dict.fromkeys(keys))}
+        self.type_index = np.array([position[key] for key in keys], dtype=np.intp)
+        tables = [rate_tables.get(*key) for key in position]
+        self.coeff = np.array([table.vsp_coeff for table in tables]).reshape(-1, 4)[self.type_index]
+        self.pollutants = list(Util.pollutants)
+        self.emission_rate = Util.stack_emission_rates(tables, self.pollutants)
+
+
+    def __len__(self):
+        return self.n_trips
+
+
+    # per-second arrays, in the order of the trips --------------------------
+    def tractive_power(self):
+        """
+        Return the tractive power in watt of every row
+        """
+        c = self.configs
+        return Util.calculate_tractive_power(self.speed, self.acc,
+                                             c.mass.to_numpy(dtype=float)[self.trip],
+                                             c.frontal_area.to_numpy(dtype=float)[self.trip],
+                                             c.mu_rr.to_numpy(dtype=float)[self.trip],
+                                             c.air_density.to_numpy(dtype=float)[self.trip],
+                                             c.c_d.to_numpy(dtype=float)[self.trip])
+
+    def vsp(self):
+        """
+        Return the vehicle specific power in kW/ton of every row
+        """
+        A, B, C, f = self.coeff[self.trip].T
+        M = self.configs.mass.to_numpy(dtype=float)[self.trip]/1000  # unit: ton
+        return Util.calculate_vsp(self.speed, self.acc, M, A, B, C, f)
+
+    def op_mod(self):
+        """
+        Return the operating mode of every row
+        """
+        return Util.vsp_to_op_mod_array(self.vsp(), self.speed, self.acc, self.acc_t_2)
+
+
+    # per trip results --------------------------
+    def op_mod_counts(self):
+        """
+        Return the number of seconds spent in each op_mod code, one row per trip
+        """
+        n_codes = self.emission_rate.shape[1]
+        return Util.op_mod_histograms(self.op_mod(), n_codes, self.trip, self.n_trips)
+
+    def emission_totals(self):
+        """
+        Return the total emission of every pollutant in grams, one row per trip
+        """
+        totals = Util.emission_totals_batch(self.op_mod_counts(), self.emission_rate[self.type_index])
+        return pd.DataFrame(totals, columns=self.pollutants, index=self.configs.index)
+
+    def totals(self, decimals = 3):
+        """
+        Return one row per trip with its keys, vehicle parameters, the driving cycle statistics and the
+        GV metrics. With decimals set, the values are rounded the same way as the GV methods.
+        """
+        stats = Util.segment_cycle_statistics(self.speed, self.acc, self.trip, self.n_trips)
+        t = self.lengths
+        d = np.bincount(self.trip, weights=self.speed, minlength=self.n_trips)/1000
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            cycle = pd.DataFrame(Util.cycle_metrics(stats, d, t, decimals), index=self.configs.index)
+            cycle.insert(0, 'travel_time', t)
+
+            emission = self.emission_totals()
+            metrics = Util.emission_metrics(emission.CO2.to_numpy(),
+                                            emission.CO.to_numpy(),
+                                            emission.NOx.to_numpy(),
+                                            emission.HC.to_numpy(),
+                                            d,
+                                            self.configs.well_to_tank_CO2_emission_factor.to_numpy(dtype=float),
+                                            decimals)
+        return pd.concat([self.configs, cycle, pd.DataFrame(metrics, index=self.configs.index)], axis=1)
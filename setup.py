@@ -17,6 +17,7 @@ LICENSE = "Apache-2.0"
 REQUIRED = ["numpy", 
             "pandas", 
             "matplotlib"]
+EXTRAS = {"parquet": ["pyarrow"]}
 
 PACKAGES = find_packages()
 
@@ -36,6 +37,7 @@ setup(
         'Programming Language :: Python :: 3.7'
         ],
     install_requires = REQUIRED,
+    extras_require = EXTRAS,
     packages = PACKAGES,
     include_package_data=True,
     package_data={'': ['*.pkl', '*xlsx']},
@@ -0,0 +1,40 @@
+from pathlib import Path
+
+import pandas as pd
+import pytest
+
+from pyemission.__main__ import main
+from pyemission.batch import SUMMARY_COLUMNS, run_batch
+from pyemission.pyemission import GV
+
+DATA = str(Path(__file__).resolve().parents[1] / 'pyemission' / 'Data.xlsx')
+
+
+def test_rows_match_gv():
+    # the failed trip comes first: the columns do not depend on the order of the trips
+    results = run_batch([{'excel_file_name': DATA, 'sheet_name': 'No such sheet'},
+                         {'excel_file_name': DATA, 'sheet_name': 'Driving cycle', 'mass': 1800}], processes=1)
+    expected = GV(DATA, 'Driving cycle', mass=1800).summary()
+    assert list(results.columns) == ['excel_file_name', 'sheet_name', 'mass'] + SUMMARY_COLUMNS + ['error']
+    assert results.loc[1, list(expected)].tolist() == list(expected.values())
+    assert results.error.isna().tolist() == [False, True]
+
+
+def test_empty_manifest(tmp_path):
+    results = run_batch(pd.DataFrame(columns=['excel_file_name', 'sheet_name', 'mass']))
+    assert results.empty
+    assert list(results.columns) == ['excel_file_name', 'sheet_name', 'mass'] + SUMMARY_COLUMNS + ['error']
+
+    manifest, output = tmp_path / 'manifest.csv', tmp_path / 'results.csv'
+    manifest.write_text('excel_file_name,sheet_name\n')
+    assert main([str(manifest), '-o', str(output)]) == 0
+    assert pd.read_csv(output).empty
+
+
+def test_manifest_without_required_columns(tmp_path):
+    with pytest.raises(ValueError, match='sheet_name'):
+        run_batch([{'excel_file_name': DATA}])
+    manifest = tmp_path / 'manifest.csv'
+    manifest.write_text('')
+    with pytest.raises(SystemExit):
+        main([str(manifest)])
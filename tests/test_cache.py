@@ -0,0 +1,66 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from pyemission.benchmark import synthetic_cycle
+from pyemission.cache import ResultCache
+from pyemission.pyemission import GV
+
+
+def test_hit_and_miss_on_parameter_change(tmp_path):
+    cache = ResultCache(tmp_path)
+    speed = synthetic_cycle(2000, 0)
+    first = GV.from_arrays(speed, cache=cache)
+    second = GV.from_arrays(speed, cache=cache)
+    other = GV.from_arrays(speed, mass=1600, cache=cache)
+    assert (first.cache_hit, second.cache_hit, other.cache_hit) == (False, True, False)
+    assert (cache.hits, cache.misses) == (1, 2)
+
+    assert second.summary() == first.summary()
+    pd.testing.assert_frame_equal(second.df, first.df)
+    np.testing.assert_array_equal(second.op_mod_counts, first.op_mod_counts)
+    assert other.summary() != first.summary()
+
+
+def test_hit_maps_the_per_second_arrays(tmp_path):
+    cache = ResultCache(tmp_path)
+    cache.put('entry', {'column_CO2': np.arange(1000.), 'op_mod_counts': np.arange(41), 'summary': np.array('{}')})
+    mapped = cache.get('entry', mmap_mode='r')
+    assert isinstance(mapped['column_CO2'], np.memmap)
+    assert not isinstance(mapped['summary'], np.memmap)
+    for name, array in cache.get('entry').items():
+        np.testing.assert_array_equal(mapped[name], array)
+
+
+def test_eviction_past_max_bytes(tmp_path):
+    cache = ResultCache(tmp_path, max_bytes=2500000)
+    for i, key in enumerate(['a', 'b']):
+        cache.put(key, {'x': np.zeros(100000)})
+        os.utime(cache.path(key), (1000 + i, 1000 + i))
+    cache.get('a')  # a hit makes 'a' the most recently used
+    cache.put('c', {'x': np.zeros(100000)})
+    assert cache.size()[0] == 3
+    cache.put('d', {'x': np.zeros(100000)})
+    assert sorted(path.stem for path in tmp_path.glob('*.npz')) == ['a', 'c', 'd']
+    assert cache.size()[1] <= cache.max_bytes
+
+
+def test_concurrent_writers(tmp_path):
+    # writers of the same and of different keys, and readers: a read is a miss or a complete entry
+    def write(i):
+        cache = ResultCache(tmp_path)
+        cache.put('shared', {'x': np.full(50000, i % 4, dtype=float)})
+        cache.put('own-{}'.format(i), {'x': np.full(1000, i, dtype=float)})
+        entry = cache.get('shared', mmap_mode='r')
+        return None if entry is None else np.unique(entry['x']).tolist()
+
+    with ThreadPoolExecutor(8) as executor:
+        results = list(executor.map(write, range(32)))
+    assert all(result is None or len(result) == 1 for result in results)
+    cache = ResultCache(tmp_path)
+    assert cache.size()[0] == 33
+    assert not list(tmp_path.glob('*.tmp'))
+    for i in range(32):
+        np.testing.assert_array_equal(cache.get('own-{}'.format(i))['x'], np.full(1000, i, dtype=float))
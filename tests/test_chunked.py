@@ -0,0 +1,22 @@
+import pandas as pd
+import pytest
+
+from pyemission.benchmark import synthetic_cycle
+from pyemission.chunked import ChunkedGV
+from pyemission.pyemission import GV
+
+pytest.importorskip('pyarrow')
+
+
+@pytest.mark.parametrize('compression', ['uncompressed', 'zstd'])
+def test_feather_source_matches_gv(tmp_path, compression):
+    speed = synthetic_cycle(5000)
+    path = tmp_path / 'cycle.feather'
+    pd.DataFrame({'speed': speed, 'speed_unit': 'meter per second', 'vehicle_type': 'SUV'}).to_feather(
+        path, compression=compression, chunksize=700)
+
+    chunked = ChunkedGV(str(path), chunk_size=1000)
+    summary = chunked.run()
+    expected = GV.from_arrays(speed, vehicle_type='SUV').summary()
+    assert summary['distance'] == expected['distance']
+    assert summary['pump_to_wheel_CO2'] == expected['pump_to_wheel_CO2']
@@ -0,0 +1,78 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from pyemission.benchmark import synthetic_cycle
+from pyemission.pyemission import Util
+
+FPS = 3.28084  # feet per second per m/s, as in Util.segment_cycle_statistics
+
+
+# the row loops and pandas expressions of the Car methods before they were vectorized
+def reference(speed, acc):
+    no_of_stops = 0
+    flag = False
+    for v in speed:
+        v_fps = v*3.28084
+        if v_fps >= 15:
+            flag = True
+        if v_fps < 10 and flag == True:
+            no_of_stops += 1
+            flag = False
+    idle_time = 0
+    for v in speed:
+        if v <= 0.1:
+            idle_time += 1
+    acc = pd.Series(acc)
+    return {
+        'no_of_stops'   : no_of_stops,
+        'idle_time'     : idle_time,
+        'acc_time'      : acc[acc > 0].count(),
+        'dec_time'      : acc[acc < 0].count(),
+        'acc_avg'       : acc[acc > 0].mean(),
+        'dec_avg'       : acc[acc < 0].mean(),
+        'speed_std'     : (pd.Series(speed)*3.6).std(),
+        }
+
+
+def random_cycle(rng, n):
+    # speeds around the stop thresholds (10 and 15 fps) and the idle speed, including the exact values
+    levels = np.array([0, 0.1, 10/FPS, 15/FPS, 2.5, 3.5, 4.2, 5, 12])
+    speed = levels[rng.integers(0, len(levels), n)] + rng.choice([0, 0, -1e-9, 1e-9, 0.3], n)
+    return np.maximum(speed, 0)
+
+
+def check(stats, expected, i=None):
+    for key, value in expected.items():
+        actual = stats[key] if i is None else stats[key][i]
+        assert actual == pytest.approx(value, rel=1e-12, nan_ok=True), key
+
+
+@pytest.mark.parametrize('seed', range(4))
+def test_random_cycles_match_the_row_loops(seed):
+    rng = np.random.default_rng(seed)
+    for speed in [random_cycle(rng, 500), synthetic_cycle(2000, seed), random_cycle(rng, 1), random_cycle(rng, 2)]:
+        acc = Util.calculate_acceleration(speed)
+        check(Util.cycle_statistics(speed, acc), reference(speed, acc))
+
+
+@pytest.mark.parametrize('seed', range(3))
+def test_statistics_restart_on_every_trip(seed):
+    # the stop flag and the acceleration restart on the first second of every trip: a trip ending
+    # above 15 fps is followed by one starting below 10 fps without counting a stop
+    rng = np.random.default_rng(seed)
+    speeds = [random_cycle(rng, int(n)) for n in rng.integers(1, 200, 12)]
+    speeds[1] = np.full(5, 20/FPS)
+    speeds[2] = np.full(5, 5/FPS)
+
+    batch = Util.cycle_statistics_batch(speeds)
+    segment_ids = np.repeat(np.arange(len(speeds)), [len(v) for v in speeds])
+    speed = np.concatenate(speeds)
+    acc = np.concatenate([Util.calculate_acceleration(v) for v in speeds])
+    stats = Util.segment_cycle_statistics(speed, acc, segment_ids, len(speeds))
+    for i, v in enumerate(speeds):
+        expected = reference(v, Util.calculate_acceleration(v))
+        check(stats, expected, i)
+        check(batch.iloc[i], {k: expected[k] for k in ['acc_avg', 'dec_avg', 'speed_std']})
+        assert batch.travel_time[i] == len(v)
+    assert stats['no_of_stops'][2] == 0
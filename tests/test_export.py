@@ -0,0 +1,41 @@
+import numpy as np
+import pytest
+
+from pyemission.benchmark import synthetic_cycle
+from pyemission.export import Exporter, read_summaries
+from pyemission.pyemission import GV
+
+ds = pytest.importorskip('pyarrow.dataset')
+
+
+def test_trips_can_be_told_apart_and_joined(tmp_path):
+    cars = {0: GV.from_arrays(synthetic_cycle(600, 0)), 1: GV.from_arrays(synthetic_cycle(900, 1), mass=1800)}
+    with Exporter(tmp_path) as exporter:
+        for trip_id, car in cars.items():
+            exporter.write(car, trip_id, vehicle_id=10 + trip_id)
+    with Exporter(tmp_path) as exporter:
+        exporter.write(cars[0], 'x', vehicle_id=12)
+
+    per_second = ds.dataset(str(tmp_path / 'per_second'), partitioning='hive').to_table(columns=['trip_id', 'vehicle_id', 'vsp']).to_pandas()
+    assert per_second.groupby('trip_id').size().to_dict() == {'0': 600, '1': 900, 'x': 600}
+    assert per_second.groupby('trip_id').vehicle_id.first().to_dict() == {'0': 10, '1': 11, 'x': 12}
+    np.testing.assert_array_equal(per_second[per_second.trip_id == '1'].vsp.to_numpy(), cars[1].df.vsp.to_numpy())
+
+    summary = ds.dataset(str(tmp_path / 'summary'), partitioning='hive').to_table().to_pandas()
+    assert sorted(summary.trip_id) == ['0', '1', 'x']
+    assert summary.travel_time.dtype == np.int64
+    assert summary.vehicle_id.dtype == np.int64
+    row = summary.set_index('trip_id').loc['1']
+    assert row.distance == cars[1].full_summary()['distance']
+    assert row.pump_to_wheel_CO2 == cars[1].full_summary()['pump_to_wheel_CO2']
+
+
+def test_npz(tmp_path):
+    car = GV.from_arrays(synthetic_cycle(600))
+    with Exporter(tmp_path, 'npz') as exporter:
+        path = exporter.write(car, 7, vehicle_id=3)
+    with np.load(path) as data:
+        assert set(data['trip_id']) == {'7'}
+        np.testing.assert_array_equal(data['CO2'], car.df.CO2.to_numpy())
+    summary = read_summaries(tmp_path)
+    assert summary.trip_id.tolist() == ['7'] and summary.vehicle_id.tolist() == [3]
@@ -0,0 +1,35 @@
+import numpy as np
+import pytest
+
+from pyemission.benchmark import synthetic_cycle
+from pyemission.fleet import Fleet
+from pyemission.pyemission import GV
+
+
+@pytest.mark.parametrize('chunk_size', [2**22, 5000])
+def test_every_configuration_matches_gv(chunk_size):
+    speed = synthetic_cycle(2000, 7)
+    mass = [1200, 1500, 1800, 2400]
+    vehicle_type = ['Passenger car', 'SUV', 'Light commercial truck', 'Passenger truck']
+    fleet = Fleet(speed, mass=mass, vehicle_type=vehicle_type, c_d=0.3, well_to_tank_CO2_emission_factor=[16.79, 20, 16.79, 18],
+                  chunk_size=chunk_size)
+    totals = fleet.totals()
+    counts = fleet.op_mod_counts()
+    p_tract = fleet.tractive_power()
+    assert len(fleet) == 4
+
+    for i, config in fleet.configs.iterrows():
+        g = GV.from_arrays(speed, vehicle_type=config.vehicle_type, mass=config.mass, c_d=config.c_d,
+                           well_to_tank_CO2_emission_factor=config.well_to_tank_CO2_emission_factor)
+        expected = g.summary()
+        for key in ['pump_to_wheel_CO2', 'pump_to_wheel_NOx', 'fuel_burnt', 'mpg', 'well_to_wheel_CO2_per_km']:
+            assert totals.loc[i, key] == pytest.approx(expected[key], abs=1e-3), key
+        np.testing.assert_array_equal(counts[i], g.op_mod_counts[:counts.shape[1]])
+        np.testing.assert_allclose(p_tract[i], g.df.p_tract.to_numpy())
+
+
+def test_broadcast_parameters():
+    fleet = Fleet(synthetic_cycle(100), mass=[[1000], [2000]], c_d=[0.25, 0.3, 0.35])
+    assert len(fleet) == 6
+    assert fleet.configs.mass.tolist() == [1000]*3 + [2000]*3
+    assert fleet.configs.c_d.tolist() == [0.25, 0.3, 0.35]*2
@@ -0,0 +1,68 @@
+import numpy as np
+import pytest
+
+from pyemission.benchmark import synthetic_cycle
+from pyemission.pyemission import GV
+
+
+def test_totals_only_adds_no_columns_and_matches_full_mode(monkeypatch):
+    # blocks smaller than the cycle, so that the histogram is summed over several of them
+    monkeypatch.setattr(GV, 'totals_block', 1000)
+    speed = synthetic_cycle(4500, 3)
+    full = GV.from_arrays(speed)
+    totals = GV.from_arrays(speed, totals_only=True)
+    assert list(totals.df.columns) == ['time', 'speed', 'time_unit', 'speed_unit', 'vehicle_type']
+    np.testing.assert_array_equal(totals.op_mod_counts, full.op_mod_counts)
+    assert totals.full_summary() == pytest.approx(full.full_summary())
+    assert GV.from_arrays(speed, totals_only=True, columns=['acc']).df.acc.tolist() == full.df.acc.tolist()
+
+
+def test_summary_is_cached_until_its_inputs_change():
+    g = GV.from_arrays(synthetic_cycle(1000, 4))
+    summary = g.summary()
+    assert g.summary() is summary
+    co2 = summary['pump_to_wheel_CO2']
+
+    # an in-place edit of the df is not seen until clear_summary()
+    g.df['CO2'] *= 2
+    assert g.summary()['pump_to_wheel_CO2'] == co2
+    g.clear_summary()
+    assert g.summary()['pump_to_wheel_CO2'] == pytest.approx(2*co2, abs=1e-3)
+
+    # a new df, or another emission factor, is seen at once
+    g.df = g.df.iloc[:500]
+    g.t = len(g.df)
+    assert g.summary()['average_speed'] == round(g.d/(500/3600), 3)
+    wtw = g.summary()['well_to_pump_CO2']
+    g.well_to_tank_CO2_emission_factor *= 2
+    assert g.summary()['well_to_pump_CO2'] == pytest.approx(2*wtw, abs=1e-3)
+
+
+def test_segment_and_rolling_totals_add_up():
+    g = GV.from_arrays(synthetic_cycle(1000, 5))
+    per_second = g.per_second()
+    summary = g.full_summary()
+
+    # segments sum to the cycle, whatever their order and contiguity
+    ids = np.random.default_rng(0).integers(0, 7, g.t)
+    totals = g.segment_totals(ids)
+    assert totals.travel_time.sum() == g.t
+    assert sorted(totals.index) == list(range(7))
+    np.testing.assert_allclose(totals.drop(columns='travel_time').sum().to_numpy(), per_second.sum().to_numpy())
+    assert totals.CO2.sum() == pytest.approx(summary['pump_to_wheel_CO2'])
+    assert totals.distance.sum() == pytest.approx(summary['distance'])
+
+    # the rolling sum at the end of each fixed window is the total of that window
+    window = 60
+    rolling = g.rolling_totals(window)
+    fixed = g.segment_totals(np.arange(g.t)//window)
+    ends = np.arange(window - 1, g.t, window)
+    np.testing.assert_allclose(rolling.iloc[ends].to_numpy(), fixed.drop(columns='travel_time').iloc[:len(ends)].to_numpy())
+    np.testing.assert_allclose(rolling.iloc[:window].to_numpy(), per_second.iloc[:window].cumsum().to_numpy())
+    np.testing.assert_allclose(g.rolling_totals(1).to_numpy(), per_second.to_numpy())
+
+    for window in [0, -5]:
+        with pytest.raises(ValueError, match='window'):
+            g.rolling_totals(window)
+    with pytest.raises(ValueError, match='one segment per second'):
+        g.segment_totals(ids[:-1])
@@ -0,0 +1,64 @@
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from pyemission.benchmark import check_parity, synthetic_cycle
+from pyemission.pyemission import GV, Util
+
+
+@pytest.mark.parametrize('seed', [0, 1])
+def test_row_loop_matches_vectorized_kinematics(seed):
+    speed = synthetic_cycle(3000, seed)
+    df = pd.DataFrame({'speed': speed})
+    params = dict(mass=1500, frontal_area=2.27, mu_rr=0.0127, air_density=1.18, c_d=0.28)
+    acc, p_tract = Util.reference_kinematics(df, **params)
+
+    np.testing.assert_array_equal(Util.calculate_acceleration(speed), acc)
+    np.testing.assert_allclose(Util.calculate_tractive_power(speed, acc, **params), p_tract, rtol=1e-12, atol=1e-9)
+
+
+def test_gv_matches_row_by_row_reference():
+    result = check_parity(3000)
+    assert result.pop('passed'), result
+
+
+def test_gv_columns_match_reference():
+    g = GV.from_arrays(synthetic_cycle(2000))
+    acc, p_tract = Util.reference_kinematics(g.df, g.m, g.frontal_area, g.mu_rr, g.air_density, g.c_d)
+    np.testing.assert_array_equal(g.df.acc.to_numpy(), acc)
+    np.testing.assert_allclose(g.df.p_tract.to_numpy(), p_tract, rtol=1e-12, atol=1e-9)
+
+
+def reference_columns(g, df):
+    return Util.reference_kinematics(df.reset_index(drop=True), g.m, g.frontal_area, g.mu_rr, g.air_density, g.c_d)
+
+
+def test_data_xlsx_matches_reference():
+    g = GV(str(Path(__file__).resolve().parents[1] / 'pyemission' / 'Data.xlsx'))
+    acc, p_tract = reference_columns(g, g.df)
+    np.testing.assert_array_equal(g.df.acc.to_numpy(), acc)
+    np.testing.assert_allclose(g.df.p_tract.to_numpy(), p_tract, rtol=1e-12, atol=1e-9)
+
+
+def test_unit_converted_speed_matches_reference():
+    speed = synthetic_cycle(1000, 2)
+    g = GV.from_arrays(speed/Util.speed_conversion_factor['kilometer per hour'], speed_unit='kilometer per hour')
+    acc, p_tract = reference_columns(g, pd.DataFrame({'speed': speed}))
+    np.testing.assert_allclose(g.df.speed.to_numpy(), speed, rtol=1e-12)
+    np.testing.assert_allclose(g.df.acc.to_numpy(), acc, rtol=1e-9, atol=1e-12)
+    np.testing.assert_allclose(g.df.p_tract.to_numpy(), p_tract, rtol=1e-9, atol=1e-6)
+
+
+def test_kinematics_restart_on_every_trip():
+    # a gap longer than max_gap splits the record into two trips, each starting with zero acceleration
+    speed = synthetic_cycle(600, 3)
+    time = np.arange(600.)
+    time[250:] += 60
+    g = GV.from_arrays(speed, time=time, resample=True)
+    assert g.trip_start.tolist() == [250]
+    for _, trip in g.df.groupby('trip_id'):
+        acc, p_tract = reference_columns(g, trip)
+        np.testing.assert_array_equal(trip.acc.to_numpy(), acc)
+        np.testing.assert_allclose(trip.p_tract.to_numpy(), p_tract, rtol=1e-12, atol=1e-9)
@@ -0,0 +1,95 @@
+import itertools
+
+import numpy as np
+import pytest
+
+from pyemission.pyemission import Util
+
+MPH = 2.23694  # mph (or mph/s) per m/s (or m/s2), as in Util.mps_to_mph
+
+
+def mph(value):
+    return value/MPH
+
+
+def around(edges, eps=1e-9):
+    return sorted({x + d for x in edges for d in (-eps, 0.0, eps)})
+
+
+def scalar(vsp, speed, acc, acc_1, acc_2):
+    return np.array([Util.vsp_to_op_mod(*args) for args in zip(vsp, speed, acc, acc_1, acc_2)])
+
+
+def check(vsp, speed, acc, acc_1, acc_2):
+    expected = scalar(vsp, speed, acc, acc_1, acc_2)
+    result = Util.vsp_to_op_mod_array(vsp, speed, acc, acc_2)
+    np.testing.assert_array_equal(result, expected)
+    return result
+
+
+def test_speed_and_vsp_bin_edges():
+    # every speed edge (idle at 1 mph, 25 and 50 mph) against every VSP edge, just below, on and just above
+    speeds = [mph(s) for s in around([0, 1, 25, 50])] + [mph(s) for s in [10, 40, 70]]
+    vsps = around(list(Util.op_mod_vsp_edges)) + [-20.0, 50.0]
+    grid = np.array(list(itertools.product(speeds, vsps)))
+    zero = np.zeros(len(grid))
+    result = check(grid[:, 1], grid[:, 0], zero, zero, zero)
+    assert set(result) == {1, 11, 12, 13, 14, 15, 16, 21, 22, 23, 24, 25, 27, 28, 29, 30, 33, 35, 37, 38, 39, 40}
+
+
+def test_idle_below_1_mph():
+    speed = np.array([0.0, mph(0.5), mph(1 - 1e-9), mph(1 + 1e-9)])
+    zero = np.zeros(len(speed))
+    result = check(np.array([-5.0, 0.0, 5.0, 5.0]), speed, zero, zero, zero)
+    np.testing.assert_array_equal(result, [1, 1, 1, 13])
+
+
+def test_braking_at_minus_2_mph_per_second():
+    acc = np.array([mph(-2 - 1e-9), mph(-2), mph(-2 + 1e-9), mph(-5)])
+    speed = np.full(len(acc), mph(30))
+    zero = np.zeros(len(acc))
+    result = check(np.full(len(acc), 5.0), speed, acc, zero, zero)
+    np.testing.assert_array_equal(result, [0, 0, 23, 0])
+
+
+def test_braking_over_three_seconds():
+    # acc_t <= -1 mph/s for every combination of the lagged accelerations around the thresholds
+    values = [0.0, mph(-1 + 1e-9), mph(-1), mph(-1.5), -1.0 + 1e-9, -1.0, -1.5]
+    grid = np.array(list(itertools.product([mph(-1), mph(-1.5), mph(-0.5)], values, values)))
+    n = len(grid)
+    check(np.full(n, 5.0), np.full(n, mph(30)), grid[:, 0], grid[:, 1], grid[:, 2])
+
+
+def test_three_second_rule_as_implemented():
+    # The scalar code overwrites acc_t_1 with the converted acc_t_2 and compares acc_t_2 unconverted,
+    # so the rule that runs is: acc_t <= -1 mph/s and acc_t_2 <= -1 m/s2 (about -2.24 mph/s), whatever
+    # acc_t_1. vsp_to_op_mod_array keeps this on purpose, for the results to match the published
+    # version, and takes no acc_t_1; change both and this test together.
+    n = 3
+    speed, vsp = np.full(n, mph(30)), np.full(n, 5.0)
+    acc = np.full(n, mph(-1.5))
+    # three seconds at -1.5 mph/s: not braking, acc_t_2 is above -1 m/s2
+    np.testing.assert_array_equal(check(vsp, speed, acc, acc, acc), [23, 23, 23])
+    # acc_t_1 is ignored: braking with acc_t_1 = 0 when acc_t_2 <= -1 m/s2 ...
+    np.testing.assert_array_equal(check(vsp, speed, acc, np.zeros(n), np.full(n, -1.0)), [0, 0, 0])
+    # ... and acc_t_2 is compared in m/s2, not in mph/s
+    np.testing.assert_array_equal(check(vsp, speed, acc, acc, np.full(n, -1.0 + 1e-9)), [23, 23, 23])
+
+
+def test_lagged_accelerations_default_to_acc_t():
+    acc = np.array([0.0, -0.5, -1.2, -1.1, -1.3, 0.4, -1.0, -1.0, -1.0])
+    speed = 10 + np.cumsum(acc)
+    vsp = np.linspace(-5, 25, len(acc))
+    expected = Util.vsp_to_op_mod_array(vsp, speed, acc, Util.lag(acc, 2))
+    np.testing.assert_array_equal(Util.vsp_to_op_mod_array(vsp, speed, acc), expected)
+    check(vsp, speed, acc, Util.lag(acc, 1), Util.lag(acc, 2))
+
+
+@pytest.mark.parametrize('seed', [0, 1])
+def test_random_cycle(seed):
+    rng = np.random.default_rng(seed)
+    n = 5000
+    acc = rng.normal(0, 1, n)
+    speed = np.abs(rng.normal(15, 10, n))
+    vsp = rng.normal(8, 12, n)
+    check(vsp, speed, acc, Util.lag(acc, 1), Util.lag(acc, 2))
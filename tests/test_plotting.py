@@ -0,0 +1,36 @@
+from pathlib import Path
+
+import pytest
+
+from pyemission.plotting import render_batch
+
+DATA = str(Path(__file__).resolve().parents[1] / 'pyemission' / 'Data.xlsx')
+
+
+def test_rows_of_the_same_sheet_get_their_own_figures(tmp_path):
+    manifest = [{'excel_file_name': DATA, 'sheet_name': 'Driving cycle', 'mass': 1500},
+                {'excel_file_name': DATA, 'sheet_name': 'Driving cycle', 'mass': 2500}]
+    results = render_batch(manifest, tmp_path, processes=1, dpi=20)
+    assert results.error.isna().all()
+    paths = results.driving_cycle.tolist() + results.tractive_power.tolist()
+    assert len(set(paths)) == 4
+    assert all(Path(path).is_file() for path in paths)
+
+
+def test_duplicate_names_are_refused(tmp_path):
+    manifest = [{'excel_file_name': DATA, 'sheet_name': 'Driving cycle', 'name': 'a'},
+                {'excel_file_name': DATA, 'sheet_name': 'Driving cycle', 'name': 'a'}]
+    with pytest.raises(ValueError, match='a'):
+        render_batch(manifest, tmp_path, processes=1)
+
+
+def test_tractive_power_without_the_p_tract_column(tmp_path):
+    from pyemission.benchmark import synthetic_cycle
+    from pyemission.pyemission import GV
+
+    speed = synthetic_cycle(600)
+    car = GV.from_arrays(speed, columns=['acc', 'vsp'])
+    assert 'p_tract' not in car.df.columns
+    car.plot_tractive_power(output=str(tmp_path / 'p.png'), dpi=20)
+    assert (tmp_path / 'p.png').is_file()
+    assert (car._tractive_power() == GV.from_arrays(speed).df.p_tract.to_numpy()).all()
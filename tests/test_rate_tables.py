@@ -0,0 +1,79 @@
+import pickle
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+import pyemission.pyemission as pyemission
+from pyemission.pyemission import RateTables, Util
+
+
+def test_emission_rate_matrix_layout():
+    df = pd.DataFrame({'extra': [7.0, 8.0, 9.0], 'HC': [0.1, 0.2, 0.3], 'CO2': [1.0, 2.0, 3.0], 'other': [4.0, 5.0, 6.0]},
+                      index=pd.Index([0, 11, 40], name='op_mode'))
+    pollutants, matrix = Util.emission_rate_matrix(df)
+
+    # the known pollutants in the order of Util.pollutants, then the other columns in table order
+    assert pollutants == ['CO2', 'HC', 'extra', 'other']
+    assert matrix.shape == (41, 4)
+    np.testing.assert_array_equal(matrix[[0, 11, 40]], df[pollutants].to_numpy())
+    # NaN rows for the op_mod codes without rates
+    unused = np.setdiff1d(np.arange(41), [0, 11, 40])
+    assert np.isnan(matrix[unused]).all()
+
+    # an explicit pollutant order, and codes above 40 extend the matrix
+    df.index = pd.Index([0, 11, 45], name='op_mode')
+    pollutants, matrix = Util.emission_rate_matrix(df, ['other', 'CO2'])
+    assert pollutants == ['other', 'CO2'] and matrix.shape == (46, 2)
+    np.testing.assert_array_equal(matrix[45], [6.0, 3.0])
+
+
+def test_db_path_resolution(tmp_path, monkeypatch):
+    package_db = Path(pyemission.__file__).resolve().parent / 'db.pkl'
+    monkeypatch.chdir(tmp_path)
+    assert RateTables().db_path() == package_db
+
+    # a db.pkl of the working directory comes first, and the path is resolved once
+    shutil.copy(str(package_db), 'db.pkl')
+    tables = RateTables()
+    assert tables.db_path() == tmp_path / 'db.pkl'
+    monkeypatch.chdir(package_db.parent)
+    assert tables.db_path() == tmp_path / 'db.pkl'
+    assert tables.version() == RateTables(package_db).version()
+
+
+def test_warm_up_and_concurrent_get(monkeypatch):
+    loads = []
+    load = pickle.load
+    monkeypatch.setattr(pickle, 'load', lambda file: loads.append(1) or load(file))
+
+    tables = RateTables()
+    with ThreadPoolExecutor(8) as executor:
+        results = list(executor.map(tables.get, RateTables.vehicle_types*8))
+    assert len(loads) == 1
+    # one RateTable per vehicle type, the types reading the same table of db.pkl share its matrix
+    for vehicle_type, table in zip(RateTables.vehicle_types*8, results):
+        assert table is tables.get(vehicle_type)
+    assert tables.get('SUV').emission_rate is tables.get('Passenger car').emission_rate
+    assert tables.get('SUV').vsp_coeff != tables.get('Passenger car').vsp_coeff
+    assert not tables.get('SUV').emission_rate.flags.writeable
+
+    tables.clear()
+    tables.warm_up(['SUV'])
+    assert len(loads) == 2 and list(tables._tables) == ['SUV']
+
+
+def test_use_switches_the_database(tmp_path):
+    tables = RateTables()
+    table = tables.get('SUV')
+    with open(tables.db_path(), 'rb') as file:
+        db = pickle.load(file)
+    db = (db[0], db[1]*2) + tuple(db[2:])
+    with open(tmp_path / 'db.pkl', 'wb') as file:
+        pickle.dump(db, file)
+
+    tables.use(tmp_path / 'db.pkl')
+    np.testing.assert_array_equal(tables.get('SUV').emission_rate, 2*table.emission_rate)
+    assert tables.version() != RateTables(Path(pyemission.__file__).resolve().parent / 'db.pkl').version()
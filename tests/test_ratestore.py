@@ -0,0 +1,94 @@
+import json
+import pickle
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from pyemission.benchmark import synthetic_cycle
+from pyemission.chunked import ChunkedGV
+from pyemission.fleet import Fleet
+from pyemission.pyemission import GV, rate_tables
+from pyemission.ratestore import DEFAULTS, RateStore
+from pyemission.sensitivity import Sensitivity
+from pyemission.stream import StreamEstimator
+from pyemission.trips import Trips
+
+DB = Path(__file__).resolve().parents[1] / 'pyemission' / 'db.pkl'
+
+
+@pytest.fixture
+def db():
+    with open(DB, 'rb') as file:
+        return pickle.load(file)
+
+
+@pytest.fixture
+def store(tmp_path, db):
+    # the tables of db.pkl, and a second model year group of passenger cars with twice the rates
+    default = ('all', 'gasoline', 'standard')
+    tables = {('Passenger car',) + default: db[1],
+              ('Passenger car', '2010', 'gasoline', 'standard'): db[1]*2,
+              ('Light commercial truck',) + default: db[0]}
+    yield RateStore.build(tmp_path / 'store', tables)
+    rate_tables.use(None)
+
+
+def test_build_shares_tables_and_fills_defaults(tmp_path, db):
+    tables = {('Passenger car', 'all', 'gasoline', 'standard'): db[1], ('SUV', 'all', 'gasoline', 'standard'): db[1]}
+    store = RateStore.build(tmp_path, tables)
+    assert store._rates.shape[0] == 1
+    assert store.key('SUV') == ('SUV', 'all', 'gasoline', 'standard')
+    df = store.df_emission_rate('SUV')
+    pd.testing.assert_frame_equal(df, db[1][df.columns].astype(float), check_names=False, check_index_type=False)
+
+
+def test_convert_matches_db(tmp_path):
+    store = RateStore.convert(DB, tmp_path)
+    assert sorted(key[0] for key in store.keys()) == sorted(rate_tables.vehicle_types)
+    speed = synthetic_cycle(1500, 0)
+    expected = GV.from_arrays(speed, vehicle_type='Light commercial truck').full_summary()
+    rate_tables.use(str(tmp_path))
+    try:
+        assert GV.from_arrays(speed, vehicle_type='Light commercial truck').full_summary() == pytest.approx(expected)
+    finally:
+        rate_tables.use(None)
+
+
+def test_other_format_is_refused(store):
+    index = json.loads((store.directory / 'index.json').read_text())
+    index['format'] = 99
+    (store.directory / 'index.json').write_text(json.dumps(index))
+    with pytest.raises(ValueError, match='format 99'):
+        RateStore(store.directory)
+
+
+def test_unknown_key(store):
+    with pytest.raises(ValueError, match='No emission rate table'):
+        store.emission_rate('Passenger car', model_year_group='1990')
+    with pytest.raises(ValueError, match='need a rate store'):
+        rate_tables.get('Passenger car', model_year_group='2010')
+
+
+def test_conditions_select_the_table_in_every_estimator(store):
+    speed = synthetic_cycle(1200, 1)
+    rate_tables.use(str(store.directory))
+    co2 = GV.from_arrays(speed).full_summary()['pump_to_wheel_CO2']
+    g = GV.from_arrays(speed, model_year_group='2010')
+    assert g.full_summary()['pump_to_wheel_CO2'] == pytest.approx(2*co2)
+    expected = g.full_summary()['pump_to_wheel_CO2']
+
+    assert Fleet(speed, model_year_group='2010').totals(None).pump_to_wheel_CO2[0] == pytest.approx(expected)
+    assert Sensitivity(speed, model_year_group='2010').evaluate({'mass': [1500]}).pump_to_wheel_CO2[0] == pytest.approx(expected)
+    assert ChunkedGV(speed, chunk_size=500, model_year_group='2010').run()['pump_to_wheel_CO2'] == pytest.approx(expected, abs=1e-3)
+
+    df = pd.DataFrame({'trip_id': np.repeat([0, 1], speed.size), 'speed': np.tile(speed, 2),
+                       'model_year_group': np.repeat(['2010', None], speed.size)})
+    totals = Trips(df, group_by='trip_id').totals(None)
+    assert totals.pump_to_wheel_CO2.tolist() == pytest.approx([expected, co2])
+
+    stream = StreamEstimator(model_year_group='2010')
+    stream.add_vehicle('old', model_year_group='all')
+    stream.update(['new']*speed.size + ['old']*speed.size, np.concatenate([speed, speed]))
+    assert stream.totals().pump_to_wheel_CO2.tolist() == pytest.approx([co2, expected])
@@ -0,0 +1,19 @@
+import numpy as np
+import pytest
+
+from pyemission.benchmark import synthetic_cycle
+from pyemission.pyemission import GV
+
+
+def test_plain_npy_speed_array(tmp_path):
+    speed = synthetic_cycle(600)
+    np.save(tmp_path / 'speed.npy', speed)
+    g = GV(str(tmp_path / 'speed.npy'), None, vehicle_type='SUV', speed_unit='meter per second')
+    assert g.metadata['vehicle_type'] == 'SUV'
+    assert g.summary() == GV.from_arrays(speed, vehicle_type='SUV').summary()
+
+
+def test_plain_npy_needs_the_vehicle_type(tmp_path):
+    np.save(tmp_path / 'speed.npy', synthetic_cycle(600))
+    with pytest.raises(ValueError, match='vehicle_type'):
+        GV(str(tmp_path / 'speed.npy'), None, speed_unit='meter per second')
@@ -0,0 +1,60 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from pyemission.benchmark import synthetic_cycle
+from pyemission.pyemission import GV, Util
+
+
+def frame(time, speed):
+    return pd.DataFrame({'time': time, 'speed': speed, 'time_unit': 'second', 'speed_unit': 'meter per second',
+                         'vehicle_type': 'Passenger car'})
+
+
+def test_identity_on_1hz_input():
+    speed = synthetic_cycle(500, 0)
+    out, report = Util.resample_1hz(frame(np.arange(500), speed))
+    np.testing.assert_array_equal(out.time.to_numpy(), np.arange(500))
+    np.testing.assert_array_equal(out.speed.to_numpy(), speed)
+    assert (out.trip_id == 0).all()
+    assert report == {'input_samples': 500, 'invalid_dropped': 0, 'duplicates_dropped': 0, 'off_grid_samples': 0,
+                      'output_seconds': 500, 'filled_seconds': 0, 'trips': 1, 'gaps_split': 0, 'short_trips_dropped': 0}
+    assert GV.from_arrays(speed, resample=True).summary() == GV.from_arrays(speed).summary()
+
+
+def test_10hz_decimation():
+    time = np.arange(600)/10
+    out, report = Util.resample_1hz(frame(time, 2 + np.sin(time)))
+    np.testing.assert_array_equal(out.time.to_numpy(), np.arange(60))
+    np.testing.assert_allclose(out.speed.to_numpy(), 2 + np.sin(np.arange(60)))
+    assert (report['output_seconds'], report['off_grid_samples'], report['filled_seconds']) == (60, 540, 0)
+
+
+def test_gaps_are_filled_or_split():
+    # a 6 s gap is interpolated over, a 50 s gap (longer than max_gap) splits the record
+    time = np.concatenate([np.arange(0, 50), np.arange(55, 100), np.arange(150, 200)])
+    speed = np.linspace(0, 20, time.size)
+    out, report = Util.resample_1hz(frame(time, speed), max_gap=10)
+    assert out.trip_id.tolist() == [0]*100 + [1]*50
+    np.testing.assert_array_equal(out.time.to_numpy(), np.concatenate([np.arange(100), np.arange(150, 200)]))
+    np.testing.assert_allclose(out.speed.to_numpy()[50:55], np.interp(np.arange(50, 55), time, speed))
+    assert (report['trips'], report['gaps_split'], report['filled_seconds']) == (2, 1, 5)
+
+    g = GV.from_arrays(speed, time=time, resample=True)
+    assert g.trip_start.tolist() == [100]
+    assert g.df.acc[100] == 0
+
+
+def test_duplicate_and_invalid_rows_are_dropped():
+    time = [0, 1, 1, 2, np.nan, 3, 4, 4, 5]
+    speed = [1, 2, 9, 3, 7, np.nan, 5, 9, 6]
+    out, report = Util.resample_1hz(frame(time, speed))
+    # the first row of a duplicated time is kept; the missing second 3 is interpolated
+    assert out.speed.tolist() == [1, 2, 3, 4, 5, 6]
+    assert (report['input_samples'], report['invalid_dropped'], report['duplicates_dropped']) == (9, 2, 2)
+    assert report['filled_seconds'] == 1
+
+
+def test_no_whole_second():
+    with pytest.raises(ValueError, match='no valid samples'):
+        Util.resample_1hz(frame([0.2, 0.4, 0.6], [1, 2, 3]))
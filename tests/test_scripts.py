@@ -0,0 +1,31 @@
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+PACKAGE = Path(__file__).resolve().parents[1] / 'pyemission'
+
+
+# run python inside the package folder, the way the repo documents its scripts
+def run(*args):
+    env = dict(os.environ, MPLBACKEND='Agg')
+    env.pop('PYTHONPATH', None)
+    return subprocess.run([sys.executable] + list(args), cwd=str(PACKAGE), env=env,
+                          stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True, timeout=300)
+
+
+def test_import_from_the_package_folder():
+    result = run('-c', "import pyemission; g = pyemission.GV('Data.xlsx', 'Driving cycle', verbose=True); print(g.distance())")
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.strip().endswith('23.194')
+
+
+def test_example_script():
+    result = run('example.py')
+    assert result.returncode == 0, result.stderr
+    assert 'Fuel burnt' in result.stdout
+
+
+def test_module_script():
+    result = run('pyemission.py')
+    assert result.returncode == 0, result.stderr
@@ -0,0 +1,14 @@
+import numpy as np
+
+from pyemission.benchmark import synthetic_cycle
+from pyemission.pyemission import GV
+from pyemission.sensitivity import Sensitivity
+
+
+def test_op_mod_counts_match_gv():
+    speed = synthetic_cycle(3000)
+    sensitivity = Sensitivity(speed)
+    counts = sensitivity.op_mod_counts([1300, 1500, 1800])
+    for row, mass in zip(counts, [1300, 1500, 1800]):
+        op_mod = GV.from_arrays(speed, mass=mass).df.op_mod.to_numpy(dtype=int)
+        np.testing.assert_array_equal(row, np.bincount(op_mod, minlength=len(row)))
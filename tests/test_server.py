@@ -0,0 +1,39 @@
+import asyncio
+import json
+
+from pyemission import server
+from pyemission.benchmark import synthetic_cycle
+from pyemission.server import Client, ScoringServer
+
+
+def test_scores_match_the_batch_function():
+    speed = synthetic_cycle(600).tolist()
+
+    async def run():
+        async with ScoringServer(max_batch_delay=0.05) as scoring:
+            async with await Client.connect(*scoring.address) as client:
+                return await asyncio.gather(*[client.score(speed, mass=mass) for mass in [1300, 1500, 1800]])
+
+    results = asyncio.run(run())
+    expected = server.score_batch([{'speed': speed, 'mass': mass} for mass in [1300, 1500, 1800]])
+    assert results == [response['result'] for response in expected]
+
+
+def test_every_request_gets_its_own_error_when_the_backend_fails(monkeypatch):
+    def fail(requests):
+        raise RuntimeError('backend down')
+    monkeypatch.setattr(server, 'score_batch', fail)
+
+    async def run():
+        async with ScoringServer(max_batch_delay=0.05) as scoring:
+            reader, writer = await asyncio.open_connection(*scoring.address)
+            for i in range(20):
+                writer.write(json.dumps({'id': i, 'speed': [0, 1, 2]}).encode() + b'\n')
+            await writer.drain()
+            responses = [json.loads(await reader.readline()) for _ in range(20)]
+            writer.close()
+            return responses
+
+    responses = asyncio.run(run())
+    assert sorted(response['id'] for response in responses) == list(range(20))
+    assert all(response['error'] == 'RuntimeError: backend down' for response in responses)
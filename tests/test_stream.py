@@ -0,0 +1,61 @@
+import numpy as np
+import pytest
+
+from pyemission.benchmark import synthetic_cycle
+from pyemission.pyemission import GV
+from pyemission.stream import StreamEstimator
+
+COLUMNS = ['distance', 'pump_to_wheel_CO2', 'pump_to_wheel_CO', 'pump_to_wheel_NOx', 'pump_to_wheel_HC', 'fuel_burnt',
+           'mpg', 'well_to_wheel_CO2']
+
+
+def stream(estimator, trips, rng):
+    # the samples of every trip in time order, interleaved with the other trips in random batches
+    vehicle = np.concatenate([np.full(len(speed), i) for i, speed in enumerate(trips)])
+    rng.shuffle(vehicle)
+    position = np.zeros(len(trips), dtype=int)
+    ids, speeds = [], []
+    for i in vehicle:
+        ids.append(i)
+        speeds.append(trips[i][position[i]])
+        position[i] += 1
+    cuts = np.sort(rng.choice(np.arange(1, len(ids)), 40, replace=False))
+    for batch_ids, batch_speeds in zip(np.split(np.array(ids), cuts), np.split(np.array(speeds), cuts)):
+        estimator.update(batch_ids.tolist(), batch_speeds)
+
+
+@pytest.mark.parametrize('seed', [0, 1])
+def test_interleaved_batches_match_gv(seed):
+    rng = np.random.default_rng(seed)
+    # more vehicles than the first capacity of the state arrays, so that they grow
+    trips = [synthetic_cycle(int(n), s) for s, n in enumerate(rng.integers(50, 400, 20))]
+    types = ['Passenger car', 'Light commercial truck']
+    estimator = StreamEstimator()
+    for i in range(len(trips)):
+        estimator.add_vehicle(i, mass=1200 + 50*i, vehicle_type=types[i % 2])
+    stream(estimator, trips, rng)
+
+    totals = estimator.totals(decimals=3)
+    assert len(estimator) == len(trips)
+    for i, speed in enumerate(trips):
+        expected = GV.from_arrays(speed, vehicle_type=types[i % 2], mass=1200 + 50*i).summary()
+        assert totals.loc[i, 'travel_time'] == len(speed)
+        assert totals.loc[i, COLUMNS].tolist() == pytest.approx([expected[c] for c in COLUMNS], abs=2e-3)
+
+
+def test_end_trip_restarts_the_acceleration():
+    first, second = synthetic_cycle(300, 5), synthetic_cycle(200, 6) + 3
+    estimator = StreamEstimator()
+    estimator.update(['a']*len(first), first)
+    estimator.end_trip('a')
+    estimator.update(['a']*len(second), second)
+
+    # the two trips add up, each starting with zero acceleration
+    summaries = [GV.from_arrays(speed).full_summary() for speed in (first, second)]
+    totals = estimator.totals()
+    assert totals.loc['a', 'travel_time'] == len(first) + len(second)
+    assert totals.loc['a', 'pump_to_wheel_CO2'] == pytest.approx(sum(s['pump_to_wheel_CO2'] for s in summaries))
+    assert 'a' in estimator and 'b' not in estimator
+
+    with pytest.raises(ValueError, match='already registered'):
+        estimator.add_vehicle('a')
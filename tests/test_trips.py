@@ -0,0 +1,33 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from pyemission.benchmark import synthetic_cycle
+from pyemission.pyemission import GV
+from pyemission.trips import Trips
+
+
+def test_totals_match_gv():
+    speeds = [synthetic_cycle(600, 0), synthetic_cycle(900, 1)]
+    df = pd.concat([pd.DataFrame({'vehicle_id': 1, 'trip_id': i, 'speed': v}) for i, v in enumerate(speeds)])
+    totals = Trips(df).totals()
+    for i, speed in enumerate(speeds):
+        expected = GV.from_arrays(speed).summary()
+        assert totals.loc[i, 'pump_to_wheel_CO2'] == expected['pump_to_wheel_CO2']
+
+
+def test_missing_trip_keys_are_reported():
+    df = pd.DataFrame({'vehicle_id': [1, 1, 1, 1], 'trip_id': [0, 0, np.nan, np.nan], 'speed': [0, 1, 2, 3]})
+    with pytest.raises(ValueError, match='trip_id.*rows 2, 3'):
+        Trips(df)
+
+
+def test_speed_unit_of_the_first_row_of_each_trip():
+    # sheet layout: the unit is only filled on the first row of a trip
+    speed = synthetic_cycle(300, 2)
+    df = pd.concat([pd.DataFrame({'trip_id': 0, 'speed': speed*3.6, 'speed_unit': 'kilometer per hour'}),
+                    pd.DataFrame({'trip_id': 1, 'speed': speed, 'speed_unit': 'meter per second'})])
+    df.loc[df.index > 0, 'speed_unit'] = np.nan
+    totals = Trips(df, group_by='trip_id').totals()
+    expected = GV.from_arrays(speed).summary()['pump_to_wheel_CO2']
+    assert totals.pump_to_wheel_CO2.tolist() == pytest.approx([expected, expected])